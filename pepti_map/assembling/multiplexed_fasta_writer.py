@@ -0,0 +1,127 @@
+from collections import OrderedDict
+import os
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, List, Set, TextIO, Tuple
+
+import numpy as np
+
+DEFAULT_MAX_OPEN_FILES = 256
+
+
+class MultiplexedFastaWriter:
+    """
+    Writes sequences to many FASTA files at once, while keeping at most
+    `max_open_files` of them open. The least recently written file is closed
+    when another one needs to be opened, and reopened for appending later.
+    Each file is first written to a temporary file next to it, which is only
+    moved into place by `close`, so that incomplete files are never mistaken
+    for complete ones.
+    """
+
+    def __init__(
+        self, filepaths: List[Path], max_open_files: int = DEFAULT_MAX_OPEN_FILES
+    ):
+        self._filepaths: List[Path] = filepaths
+        self._max_open_files: int = max(max_open_files, 1)
+        self._open_files: "OrderedDict[int, TextIO]" = OrderedDict()
+        self._created_files: Set[int] = set()
+
+    @staticmethod
+    def _get_temp_filepath(filepath: Path) -> Path:
+        return filepath.with_name(filepath.name + ".tmp")
+
+    def _get_file(self, file_index: int) -> TextIO:
+        fasta_file = self._open_files.get(file_index)
+        if fasta_file is not None:
+            self._open_files.move_to_end(file_index)
+            return fasta_file
+        if len(self._open_files) >= self._max_open_files:
+            _, least_recent_file = self._open_files.popitem(last=False)
+            least_recent_file.close()
+        temp_filepath = MultiplexedFastaWriter._get_temp_filepath(
+            self._filepaths[file_index]
+        )
+        if file_index in self._created_files:
+            fasta_file = open(temp_filepath, "at", encoding="utf-8")
+        else:
+            # Overwrites leftovers of an interrupted run
+            temp_filepath.parent.mkdir(parents=True, exist_ok=True)
+            fasta_file = open(temp_filepath, "wt", encoding="utf-8")
+            self._created_files.add(file_index)
+        self._open_files[file_index] = fasta_file
+        return fasta_file
+
+    def write(self, file_indexes: Iterable[int], sequence_id: str, sequence: str):
+        entry = f">{sequence_id}\n{sequence}\n"
+        for file_index in file_indexes:
+            self._get_file(file_index).write(entry)
+
+    def close(self) -> None:
+        """
+        Closes all files and moves them into place. Files to which nothing
+        was written are created empty.
+        """
+        for fasta_file in self._open_files.values():
+            fasta_file.close()
+        self._open_files.clear()
+        for file_index, filepath in enumerate(self._filepaths):
+            temp_filepath = MultiplexedFastaWriter._get_temp_filepath(filepath)
+            if file_index not in self._created_files:
+                temp_filepath.parent.mkdir(parents=True, exist_ok=True)
+                temp_filepath.touch()
+            os.replace(temp_filepath, filepath)
+
+    def __enter__(self) -> "MultiplexedFastaWriter":
+        return self
+
+    def __exit__(self, exception_type, *_) -> None:
+        if exception_type is None:
+            self.close()
+            return
+        for fasta_file in self._open_files.values():
+            fasta_file.close()
+        self._open_files.clear()
+
+
+def write_read_sets_to_fasta_files(
+    read_sets: List[Set[int]],
+    filepaths: List[Path],
+    iter_reads: Callable[[List[int]], Iterator[Tuple[int, str]]],
+    max_open_files: int = DEFAULT_MAX_OPEN_FILES,
+) -> None:
+    """
+    Writes the reads of each set to the FASTA file at the same index.
+    All reads are retrieved at once, so that each read is only retrieved once,
+    even if it is contained in several sets, and then written to all of them.
+    :param Callable[[List[int]], Iterator[Tuple[int, str]]] iter_reads:
+    Yields (read_id, sequence) for all reads with the given ids in any order,
+    e.g. `IReadStore.iter_read_sequences_for_ids`.
+    """
+    number_of_entries = sum(len(read_set) for read_set in read_sets)
+    read_ids = np.fromiter(
+        (read_id for read_set in read_sets for read_id in read_set),
+        dtype=np.uint64,
+        count=number_of_entries,
+    )
+    set_indexes = np.repeat(
+        np.arange(len(read_sets), dtype=np.int64),
+        [len(read_set) for read_set in read_sets],
+    )
+    # The set indexes of each distinct read, which are stored consecutively
+    order = np.argsort(read_ids, kind="stable")
+    set_indexes = set_indexes[order]
+    distinct_read_ids, first_entries = np.unique(read_ids[order], return_index=True)
+    end_entries = np.append(first_entries[1:], number_of_entries)
+    entry_ranges = {
+        read_id: (first_entry, end_entry)
+        for read_id, first_entry, end_entry in zip(
+            distinct_read_ids.tolist(), first_entries.tolist(), end_entries.tolist()
+        )
+    }
+
+    with MultiplexedFastaWriter(filepaths, max_open_files) as fasta_writer:
+        for read_id, sequence in iter_reads(distinct_read_ids.tolist()):
+            first_entry, end_entry = entry_ranges[read_id]
+            fasta_writer.write(
+                set_indexes[first_entry:end_entry].tolist(), str(read_id), sequence
+            )
@@ -1,4 +1,10 @@
+import pytest
+
 from pepti_map.assembling.assembly_helper import AssemblyHelper
+from pepti_map.assembling.multiplexed_fasta_writer import (
+    MultiplexedFastaWriter,
+    write_read_sets_to_fasta_files,
+)
 
 
 class TestAssemblyInputGenerator:
@@ -56,3 +62,48 @@ class TestAssemblyInputGenerator:
             assert [
                 line.strip() for line in fasta_file.readlines()
             ] == expected_file_content
+
+
+class TestMultiplexedFastaWriter:
+    @pytest.mark.parametrize("max_open_files", [1, 2, 10])
+    def test_write_read_sets(self, tmp_path, max_open_files):
+        sequences = {
+            read_id: "ACGT"[read_id % 4] * (read_id + 1) for read_id in range(0, 10)
+        }
+        read_sets = [{0, 1, 2}, {2, 3}, set(), {9, 0, 5}, {5}]
+        filepaths = [
+            tmp_path / f"{set_index}" / f"{set_index}.fa"
+            for set_index in range(0, len(read_sets))
+        ]
+        # Leftover of an interrupted run
+        filepaths[1].parent.mkdir()
+        with open(filepaths[1].with_suffix(".fa.tmp"), "wt", encoding="utf-8") as file:
+            file.write(">7\nTTTTTTTT\n")
+        requested_read_ids = []
+
+        def iter_reads(read_ids):
+            requested_read_ids.extend(read_ids)
+            for read_id in sorted(read_ids, reverse=True):
+                yield read_id, sequences[read_id]
+
+        write_read_sets_to_fasta_files(read_sets, filepaths, iter_reads, max_open_files)
+
+        assert sorted(requested_read_ids) == [0, 1, 2, 3, 5, 9]
+        for read_set, filepath in zip(read_sets, filepaths):
+            with open(filepath, "rt", encoding="utf-8") as fasta_file:
+                lines = [line.strip() for line in fasta_file.readlines()]
+            assert lines == [
+                line
+                for read_id in sorted(read_set, reverse=True)
+                for line in [f">{read_id}", sequences[read_id]]
+            ]
+        assert list(tmp_path.glob("*/*.tmp")) == []
+
+    def test_keeps_temp_files_on_error(self, tmp_path):
+        filepaths = [tmp_path / "0.fa", tmp_path / "1.fa"]
+        with pytest.raises(ValueError):
+            with MultiplexedFastaWriter(filepaths, 1) as fasta_writer:
+                fasta_writer.write([0, 1], "0", "ACGT")
+                raise ValueError()
+        assert not filepaths[0].exists() and not filepaths[1].exists()
+        assert (tmp_path / "0.fa.tmp").is_file()
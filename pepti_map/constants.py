@@ -11,6 +11,11 @@ PATH_TO_LAST_STEP_FILE = PATH_TO_TEMP_FILES / "last_step.txt"
 PATH_PEPTIDE_TO_CLUSTER_MAPPING_FILE = (
     PATH_TO_TEMP_FILES / "peptide_to_cluster_mapping.txt"
 )
+PATH_TO_PEPTIDE_TABLE = PATH_TO_TEMP_FILES / "peptide_table"
+PATH_TO_PEPTIDE_INDEX_DELTA = PATH_TO_TEMP_FILES / "peptide_index_delta.json"
+PATH_TO_MATCHING_CHECKPOINT = PATH_TO_TEMP_FILES / "matching_checkpoint"
+PATH_TO_READ_STORE = PATH_TO_TEMP_FILES / "read_store"
+PATH_TO_READ_INDEXES = PATH_TO_TEMP_FILES / "read_indexes"
 PATH_TO_MATCHING_RESULT = PATH_TO_TEMP_FILES / "matching_result.txt"
 PATH_TO_PRECOMPUTED_INTERSECTIONS = PATH_TO_TEMP_FILES / "precomputed_intersections.npz"
 PATH_TO_MERGED_MATCHES = PATH_TO_TEMP_FILES / "merged_matches.txt"
@@ -0,0 +1,303 @@
+from hashlib import sha256
+import logging
+import multiprocessing
+import os
+from pathlib import Path
+from typing import Dict, List, Tuple, Union
+import numpy as np
+import numpy.typing as npt
+
+from pepti_map.peptide_data.array_peptide_kmer_index import ArrayPeptideKmerIndex
+from pepti_map.util.k_mer import (
+    encode_kmer,
+    encode_kmers_of_sequences,
+    get_minimizers,
+)
+
+# More shards than processes, so that shards of differing complexity
+# are balanced between the processes
+SHARDS_PER_PROCESS = 4
+
+_ShardResult = Tuple[
+    npt.NDArray[np.uint64],
+    npt.NDArray[np.uint32],
+    npt.NDArray[np.bool_],
+    Union[List[str], None],
+]
+
+
+def get_shard_boundaries(filepath: Path, number_of_shards: int) -> List[int]:
+    """
+    Splits the given file into byte ranges of roughly the same size,
+    with each range starting at the beginning of a line.
+    :returns The boundaries of the byte ranges, i.e. shard i covers
+    the bytes from boundaries[i] to boundaries[i + 1].
+    :rtype List[int]
+    """
+    file_size = os.path.getsize(filepath)
+    boundaries = [0]
+    with open(filepath, "rb") as peptide_file:
+        for shard_index in range(1, number_of_shards):
+            peptide_file.seek(max(file_size * shard_index // number_of_shards - 1, 0))
+            peptide_file.readline()
+            boundary = peptide_file.tell()
+            if boundary > boundaries[-1] and boundary < file_size:
+                boundaries.append(boundary)
+    boundaries.append(file_size)
+    return boundaries
+
+
+def _encode_minimizers_of_sequences(
+    sequences: List[str], kmer_length: int, minimizer_window: int
+) -> Tuple[npt.NDArray[np.uint64], npt.NDArray[np.int64]]:
+    codes: List[int] = []
+    sequence_indexes: List[int] = []
+    for sequence_index, sequence in enumerate(sequences):
+        for minimizer in get_minimizers(sequence, kmer_length, minimizer_window):
+            try:
+                codes.append(encode_kmer(minimizer))
+            except ValueError:
+                # Not contained in the array index, see ArrayPeptideKmerIndex
+                continue
+            sequence_indexes.append(sequence_index)
+    return np.array(codes, dtype=np.uint64), np.array(sequence_indexes, dtype=np.int64)
+
+
+def _encode_kmers_of_sequence_shard(
+    concatenated_sequences: npt.NDArray[np.uint8],
+    sequence_lengths: npt.NDArray[np.int64],
+    kmer_length: int,
+    minimizer_window: int,
+) -> Tuple[npt.NDArray[np.uint64], npt.NDArray[np.int64]]:
+    if minimizer_window == 1:
+        return encode_kmers_of_sequences(
+            concatenated_sequences, sequence_lengths, kmer_length
+        )
+    concatenated_string = concatenated_sequences.tobytes().decode("utf-8")
+    sequence_offsets = np.concatenate(([0], np.cumsum(sequence_lengths))).tolist()
+    return _encode_minimizers_of_sequences(
+        [
+            concatenated_string[start:end]
+            for start, end in zip(sequence_offsets[:-1], sequence_offsets[1:])
+        ],
+        kmer_length,
+        minimizer_window,
+    )
+
+
+def encode_kmers_in_parallel(
+    concatenated_sequences: npt.NDArray[np.uint8],
+    sequence_lengths: npt.NDArray[np.int64],
+    kmer_length: int,
+    n_processes: int,
+    minimizer_window: int = 1,
+) -> Tuple[npt.NDArray[np.uint64], npt.NDArray[np.int64]]:
+    """
+    Parallel equivalent of encode_kmers_of_sequences, or of encoding the
+    minimizers of each sequence if the minimizer window is larger than 1.
+    The sequences are split into shards of consecutive sequences with roughly
+    the same number of residues, whose k-mers are encoded by multiple processes.
+    :returns A Tuple (codes, sequence_indexes) as returned by
+    encode_kmers_of_sequences.
+    :rtype Tuple[npt.NDArray[np.uint64], npt.NDArray[np.int64]]
+    """
+    sequence_offsets = np.concatenate(([0], np.cumsum(sequence_lengths))).astype(
+        np.int64
+    )
+    number_of_shards = n_processes * SHARDS_PER_PROCESS
+    shard_boundaries = np.unique(
+        np.concatenate(
+            (
+                [0],
+                np.searchsorted(
+                    sequence_offsets,
+                    sequence_offsets[-1]
+                    * np.arange(1, number_of_shards)
+                    // number_of_shards,
+                ),
+                [len(sequence_lengths)],
+            )
+        )
+    ).tolist()
+    logging.info(
+        f"Encoding the k-mers of {len(sequence_lengths)} peptides in "
+        f"{len(shard_boundaries) - 1} shards with {n_processes} processes."
+    )
+    with multiprocessing.Pool(n_processes) as pool:
+        shard_results = pool.starmap(
+            _encode_kmers_of_sequence_shard,
+            [
+                (
+                    concatenated_sequences[
+                        sequence_offsets[start] : sequence_offsets[end]  # noqa: E203
+                    ],
+                    sequence_lengths[start:end],
+                    kmer_length,
+                    minimizer_window,
+                )
+                for start, end in zip(shard_boundaries[:-1], shard_boundaries[1:])
+            ],
+        )
+    if len(shard_results) == 0:
+        return np.empty(0, dtype=np.uint64), np.empty(0, dtype=np.int64)
+    return (
+        np.concatenate([codes for codes, _ in shard_results]).astype(
+            np.uint64, copy=False
+        ),
+        np.concatenate(
+            [
+                sequence_indexes + start
+                for (_, sequence_indexes), start in zip(
+                    shard_results, shard_boundaries[:-1]
+                )
+            ]
+        ).astype(np.int64, copy=False),
+    )
+
+
+def _process_shard(
+    filepath: Path,
+    start: int,
+    end: int,
+    kmer_length: int,
+    replace_isoleucine: bool,
+    contains_protein_groups: bool,
+    min_peptide_length: int,
+    minimizer_window: int,
+) -> _ShardResult:
+    with open(filepath, "rb") as peptide_file:
+        peptide_file.seek(start)
+        data = peptide_file.read(end - start)
+    lines = data.decode("utf-8").split("\n") if len(data) > 0 else []
+    if data.endswith(b"\n"):
+        lines.pop()
+
+    is_valid_line = np.zeros(len(lines), dtype=np.bool_)
+    protein_groups: Union[List[str], None] = [] if contains_protein_groups else None
+    peptides: List[str] = []
+    for line_index, line in enumerate(lines):
+        if protein_groups is not None:
+            peptide, protein_group = line.split("\t")
+        else:
+            peptide, protein_group = line, ""
+        peptide = peptide.strip()
+        if len(peptide) < min_peptide_length:
+            continue
+        if protein_groups is not None:
+            protein_groups.append(
+                sha256(protein_group.strip().encode("utf-8")).hexdigest()
+            )
+        if replace_isoleucine:
+            peptide = peptide.replace("I", "L")
+        peptides.append(peptide)
+        is_valid_line[line_index] = True
+
+    if minimizer_window > 1:
+        codes, peptide_indexes = _encode_minimizers_of_sequences(
+            peptides, kmer_length, minimizer_window
+        )
+    else:
+        codes, peptide_indexes = encode_kmers_of_sequences(
+            np.frombuffer("".join(peptides).encode("utf-8"), dtype=np.uint8),
+            np.array([len(peptide) for peptide in peptides], dtype=np.int64),
+            kmer_length,
+        )
+    # Shard-local line index for each k-mer
+    local_line_ids = np.flatnonzero(is_valid_line)[peptide_indexes].astype(np.uint32)
+    order = np.argsort(codes, kind="stable")
+    return codes[order], local_line_ids[order], is_valid_line, protein_groups
+
+
+def _get_peptide_to_cluster_mapping(
+    shard_results: List[_ShardResult], contains_protein_groups: bool
+) -> Tuple[List[int], int]:
+    is_valid_line = np.concatenate([shard_result[2] for shard_result in shard_results])
+    if not contains_protein_groups:
+        cluster_ids = np.where(is_valid_line, np.cumsum(is_valid_line) - 1, -1)
+        return cluster_ids.tolist(), int(np.count_nonzero(is_valid_line))
+
+    # Clusters are numbered by first occurrence of the protein group,
+    # which is inherently sequential
+    protein_group_cluster_index: Dict[str, int] = {}
+    peptide_to_cluster_mapping: List[int] = []
+    for _, _, is_valid_shard_line, protein_groups in shard_results:
+        protein_group_iterator = iter(
+            protein_groups  # pyright: ignore[reportGeneralTypeIssues]
+        )
+        for is_valid in is_valid_shard_line.tolist():
+            if not is_valid:
+                peptide_to_cluster_mapping.append(-1)
+                continue
+            protein_group = next(protein_group_iterator)
+            cluster_id = protein_group_cluster_index.setdefault(
+                protein_group, len(protein_group_cluster_index)
+            )
+            peptide_to_cluster_mapping.append(cluster_id)
+    return peptide_to_cluster_mapping, len(protein_group_cluster_index)
+
+
+def build_index_in_parallel(
+    filepath: Path,
+    kmer_length: int,
+    replace_isoleucine: bool,
+    contains_protein_groups: bool,
+    n_processes: int,
+    min_peptide_length: Union[int, None] = None,
+    minimizer_window: int = 1,
+) -> Tuple[ArrayPeptideKmerIndex, List[int]]:
+    """
+    Builds the k-mer index for the given peptide file with multiple processes.
+    Each process encodes the k-mers of a byte range of the file and sorts them,
+    after which the sorted shards are merged into the final index.
+    The result is identical to the serial import of the file.
+    """
+    if min_peptide_length is None:
+        min_peptide_length = kmer_length
+    boundaries = get_shard_boundaries(filepath, n_processes * SHARDS_PER_PROCESS)
+    logging.info(
+        f"Building peptide index from {len(boundaries) - 1} shards "
+        f"with {n_processes} processes."
+    )
+    with multiprocessing.Pool(n_processes) as pool:
+        shard_results: List[_ShardResult] = pool.starmap(
+            _process_shard,
+            [
+                (
+                    filepath,
+                    start,
+                    end,
+                    kmer_length,
+                    replace_isoleucine,
+                    contains_protein_groups,
+                    min_peptide_length,
+                    minimizer_window,
+                )
+                for start, end in zip(boundaries[:-1], boundaries[1:])
+            ],
+        )
+
+    first_line_ids = np.cumsum(
+        [0] + [len(shard_result[2]) for shard_result in shard_results[:-1]]
+    )
+    # As the shards are sorted and in file order, the stable sort reduces to a merge
+    # of the sorted runs and keeps the peptide ids per k-mer in file order
+    kmer_index = ArrayPeptideKmerIndex.from_csr_arrays(
+        kmer_length,
+        *ArrayPeptideKmerIndex.build_csr_arrays(
+            np.concatenate([shard_result[0] for shard_result in shard_results]),
+            np.concatenate(
+                [
+                    shard_result[1] + np.uint32(first_line_id)
+                    for shard_result, first_line_id in zip(
+                        shard_results, first_line_ids.tolist()
+                    )
+                ]
+            ),
+        ),
+    )
+    peptide_to_cluster_mapping, number_of_clusters = _get_peptide_to_cluster_mapping(
+        shard_results, contains_protein_groups
+    )
+    kmer_index.minimizer_window = minimizer_window
+    kmer_index.number_of_peptides = number_of_clusters
+    return kmer_index, peptide_to_cluster_mapping
@@ -11,8 +11,6 @@ class PeptideImporter:
     def reset(self) -> None:
         self._peptide_dict = {}
 
-    # TODO: Add support for custom format
-    # TODO: Add support for MZTab
     # TODO: Use numpy instead?
     def import_file_with_deduplication(self, filepath: str) -> pd.DataFrame:
         """
@@ -0,0 +1,136 @@
+from hashlib import sha256
+import logging
+import os
+from pathlib import Path
+from typing import List, Tuple, Union
+
+from dotenv import dotenv_values
+
+from pepti_map.peptide_data.array_peptide_kmer_index import ArrayPeptideKmerIndex
+
+DEFAULT_MAX_CACHE_SIZE = "10G"
+_CACHE_ENTRY_SUFFIX = ".idx"
+_HASH_CHUNK_SIZE = 1 << 20
+_SIZE_UNITS = {"K": 1 << 10, "M": 1 << 20, "G": 1 << 30, "T": 1 << 40}
+
+
+def parse_size(size: str) -> int:
+    """
+    Converts a size given as e.g. "500M" or "10G" into a number of bytes.
+    A size without unit is interpreted as a number of bytes.
+    """
+    size = size.strip().upper()
+    if size[-1:] in _SIZE_UNITS:
+        return int(float(size[:-1]) * _SIZE_UNITS[size[-1]])
+    return int(size)
+
+
+def compute_file_hash(filepath: Path) -> str:
+    file_hash = sha256()
+    with open(filepath, "rb") as peptide_file:
+        for chunk in iter(lambda: peptide_file.read(_HASH_CHUNK_SIZE), b""):
+            file_hash.update(chunk)
+    return file_hash.hexdigest()
+
+
+class PeptideIndexCache:
+    """
+    Directory of prebuilt k-mer indexes in the binary format of
+    `ArrayPeptideKmerIndex`, keyed by a fingerprint of the peptide file
+    and the parameters used to build the index. If the total size of the cache
+    exceeds the given maximum, the least recently used entries are evicted.
+    """
+
+    def __init__(self, cache_dir: Path, max_size_in_bytes: int):
+        self._cache_dir: Path = cache_dir
+        self._max_size_in_bytes: int = max_size_in_bytes
+        self._cache_dir.mkdir(parents=True, exist_ok=True)
+
+    @classmethod
+    def from_env(cls) -> Union["PeptideIndexCache", None]:
+        """
+        Creates the cache as configured by the environment variables
+        `INDEX_CACHE_PATH` and `INDEX_CACHE_MAX_SIZE`.
+        :returns The cache, or None if `INDEX_CACHE_PATH` is not set.
+        :rtype Union[PeptideIndexCache, None]
+        """
+        env_vars = dotenv_values()
+        cache_path = env_vars.get("INDEX_CACHE_PATH")
+        if cache_path is None or cache_path == "":
+            return None
+        max_size = env_vars.get("INDEX_CACHE_MAX_SIZE")
+        if max_size is None:
+            max_size = DEFAULT_MAX_CACHE_SIZE
+        return cls(Path(cache_path), parse_size(max_size))
+
+    @staticmethod
+    def compute_key(
+        filepath: Path,
+        kmer_length: int,
+        replace_isoleucine: bool,
+        contains_protein_groups: bool,
+        min_peptide_length: Union[int, None] = None,
+        minimizer_window: int = 1,
+        deduplicate_peptides: bool = False,
+    ) -> str:
+        if min_peptide_length is None:
+            min_peptide_length = kmer_length
+        return sha256(
+            (
+                f"{compute_file_hash(filepath)};k={kmer_length};"
+                f"il={int(replace_isoleucine)};pg={int(contains_protein_groups)};"
+                f"min_len={min_peptide_length};w={minimizer_window};"
+                f"dedup={int(deduplicate_peptides)}"
+            ).encode("utf-8")
+        ).hexdigest()
+
+    def _get_entry_path(self, key: str) -> Path:
+        return self._cache_dir / (key + _CACHE_ENTRY_SUFFIX)
+
+    def load(self, key: str) -> Union[Tuple[ArrayPeptideKmerIndex, List[int]], None]:
+        entry_path = self._get_entry_path(key)
+        if not entry_path.is_file():
+            return None
+        try:
+            kmer_index, peptide_to_cluster_mapping = (
+                ArrayPeptideKmerIndex.load_index_from_binary_file(entry_path.as_posix())
+            )
+        except ValueError:
+            logging.warning(f"Ignoring invalid index cache entry {entry_path}.")
+            return None
+        # Mark the entry as recently used for the eviction
+        os.utime(entry_path)
+        logging.info(f"Using cached peptide index {entry_path}.")
+        return kmer_index, peptide_to_cluster_mapping.tolist()
+
+    def store(
+        self,
+        key: str,
+        kmer_index: ArrayPeptideKmerIndex,
+        peptide_to_cluster_mapping: List[int],
+    ) -> None:
+        entry_path = self._get_entry_path(key)
+        temp_path = entry_path.with_suffix(f".{os.getpid()}.tmp")
+        kmer_index.dump_index_to_binary_file(
+            temp_path.as_posix(), peptide_to_cluster_mapping
+        )
+        # Replacing is atomic, so that concurrent runs never see partial entries
+        os.replace(temp_path, entry_path)
+        logging.info(f"Stored peptide index in cache as {entry_path}.")
+        self._evict()
+
+    def _evict(self) -> None:
+        entries = sorted(
+            [
+                (entry.stat().st_mtime, entry.stat().st_size, entry)
+                for entry in self._cache_dir.glob("*" + _CACHE_ENTRY_SUFFIX)
+            ],
+            key=lambda entry: entry[0],
+        )
+        cache_size = sum([entry[1] for entry in entries])
+        for _, entry_size, entry_path in entries:
+            if cache_size <= self._max_size_in_bytes:
+                break
+            logging.info(f"Evicting {entry_path} from peptide index cache.")
+            entry_path.unlink(missing_ok=True)
+            cache_size -= entry_size
@@ -0,0 +1,141 @@
+import json
+import logging
+import os
+from pathlib import Path
+import shutil
+from typing import Dict, List, Tuple, Union
+
+from pepti_map.importing.peptide_import.peptide_index_cache import compute_file_hash
+from pepti_map.peptide_data.array_peptide_kmer_index import ArrayPeptideKmerIndex
+from pepti_map.peptide_data.kmer_index import IKmerIndex
+from pepti_map.peptide_data.peptide_kmer_index import PeptideKmerIndex
+from pepti_map.peptide_data.peptide_table import PeptideTable
+
+_MANIFEST_FILENAME = "manifest.json"
+_PEPTIDE_TABLE_DIRNAME = "peptide_table"
+_ARRAY_INDEX_FILENAME = "index.bin"
+_DICT_INDEX_FILENAME = "index.tsv.gz"
+
+
+class PeptideIndexStore:
+    """
+    Directory in which an unmasked k-mer index is persisted together with its
+    peptide table and the peptide files it was built from, so that further
+    peptide files can be appended to it in later runs instead of rebuilding
+    the index from all files.
+    The index is only reused if it was built with the same settings and from
+    the first of the given peptide files, which are identified by their content.
+    """
+
+    def __init__(self, store_dir: Path):
+        self._store_dir: Path = store_dir
+
+    @staticmethod
+    def _get_file_hashes(peptide_files: List[str]) -> List[str]:
+        return [compute_file_hash(Path(peptide_file)) for peptide_file in peptide_files]
+
+    def load(
+        self,
+        peptide_files: List[str],
+        settings: Dict[str, Union[str, int, None]],
+    ) -> Union[Tuple[IKmerIndex, PeptideTable, int], None]:
+        """
+        Loads the stored index if it can be reused for the given peptide files
+        and settings.
+        :returns A Tuple (kmer_index, peptide_table, number_of_stored_files)
+        with the number of given peptide files the index was built from,
+        or None if the index cannot be reused.
+        :rtype Union[Tuple[IKmerIndex, PeptideTable, int], None]
+        """
+        manifest_path = self._store_dir / _MANIFEST_FILENAME
+        if not manifest_path.is_file():
+            return None
+        with open(manifest_path, "rt", encoding="utf-8") as manifest_file:
+            manifest = json.load(manifest_file)
+        if manifest["settings"] != settings:
+            logging.warning(
+                f"Not using stored peptide index {self._store_dir}, "
+                "as it was built with different settings."
+            )
+            return None
+        stored_file_hashes: List[str] = manifest["file_hashes"]
+        if len(stored_file_hashes) > len(peptide_files) or (
+            PeptideIndexStore._get_file_hashes(
+                peptide_files[0 : len(stored_file_hashes)]  # noqa: E203
+            )
+            != stored_file_hashes
+        ):
+            logging.warning(
+                f"Not using stored peptide index {self._store_dir}, as it was "
+                "not built from the first of the given peptide files."
+            )
+            return None
+
+        kmer_index: IKmerIndex
+        if settings["index_type"] == "array":
+            kmer_index, _ = ArrayPeptideKmerIndex.load_index_from_binary_file(
+                (self._store_dir / _ARRAY_INDEX_FILENAME).as_posix()
+            )
+        else:
+            kmer_index = PeptideKmerIndex.load_index_from_file(
+                (self._store_dir / _DICT_INDEX_FILENAME).as_posix()
+            )
+            kmer_index.minimizer_window = int(settings["minimizer_window"] or 1)
+        peptide_table = PeptideTable.load(self._store_dir / _PEPTIDE_TABLE_DIRNAME)
+        logging.info(
+            f"Loaded stored peptide index {self._store_dir} built from "
+            f"{len(stored_file_hashes)} peptide files."
+        )
+        return kmer_index, peptide_table, len(stored_file_hashes)
+
+    def store(
+        self,
+        kmer_index: IKmerIndex,
+        peptide_table: PeptideTable,
+        peptide_files: List[str],
+        settings: Dict[str, Union[str, int, None]],
+    ) -> None:
+        """
+        Stores the given index, which must not be masked yet, replacing the
+        previously stored one.
+        """
+        self._store_dir.mkdir(parents=True, exist_ok=True)
+        # Without manifest, a partially written store is never loaded
+        (self._store_dir / _MANIFEST_FILENAME).unlink(missing_ok=True)
+        # The previous index and table may still be memory-mapped, so the new
+        # ones are written next to them and then moved into place
+        if isinstance(kmer_index, ArrayPeptideKmerIndex):
+            index_path = self._store_dir / _ARRAY_INDEX_FILENAME
+            temp_index_path = index_path.with_suffix(".tmp")
+            kmer_index.dump_index_to_binary_file(
+                temp_index_path.as_posix(),
+                peptide_table.get_peptide_to_cluster_mapping(),
+            )
+        elif isinstance(kmer_index, PeptideKmerIndex):
+            index_path = self._store_dir / _DICT_INDEX_FILENAME
+            temp_index_path = index_path.with_suffix(".tmp")
+            kmer_index.dump_index_to_file(temp_index_path.as_posix())
+        else:
+            error_message = f"Cannot store index of type {type(kmer_index)}."
+            logging.error(error_message)
+            raise ValueError(error_message)
+        os.replace(temp_index_path, index_path)
+
+        table_path = self._store_dir / _PEPTIDE_TABLE_DIRNAME
+        temp_table_path = self._store_dir / (_PEPTIDE_TABLE_DIRNAME + ".tmp")
+        shutil.rmtree(temp_table_path, ignore_errors=True)
+        peptide_table.save(temp_table_path)
+        shutil.rmtree(table_path, ignore_errors=True)
+        os.replace(temp_table_path, table_path)
+
+        with open(
+            self._store_dir / _MANIFEST_FILENAME, "wt", encoding="utf-8"
+        ) as manifest_file:
+            json.dump(
+                {
+                    "settings": settings,
+                    "file_hashes": PeptideIndexStore._get_file_hashes(peptide_files),
+                },
+                manifest_file,
+            )
+        logging.info(f"Stored peptide index in {self._store_dir}.")
@@ -1,25 +1,99 @@
+import logging
 from pathlib import Path
-from typing import Dict, List, Tuple
+from typing import Dict, Iterable, List, Literal, Tuple, Union
 from hashlib import sha256
+import numpy as np
 from pepti_map.constants import PATH_PEPTIDE_TO_CLUSTER_MAPPING_FILE
+from pepti_map.importing.peptide_import.parallel_index_builder import (
+    build_index_in_parallel,
+    encode_kmers_in_parallel,
+)
+from pepti_map.importing.peptide_import.peptide_index_cache import PeptideIndexCache
 
+from pepti_map.importing.peptide_import.peptide_to_table_importer import (
+    PeptideToTableImporter,
+    open_peptide_file,
+)
+from pepti_map.peptide_data.array_peptide_kmer_index import ArrayPeptideKmerIndex
+from pepti_map.peptide_data.duplicate_peptide_mapping import DuplicatePeptideMapping
+from pepti_map.peptide_data.kmer_index import IKmerIndex
+from pepti_map.peptide_data.kmer_index_statistics import KmerIndexStatistics
+from pepti_map.peptide_data.peptide_index_delta import PeptideIndexDelta
 from pepti_map.peptide_data.peptide_kmer_index import PeptideKmerIndex
-from pepti_map.util.k_mer import split_into_kmer
+from pepti_map.peptide_data.peptide_table import PeptideTable
+from pepti_map.util.k_mer import (
+    encode_kmers_of_sequences,
+    get_minimizers,
+    split_into_kmer,
+)
 
 
 class PeptideToIndexImporter:
-    def __init__(self, kmer_length: int = 7):
+    def __init__(
+        self,
+        kmer_length: int = 7,
+        index_type: Literal["dict", "array"] = "dict",
+        index_cache: Union[PeptideIndexCache, None] = None,
+        n_processes: int = 1,
+        max_postings_length: Union[int, None] = None,
+        kmer_stop_list: Union[List[str], None] = None,
+        min_peptide_length: Union[int, None] = None,
+        minimizer_window: int = 1,
+        deduplicate_peptides: bool = False,
+        write_mapping_file: bool = True,
+    ):
         self.kmer_length: int = kmer_length
+        self.index_type: Literal["dict", "array"] = index_type
+        self.index_cache: Union[PeptideIndexCache, None] = index_cache
+        self.n_processes: int = n_processes
+        self.max_postings_length: Union[int, None] = max_postings_length
+        # Peptides shorter than this are not assigned to a cluster
+        self.min_peptide_length: int = (
+            min_peptide_length if min_peptide_length is not None else kmer_length
+        )
+        self.minimizer_window: int = minimizer_window
+        # Only index the first of all peptides with the same I/L-normalised sequence
+        self.deduplicate_peptides: bool = deduplicate_peptides
+        self.kmer_stop_list: List[str] = (
+            kmer_stop_list if kmer_stop_list is not None else []
+        )
+        # Disabled e.g. for previews, which do not write the files of later steps
+        self.write_mapping_file: bool = write_mapping_file
+
+    def _create_kmer_index(self) -> IKmerIndex:
+        kmer_index: IKmerIndex
+        if self.index_type == "dict":
+            kmer_index = PeptideKmerIndex(self.kmer_length)
+        elif self.index_type == "array":
+            kmer_index = ArrayPeptideKmerIndex(self.kmer_length)
+        else:
+            error_message = "Index type must be one of 'dict', 'array'."
+            logging.error(error_message)
+            raise ValueError(error_message)
+        kmer_index.minimizer_window = self.minimizer_window
+        return kmer_index
+
+    def _get_kmers_to_index(self, peptide: str) -> Iterable[str]:
+        if self.minimizer_window > 1:
+            return get_minimizers(peptide, self.kmer_length, self.minimizer_window)
+        return [kmer[0] for kmer in split_into_kmer(peptide, self.kmer_length)]
 
     @staticmethod
     def _file_contains_protein_groups(filepath: Path) -> bool:
         contains_protein_groups = False
-        with open(filepath, "rt", encoding="utf-8") as peptide_file:
+        with open_peptide_file(filepath) as peptide_file:
             first_line = peptide_file.readline()
             if "\t" in first_line:
                 contains_protein_groups = True
         return contains_protein_groups
 
+    @staticmethod
+    def _table_contains_protein_groups(peptide_table: PeptideTable) -> bool:
+        # Without protein groups, each clustered peptide forms its own cluster
+        return peptide_table.number_of_clusters < int(
+            np.count_nonzero(np.asarray(peptide_table.cluster_ids) >= 0)
+        )
+
     @staticmethod
     def _write_peptide_to_cluster_mapping_file(
         peptide_to_cluster_mapping: List[int],
@@ -30,50 +104,163 @@ class PeptideToIndexImporter:
                 [str(cluster_id) + "\n" for cluster_id in peptide_to_cluster_mapping]
             )
 
+    def _store_peptide_to_cluster_mapping(
+        self, peptide_to_cluster_mapping: List[int]
+    ) -> None:
+        if self.write_mapping_file:
+            PeptideToIndexImporter._write_peptide_to_cluster_mapping_file(
+                peptide_to_cluster_mapping
+            )
+
+    def _process_peptide_table(
+        self, peptide_table: PeptideTable, replace_isoleucine=True, first_peptide_id=0
+    ) -> Tuple[IKmerIndex, List[int]]:
+        sequences = (
+            peptide_table.normalized_sequences
+            if replace_isoleucine
+            else peptide_table.sequences
+        )
+        # Peptides before the first peptide id are already part of another index
+        is_indexed_peptide = (np.asarray(peptide_table.cluster_ids) >= 0) & (
+            np.arange(len(peptide_table)) >= first_peptide_id
+        )
+        if self.deduplicate_peptides:
+            is_indexed_peptide &= np.asarray(
+                DuplicatePeptideMapping.from_peptide_table(
+                    peptide_table
+                ).canonical_peptide_ids
+            ) == np.arange(len(peptide_table))
+        indexed_peptide_ids = np.flatnonzero(is_indexed_peptide)
+        kmer_index: IKmerIndex
+        if self.index_type == "array" and (
+            self.minimizer_window == 1 or self.n_processes > 1
+        ):
+            lengths = np.asarray(peptide_table.lengths, dtype=np.int64)
+            indexed_sequences = np.asarray(sequences)[
+                np.repeat(is_indexed_peptide, lengths)
+            ]
+            if self.n_processes > 1:
+                codes, peptide_indexes = encode_kmers_in_parallel(
+                    indexed_sequences,
+                    lengths[is_indexed_peptide],
+                    self.kmer_length,
+                    self.n_processes,
+                    self.minimizer_window,
+                )
+            else:
+                codes, peptide_indexes = encode_kmers_of_sequences(
+                    indexed_sequences, lengths[is_indexed_peptide], self.kmer_length
+                )
+            kmer_index = ArrayPeptideKmerIndex.from_csr_arrays(
+                self.kmer_length,
+                *ArrayPeptideKmerIndex.build_csr_arrays(
+                    codes, indexed_peptide_ids[peptide_indexes].astype(np.uint32)
+                ),
+            )
+            kmer_index.minimizer_window = self.minimizer_window
+        else:
+            kmer_index = self._create_kmer_index()
+            offsets = peptide_table.sequence_offsets
+            for peptide_index in indexed_peptide_ids.tolist():
+                sequence = (
+                    sequences[
+                        offsets[peptide_index] : offsets[  # noqa: E203
+                            peptide_index + 1
+                        ]
+                    ]
+                    .tobytes()
+                    .decode("utf-8")
+                )
+                for kmer in self._get_kmers_to_index(sequence):
+                    kmer_index.appendToEntryForKmer(kmer, peptide_index)
+
+        # TODO: Do this in a prettier way
+        kmer_index.number_of_peptides = peptide_table.number_of_clusters
+        peptide_to_cluster_mapping = peptide_table.get_peptide_to_cluster_mapping()
+        self._store_peptide_to_cluster_mapping(peptide_to_cluster_mapping)
+        return kmer_index, peptide_to_cluster_mapping
+
+    def _mask_kmers(self, kmer_index: IKmerIndex, replace_isoleucine=True) -> None:
+        kmers_to_mask: Dict[str, int] = {}
+        postings_lengths = kmer_index.get_postings_lengths()
+        if self.max_postings_length is not None:
+            positions = np.flatnonzero(
+                postings_lengths > self.max_postings_length
+            ).tolist()
+            kmers_to_mask.update(
+                zip(
+                    kmer_index.get_kmers_at(positions),
+                    postings_lengths[positions].tolist(),
+                )
+            )
+        for kmer in self.kmer_stop_list:
+            if len(kmer) != self.kmer_length:
+                logging.warning(
+                    f"Ignoring k-mer {kmer} of the stop-list, as its length "
+                    f"differs from the k-mer length {self.kmer_length}."
+                )
+                continue
+            if replace_isoleucine:
+                kmer = kmer.replace("I", "L")
+            postings_length = len(kmer_index.getEntryForKmer(kmer))
+            if postings_length > 0:
+                kmers_to_mask[kmer] = postings_length
+
+        if len(kmers_to_mask) == 0:
+            return
+        kmer_index.removeEntriesForKmers(kmers_to_mask.keys())
+        logging.info(
+            f"Masked {len(kmers_to_mask)} k-mers in the peptide index: "
+            + ", ".join(
+                [
+                    f"{kmer} ({postings_length} peptides)"
+                    for kmer, postings_length in kmers_to_mask.items()
+                ]
+            )
+        )
+
     def _process_simple_peptide_file(
         self, filepath: Path, replace_isoleucine=True
-    ) -> Tuple[PeptideKmerIndex, List[int]]:
-        kmer_index = PeptideKmerIndex(self.kmer_length)
+    ) -> Tuple[IKmerIndex, List[int]]:
+        kmer_index = self._create_kmer_index()
         peptide_to_cluster_mapping: List[int] = []
         number_of_peptides = 0
-        with open(filepath, "rt", encoding="utf-8") as peptide_file:
+        with open_peptide_file(filepath) as peptide_file:
             for peptide_index, line in enumerate(peptide_file):
                 sequence = line.strip()
-                if len(sequence) < self.kmer_length:
+                if len(sequence) < self.min_peptide_length:
                     peptide_to_cluster_mapping.append(-1)
                     continue
 
                 if replace_isoleucine:
                     sequence = sequence.replace("I", "L")
-                for kmer in split_into_kmer(sequence, self.kmer_length):
-                    kmer_index.appendToEntryForKmer(kmer[0], peptide_index)
+                for kmer in self._get_kmers_to_index(sequence):
+                    kmer_index.appendToEntryForKmer(kmer, peptide_index)
                 peptide_to_cluster_mapping.append(number_of_peptides)
                 number_of_peptides += 1
 
         # TODO: Do this in a prettier way
         kmer_index.number_of_peptides = number_of_peptides
 
-        PeptideToIndexImporter._write_peptide_to_cluster_mapping_file(
-            peptide_to_cluster_mapping
-        )
+        self._store_peptide_to_cluster_mapping(peptide_to_cluster_mapping)
 
         return kmer_index, peptide_to_cluster_mapping
 
     def _process_peptide_file_with_protein_groups(
         self, filepath: Path, replace_isoleucine=True
-    ) -> Tuple[PeptideKmerIndex, List[int]]:
-        kmer_index = PeptideKmerIndex(self.kmer_length)
+    ) -> Tuple[IKmerIndex, List[int]]:
+        kmer_index = self._create_kmer_index()
         protein_group_cluster_index: Dict[str, int] = {}
         peptide_to_cluster_mapping: List[int] = []
         number_of_clusters = 0
 
-        with open(filepath, "rt", encoding="utf-8") as peptide_file:
+        with open_peptide_file(filepath) as peptide_file:
             for peptide_index, line in enumerate(peptide_file):
                 peptide, protein_group = line.split("\t")
                 peptide = peptide.strip()
                 # TODO: Should even too short peptides be taken into account later on
                 # if their protein group matches other peptides that are long enough?
-                if len(peptide) < self.kmer_length:
+                if len(peptide) < self.min_peptide_length:
                     peptide_to_cluster_mapping.append(-1)
                     continue
 
@@ -90,25 +277,181 @@ class PeptideToIndexImporter:
 
                 if replace_isoleucine:
                     peptide = peptide.replace("I", "L")
-                for kmer in split_into_kmer(peptide, self.kmer_length):
-                    kmer_index.appendToEntryForKmer(kmer[0], peptide_index)
+                for kmer in self._get_kmers_to_index(peptide):
+                    kmer_index.appendToEntryForKmer(kmer, peptide_index)
 
         # TODO: Do this in a prettier way
         kmer_index.number_of_peptides = number_of_clusters
 
-        PeptideToIndexImporter._write_peptide_to_cluster_mapping_file(
-            peptide_to_cluster_mapping
-        )
+        self._store_peptide_to_cluster_mapping(peptide_to_cluster_mapping)
 
         return kmer_index, peptide_to_cluster_mapping
 
-    def import_file_to_index(
-        self, filepath: Path, replace_isoleucine=True
-    ) -> Tuple[PeptideKmerIndex, List[int]]:
-        # TODO: Should import of multiple files be possible?
-        if PeptideToIndexImporter._file_contains_protein_groups(filepath):
-            return self._process_peptide_file_with_protein_groups(
-                filepath, replace_isoleucine
+    def _build_index(
+        self,
+        filepath: Path,
+        replace_isoleucine=True,
+        peptide_table: Union[PeptideTable, None] = None,
+    ) -> Tuple[IKmerIndex, List[int]]:
+        if peptide_table is not None:
+            # The table was imported with the format of the file, so the file
+            # itself, which may e.g. be a gzipped PSM table, is not read again
+            contains_protein_groups = (
+                PeptideToIndexImporter._table_contains_protein_groups(peptide_table)
             )
         else:
-            return self._process_simple_peptide_file(filepath, replace_isoleucine)
+            contains_protein_groups = (
+                PeptideToIndexImporter._file_contains_protein_groups(filepath)
+            )
+        cache_key = None
+        if self.index_cache is not None:
+            if self.index_type == "array":
+                cache_key = PeptideIndexCache.compute_key(
+                    filepath,
+                    self.kmer_length,
+                    replace_isoleucine,
+                    contains_protein_groups,
+                    self.min_peptide_length,
+                    self.minimizer_window,
+                    self.deduplicate_peptides,
+                )
+                cached_result = self.index_cache.load(cache_key)
+                if cached_result is not None:
+                    self._store_peptide_to_cluster_mapping(cached_result[1])
+                    return cached_result
+            else:
+                logging.warning(
+                    "The peptide index cache is only used with the 'array' index type."
+                )
+
+        if self.n_processes > 1 and self.index_type != "array":
+            logging.warning(
+                "Building the peptide index with multiple processes is only "
+                "supported for the 'array' index type. Building it serially."
+            )
+        # A table is split into shards of peptides by `_process_peptide_table`,
+        # a file into byte ranges, which requires it to be uncompressed
+        build_in_parallel = (
+            self.n_processes > 1
+            and self.index_type == "array"
+            and not filepath.name.endswith(".gz")
+        )
+        if self.deduplicate_peptides and peptide_table is None:
+            # Duplicates are only detected when building the index from a table
+            peptide_table = PeptideToTableImporter(self.min_peptide_length).import_file(
+                filepath
+            )
+        if peptide_table is not None:
+            kmer_index, peptide_to_cluster_mapping = self._process_peptide_table(
+                peptide_table, replace_isoleucine
+            )
+        elif build_in_parallel:
+            kmer_index, peptide_to_cluster_mapping = build_index_in_parallel(
+                filepath,
+                self.kmer_length,
+                replace_isoleucine,
+                contains_protein_groups,
+                self.n_processes,
+                self.min_peptide_length,
+                self.minimizer_window,
+            )
+            self._store_peptide_to_cluster_mapping(peptide_to_cluster_mapping)
+        elif contains_protein_groups:
+            kmer_index, peptide_to_cluster_mapping = (
+                self._process_peptide_file_with_protein_groups(
+                    filepath, replace_isoleucine
+                )
+            )
+        else:
+            kmer_index, peptide_to_cluster_mapping = self._process_simple_peptide_file(
+                filepath, replace_isoleucine
+            )
+
+        if (
+            self.index_cache is not None
+            and cache_key is not None
+            and isinstance(kmer_index, ArrayPeptideKmerIndex)
+        ):
+            self.index_cache.store(cache_key, kmer_index, peptide_to_cluster_mapping)
+        return kmer_index, peptide_to_cluster_mapping
+
+    def append_peptide_table_to_index(
+        self,
+        kmer_index: IKmerIndex,
+        peptide_table: PeptideTable,
+        new_peptide_table: PeptideTable,
+        replace_isoleucine=True,
+        peptide_files: Union[List[str], None] = None,
+    ) -> Tuple[PeptideTable, List[int], PeptideIndexDelta]:
+        """
+        Appends the peptides of the new table to the given index, which was
+        built from the given table and must not be masked yet. The new peptides
+        get new peptide ids and new clusters after the existing ones. Only the
+        new peptides are split into k-mers, whose entries are then merged into
+        the existing entries of the index.
+        :param List[str] peptide_files: The files the new peptides were imported
+        from, which are recorded in the delta.
+        :returns A Tuple (peptide_table, peptide_to_cluster_mapping, delta) with
+        the table containing both the existing and the new peptides, and
+        the delta describing the changes to the index.
+        :rtype Tuple[PeptideTable, List[int], PeptideIndexDelta]
+        """
+        combined_peptide_table = peptide_table.append(new_peptide_table)
+        new_kmer_index, peptide_to_cluster_mapping = self._process_peptide_table(
+            combined_peptide_table, replace_isoleucine, len(peptide_table)
+        )
+        kmer_index.merge_index(new_kmer_index)
+        kmer_index.number_of_peptides = combined_peptide_table.number_of_clusters
+        delta = PeptideIndexDelta(
+            len(peptide_table),
+            len(new_peptide_table),
+            peptide_table.number_of_clusters,
+            combined_peptide_table.number_of_clusters
+            - peptide_table.number_of_clusters,
+            new_kmer_index.get_kmers_at(
+                range(0, len(new_kmer_index.get_postings_lengths()))
+            ),
+            peptide_files if peptide_files is not None else [],
+        )
+        logging.info(
+            f"Appended {delta.number_of_new_peptides} peptides in "
+            f"{delta.number_of_new_clusters} new clusters to the peptide index, "
+            f"changing the entries of {len(delta.changed_kmers)} k-mers."
+        )
+        return combined_peptide_table, peptide_to_cluster_mapping, delta
+
+    def finalize_index(self, kmer_index: IKmerIndex, replace_isoleucine=True) -> None:
+        """
+        Writes the statistics of the index to the log and then removes all
+        k-mers of the stop-list and all k-mers with more than
+        `max_postings_length` peptide ids from the index.
+        """
+        logging.info(
+            "Peptide index statistics:\n"
+            + KmerIndexStatistics.from_index(kmer_index).get_report()
+        )
+        self._mask_kmers(kmer_index, replace_isoleucine)
+
+    def import_file_to_index(
+        self,
+        filepath: Path,
+        replace_isoleucine=True,
+        peptide_table: Union[PeptideTable, None] = None,
+        finalize=True,
+    ) -> Tuple[IKmerIndex, List[int]]:
+        """
+        Builds the k-mer index for the given peptide file and finalizes it
+        with `finalize_index`.
+        :param Union[PeptideTable, None] peptide_table: The already imported
+        peptide table of the file, which must have been imported with the same
+        minimum peptide length. If given, the index is built from the table
+        instead of parsing the file again.
+        :param bool finalize: Whether to finalize the index. Set to False if
+        further peptides should be appended to the index afterwards.
+        """
+        kmer_index, peptide_to_cluster_mapping = self._build_index(
+            filepath, replace_isoleucine, peptide_table
+        )
+        if finalize:
+            self.finalize_index(kmer_index, replace_isoleucine)
+        return kmer_index, peptide_to_cluster_mapping
@@ -0,0 +1,86 @@
+import gzip
+from pathlib import Path
+from typing import Dict, List, TextIO, Union
+import numpy as np
+import numpy.typing as npt
+
+from pepti_map.peptide_data.peptide_table import PeptideTable
+
+
+def open_peptide_file(filepath: Path) -> TextIO:
+    """
+    Opens the given peptide file for reading text, which may be gzipped.
+    :rtype TextIO
+    """
+    if filepath.name.endswith(".gz"):
+        return gzip.open(filepath, "rt", encoding="utf-8")
+    return open(filepath, "rt", encoding="utf-8")
+
+
+class PeptideToTableImporter:
+    def __init__(self, min_peptide_length: int = 7):
+        # Peptides shorter than this are not assigned to a cluster
+        self.min_peptide_length: int = min_peptide_length
+
+    def import_file(self, filepath: Path) -> PeptideTable:
+        """
+        Parses the given peptide file, with one peptide per line and optionally
+        its protein group separated by a tab, into a `PeptideTable`.
+        The file may be gzipped and is read line by line.
+        Peptides are assigned to clusters in the same way as by
+        `PeptideToIndexImporter`: By protein group if the file contains
+        protein groups, otherwise each peptide forms its own cluster.
+        :rtype PeptideTable
+        """
+        contains_protein_groups = False
+        sequences: List[bytes] = []
+        protein_groups: List[bytes] = []
+        with open_peptide_file(filepath) as peptide_file:
+            for line in peptide_file:
+                if len(sequences) == 0:
+                    contains_protein_groups = "\t" in line
+                if contains_protein_groups:
+                    sequence, protein_group = line.split("\t")[0:2]
+                    protein_groups.append(protein_group.strip().encode("utf-8"))
+                else:
+                    sequence = line
+                sequences.append(sequence.strip().encode("utf-8"))
+        return self._create_peptide_table(
+            sequences,
+            protein_groups if contains_protein_groups else None,
+            np.arange(len(sequences), dtype=np.int64),
+        )
+
+    def _create_peptide_table(
+        self,
+        sequences: List[bytes],
+        protein_groups: Union[List[bytes], None],
+        original_ids: npt.NDArray[np.int64],
+    ) -> PeptideTable:
+        cluster_ids: List[int] = []
+        protein_group_cluster_index: Dict[bytes, int] = {}
+        number_of_clusters = 0
+        for peptide_index, sequence in enumerate(sequences):
+            if len(sequence) < self.min_peptide_length:
+                cluster_ids.append(-1)
+                continue
+            if protein_groups is not None:
+                protein_group = protein_groups[peptide_index]
+                if protein_group not in protein_group_cluster_index:
+                    protein_group_cluster_index[protein_group] = number_of_clusters
+                    number_of_clusters += 1
+                cluster_ids.append(protein_group_cluster_index[protein_group])
+            else:
+                cluster_ids.append(number_of_clusters)
+                number_of_clusters += 1
+
+        lengths = np.array([len(sequence) for sequence in sequences], dtype=np.int32)
+        all_sequences = b"".join(sequences)
+        return PeptideTable(
+            np.concatenate(([0], np.cumsum(lengths, dtype=np.int64))),
+            np.frombuffer(all_sequences, dtype=np.uint8).copy(),
+            np.frombuffer(all_sequences.replace(b"I", b"L"), dtype=np.uint8).copy(),
+            original_ids,
+            np.array(cluster_ids, dtype=np.int32),
+            lengths,
+        )
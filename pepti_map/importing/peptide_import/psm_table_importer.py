@@ -0,0 +1,214 @@
+import gzip
+import logging
+from pathlib import Path
+from typing import BinaryIO, Dict, List, Literal, Set, Tuple, Union
+import numpy as np
+
+from pepti_map.importing.peptide_import.peptide_to_table_importer import (
+    PeptideToTableImporter,
+)
+from pepti_map.peptide_data.peptide_table import PeptideTable
+
+# Header line prefixes of the mzTab sections and the prefixes of their rows
+MZTAB_SECTIONS = {b"PSH": b"PSM", b"PEH": b"PEP"}
+MZTAB_SEQUENCE_COLUMN = "sequence"
+MZTAB_PROTEIN_GROUP_COLUMN = "accession"
+# Column names of common search engine outputs, compared case-insensitively
+DEFAULT_SEQUENCE_COLUMNS = [
+    "sequence",
+    "peptide",
+    "peptide sequence",
+    "peptidesequence",
+    "stripped.sequence",
+]
+DEFAULT_PROTEIN_GROUP_COLUMNS = [
+    "protein group",
+    "protein groups",
+    "proteins",
+    "protein",
+    "protein accessions",
+    "protein.group",
+    "accession",
+]
+_NULL_VALUES = set([b"", b"null"])
+
+
+class PsmTableImporter(PeptideToTableImporter):
+    """
+    Streams the PSM and PEP sections of mzTab files or generic tab-separated
+    search engine outputs with a header line into a `PeptideTable`, without
+    converting them into a peptide file first. Only the sequence and protein
+    group columns of each row are split off, and the rows are deduplicated by
+    sequence while reading, so that the memory usage is bounded by the number
+    of unique peptides rather than by the number of rows.
+    The protein group of a peptide consists of all accessions it was reported
+    with, sorted and joined by ";". Peptides are ordered by their first row.
+    """
+
+    def __init__(
+        self,
+        min_peptide_length: int = 7,
+        file_format: Literal["mztab", "tsv"] = "tsv",
+        sequence_column: Union[str, None] = None,
+        protein_group_column: Union[str, None] = None,
+    ):
+        super(PsmTableImporter, self).__init__(min_peptide_length)
+        self.file_format: Literal["mztab", "tsv"] = file_format
+        self.sequence_column: Union[str, None] = sequence_column
+        self.protein_group_column: Union[str, None] = protein_group_column
+        # For each unique sequence, its first row and its accessions
+        self._peptides: Dict[bytes, Tuple[int, Set[bytes]]] = {}
+        self._number_of_rows: int = 0
+
+    def reset(self) -> None:
+        self._peptides = {}
+        self._number_of_rows = 0
+
+    @staticmethod
+    def _get_column_index(
+        column_names: List[str],
+        requested_column: Union[str, None],
+        candidate_columns: List[str],
+        required: bool,
+    ) -> Union[int, None]:
+        normalized_column_names = [
+            column_name.strip().strip('"').lower() for column_name in column_names
+        ]
+        for candidate_column in (
+            [requested_column] if requested_column is not None else candidate_columns
+        ):
+            if candidate_column.lower() in normalized_column_names:
+                return normalized_column_names.index(candidate_column.lower())
+        if requested_column is not None or required:
+            error_message = (
+                f"Could not find any of the columns "
+                f"{[requested_column] if requested_column else candidate_columns} "
+                f"in the header {column_names}."
+            )
+            logging.error(error_message)
+            raise ValueError(error_message)
+        return None
+
+    def _get_column_indexes(self, header_line: bytes) -> Tuple[int, Union[int, None]]:
+        column_names = (
+            header_line.rstrip(b"\r\n").decode("utf-8", errors="replace").split("\t")
+        )
+        if self.file_format == "mztab":
+            sequence_candidates = [MZTAB_SEQUENCE_COLUMN]
+            protein_group_candidates = [MZTAB_PROTEIN_GROUP_COLUMN]
+        else:
+            sequence_candidates = DEFAULT_SEQUENCE_COLUMNS
+            protein_group_candidates = DEFAULT_PROTEIN_GROUP_COLUMNS
+        return (
+            PsmTableImporter._get_column_index(
+                column_names, self.sequence_column, sequence_candidates, True
+            ),
+            PsmTableImporter._get_column_index(
+                column_names, self.protein_group_column, protein_group_candidates, False
+            ),
+        )
+
+    def _add_row(
+        self,
+        row: bytes,
+        sequence_index: int,
+        protein_group_index: Union[int, None],
+    ) -> None:
+        row_index = self._number_of_rows
+        self._number_of_rows += 1
+        last_column_index = max(
+            sequence_index,
+            protein_group_index if protein_group_index is not None else 0,
+        )
+        # Only split off the projected columns, the rest of the row stays joined
+        fields = row.rstrip(b"\r\n").split(b"\t", last_column_index + 1)
+        if len(fields) <= last_column_index:
+            return
+        sequence = fields[sequence_index].strip().strip(b'"')
+        if sequence in _NULL_VALUES:
+            return
+
+        peptide = self._peptides.get(sequence)
+        if peptide is None:
+            peptide = (row_index, set())
+            self._peptides[sequence] = peptide
+        if protein_group_index is not None:
+            for accession in fields[protein_group_index].strip(b'" ').split(b";"):
+                accession = accession.strip()
+                if accession not in _NULL_VALUES:
+                    peptide[1].add(accession)
+
+    def _read_rows(self, psm_file: BinaryIO) -> bool:
+        """
+        :returns Whether the file contains a protein group column.
+        """
+        column_indexes: Dict[bytes, Tuple[int, Union[int, None]]] = {}
+        contains_protein_groups = False
+        for line in psm_file:
+            if len(line.strip()) == 0:
+                continue
+            if self.file_format == "tsv":
+                # The first line is the header, all other lines are rows
+                row_prefix = b""
+                if len(column_indexes) == 0:
+                    column_indexes[row_prefix] = self._get_column_indexes(line)
+                    contains_protein_groups = column_indexes[row_prefix][1] is not None
+                    continue
+            else:
+                line_prefix = line[0:3]
+                if line_prefix in MZTAB_SECTIONS:
+                    column_indexes[MZTAB_SECTIONS[line_prefix]] = (
+                        self._get_column_indexes(line)
+                    )
+                    contains_protein_groups = True
+                    continue
+                if line_prefix not in column_indexes:
+                    # Metadata, protein or small molecule section
+                    continue
+                row_prefix = line_prefix
+            self._add_row(line, *column_indexes[row_prefix])
+        if len(column_indexes) == 0:
+            error_message = (
+                "Could not find a header line with a sequence column in the file."
+            )
+            logging.error(error_message)
+            raise ValueError(error_message)
+        return contains_protein_groups
+
+    def import_file(self, filepath: Path) -> PeptideTable:
+        """
+        Reads the unique peptides of the given PSM or peptide table.
+        :param Path filepath: The path to the file, which may be gzipped.
+        :rtype PeptideTable
+        raises ValueError: Raised if no sequence column could be found, or if
+        a given column name is not part of the header.
+        """
+        self.reset()
+        if filepath.name.endswith(".gz"):
+            with gzip.open(filepath, "rb") as psm_file:
+                contains_protein_groups = self._read_rows(psm_file)
+        else:
+            with open(filepath, "rb") as psm_file:
+                contains_protein_groups = self._read_rows(psm_file)
+        logging.info(
+            f"Read {len(self._peptides)} unique peptides "
+            f"from {self._number_of_rows} rows."
+        )
+
+        sequences = list(self._peptides.keys())
+        protein_groups: List[bytes] = []
+        for sequence, (_, accessions) in self._peptides.items():
+            if len(accessions) == 0:
+                # Peptides without any accession form their own group
+                protein_groups.append(b"\t" + sequence)
+            else:
+                protein_groups.append(b";".join(sorted(accessions)))
+        original_ids = np.array(
+            [row_index for row_index, _ in self._peptides.values()], dtype=np.int64
+        )
+        self.reset()
+        return self._create_peptide_table(
+            sequences,
+            protein_groups if contains_protein_groups else None,
+            original_ids,
+        )
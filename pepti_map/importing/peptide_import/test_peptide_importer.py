@@ -1,12 +1,28 @@
+import gzip
+import os
 from pathlib import Path
 from unittest.mock import patch, mock_open
+import numpy as np
 import pandas as pd
 import pytest
 
+from pepti_map.importing.peptide_import.parallel_index_builder import (
+    encode_kmers_in_parallel,
+    get_shard_boundaries,
+)
 from pepti_map.importing.peptide_import.peptide_importer import PeptideImporter
+from pepti_map.importing.peptide_import.peptide_index_cache import (
+    PeptideIndexCache,
+    parse_size,
+)
+from pepti_map.importing.peptide_import.peptide_index_store import PeptideIndexStore
 from pepti_map.importing.peptide_import.peptide_to_index_importer import (
     PeptideToIndexImporter,
 )
+from pepti_map.importing.peptide_import.peptide_to_table_importer import (
+    PeptideToTableImporter,
+)
+from pepti_map.importing.peptide_import.psm_table_importer import PsmTableImporter
 from pepti_map.importing.peptide_import.testdata_peptide_importer import (
     EXPECTED_PEPTIDE_MAPPING,
     EXPECTED_PEPTIDE_MAPPING_PROTEIN_GROUPS,
@@ -14,8 +30,16 @@ from pepti_map.importing.peptide_import.testdata_peptide_importer import (
     EXPECTED_RESULT_INDEX_ISOLEUCINE_REPLACED,
     EXPECTED_RESULT_LIST,
     MOCK_FILE_CONTENT,
+    MZTAB_MOCK_FILE_CONTENT,
     PROTEIN_GROUPS_MOCK_FILE_CONTENT,
+    TSV_MOCK_FILE_CONTENT,
 )
+from pepti_map.main import _create_matching_engine
+from pepti_map.peptide_data.array_peptide_kmer_index import ArrayPeptideKmerIndex
+from pepti_map.peptide_data.duplicate_peptide_mapping import DuplicatePeptideMapping
+from pepti_map.peptide_data.kmer_index_statistics import KmerIndexStatistics
+from pepti_map.peptide_data.peptide_index_delta import PeptideIndexDelta
+from pepti_map.peptide_data.peptide_table import PeptideTable
 
 
 class TestPeptideSimpleFormatImport:
@@ -75,3 +99,674 @@ class TestPeptideToIndexImporter:
         mock_write_peptide_to_cluster_mapping_file.assert_called_once_with(
             EXPECTED_PEPTIDE_MAPPING_PROTEIN_GROUPS
         )
+
+    @patch("builtins.open", mock_open(read_data=MOCK_FILE_CONTENT))
+    @patch(
+        (
+            "pepti_map.importing.peptide_import.peptide_to_index_importer"
+            ".PeptideToIndexImporter._write_peptide_to_cluster_mapping_file"
+        )
+    )
+    def test_import_file_to_array_index(
+        self, mock_write_peptide_to_cluster_mapping_file
+    ):
+        resulting_index, _ = PeptideToIndexImporter(
+            index_type="array"
+        ).import_file_to_index(Path("path/to/file"))
+        assert isinstance(resulting_index, ArrayPeptideKmerIndex)
+        assert (
+            dict(resulting_index.items()) == EXPECTED_RESULT_INDEX_ISOLEUCINE_REPLACED
+        )
+        assert resulting_index.number_of_peptides == 7
+        mock_write_peptide_to_cluster_mapping_file.assert_called_once_with(
+            EXPECTED_PEPTIDE_MAPPING
+        )
+
+    @pytest.mark.parametrize("index_type", ["dict", "array"])
+    @patch("builtins.open", mock_open(read_data=MOCK_FILE_CONTENT))
+    @patch(
+        (
+            "pepti_map.importing.peptide_import.peptide_to_index_importer"
+            ".PeptideToIndexImporter._write_peptide_to_cluster_mapping_file"
+        )
+    )
+    def test_import_file_to_masked_index(
+        self, mock_write_peptide_to_cluster_mapping_file, index_type
+    ):
+        resulting_index, _ = PeptideToIndexImporter(
+            index_type=index_type,
+            max_postings_length=1,
+            kmer_stop_list=["NCYQKAQ", "FNQGV"],
+        ).import_file_to_index(Path("path/to/file"))
+        expected_index = {
+            kmer: entry
+            for kmer, entry in EXPECTED_RESULT_INDEX_ISOLEUCINE_REPLACED.items()
+            if len(entry) <= 1 and kmer != "NCYQKAQ"
+        }
+        assert len(expected_index) < len(EXPECTED_RESULT_INDEX_ISOLEUCINE_REPLACED)
+        for kmer, entry in EXPECTED_RESULT_INDEX_ISOLEUCINE_REPLACED.items():
+            expected_entry = expected_index.get(kmer, [])
+            assert list(resulting_index.getEntryForKmer(kmer)) == expected_entry
+
+    @pytest.mark.parametrize(
+        "file_content,min_peptide_length,expected_mapping,expected_n_clusters",
+        [
+            (MOCK_FILE_CONTENT, None, EXPECTED_PEPTIDE_MAPPING, 7),
+            (
+                PROTEIN_GROUPS_MOCK_FILE_CONTENT,
+                None,
+                EXPECTED_PEPTIDE_MAPPING_PROTEIN_GROUPS,
+                5,
+            ),
+            (MOCK_FILE_CONTENT, 5, list(range(0, 10)), 10),
+            (
+                PROTEIN_GROUPS_MOCK_FILE_CONTENT,
+                5,
+                [0, 1, 2, 2, 3, 3, 4, 3, 5, 1],
+                6,
+            ),
+        ],
+        ids=["simple", "protein_groups", "simple_short", "protein_groups_short"],
+    )
+    @patch(
+        (
+            "pepti_map.importing.peptide_import.peptide_to_index_importer"
+            ".PeptideToIndexImporter._write_peptide_to_cluster_mapping_file"
+        )
+    )
+    def test_import_file_to_cluster_mapping(
+        self,
+        mock_write_peptide_to_cluster_mapping_file,
+        tmp_path,
+        file_content,
+        min_peptide_length,
+        expected_mapping,
+        expected_n_clusters,
+    ):
+        peptide_file = tmp_path / "peptides.txt"
+        with open(peptide_file, "wt", encoding="utf-8") as file:
+            file.write(file_content)
+        importer = PeptideToIndexImporter(min_peptide_length=min_peptide_length)
+        peptide_table = PeptideToTableImporter(
+            min_peptide_length if min_peptide_length is not None else 7
+        ).import_file(peptide_file)
+        kmer_index, index_mapping = importer.import_file_to_index(peptide_file)
+        _, table_index_mapping = importer.import_file_to_index(
+            peptide_file, peptide_table=peptide_table
+        )
+        assert peptide_table.get_peptide_to_cluster_mapping() == expected_mapping
+        assert index_mapping == expected_mapping
+        assert table_index_mapping == expected_mapping
+        assert peptide_table.number_of_clusters == expected_n_clusters
+        assert kmer_index.number_of_peptides == expected_n_clusters
+
+    @pytest.mark.parametrize("index_type", ["dict", "array"])
+    @patch(
+        (
+            "pepti_map.importing.peptide_import.peptide_to_index_importer"
+            ".PeptideToIndexImporter._write_peptide_to_cluster_mapping_file"
+        )
+    )
+    def test_import_peptide_table_to_index(
+        self, mock_write_peptide_to_cluster_mapping_file, tmp_path, index_type
+    ):
+        peptide_file = tmp_path / "peptides.txt"
+        with open(peptide_file, "wt", encoding="utf-8") as file:
+            file.write(MOCK_FILE_CONTENT)
+        peptide_table = PeptideToTableImporter().import_file(peptide_file)
+        resulting_index, resulting_mapping = PeptideToIndexImporter(
+            index_type=index_type
+        ).import_file_to_index(peptide_file, peptide_table=peptide_table)
+        assert resulting_mapping == EXPECTED_PEPTIDE_MAPPING
+        assert resulting_index.number_of_peptides == 7
+        for kmer, entry in EXPECTED_RESULT_INDEX_ISOLEUCINE_REPLACED.items():
+            assert list(resulting_index.getEntryForKmer(kmer)) == entry
+
+    @pytest.mark.parametrize("index_type", ["dict", "array"])
+    @patch("builtins.open", mock_open(read_data=MOCK_FILE_CONTENT))
+    @patch(
+        (
+            "pepti_map.importing.peptide_import.peptide_to_index_importer"
+            ".PeptideToIndexImporter._write_peptide_to_cluster_mapping_file"
+        )
+    )
+    def test_import_file_to_minimizer_index(
+        self, mock_write_peptide_to_cluster_mapping_file, index_type
+    ):
+        resulting_index, _ = PeptideToIndexImporter(
+            index_type=index_type, minimizer_window=5
+        ).import_file_to_index(Path("path/to/file"))
+        assert resulting_index.minimizer_window == 5
+        postings_lengths = resulting_index.get_postings_lengths()
+        assert (
+            0
+            < postings_lengths.sum()
+            < 0.5
+            * sum(
+                [
+                    len(entry)
+                    for entry in EXPECTED_RESULT_INDEX_ISOLEUCINE_REPLACED.values()
+                ]
+            )
+        )
+        for kmer in resulting_index.get_kmers_at(range(0, len(postings_lengths))):
+            assert set(resulting_index.getEntryForKmer(kmer)) <= set(
+                EXPECTED_RESULT_INDEX_ISOLEUCINE_REPLACED[kmer]
+            )
+
+
+class TestPeptideTable:
+    def test_import_and_memory_mapped_roundtrip(self, tmp_path):
+        peptide_file = tmp_path / "peptides.txt"
+        with open(peptide_file, "wt", encoding="utf-8") as file:
+            file.write(MOCK_FILE_CONTENT)
+        peptide_table = PeptideToTableImporter().import_file(peptide_file)
+        assert not PeptideTable.exists(tmp_path / "table")
+        peptide_table.save(tmp_path / "table")
+        assert PeptideTable.exists(tmp_path / "table")
+        loaded_table = PeptideTable.load(tmp_path / "table")
+        assert isinstance(loaded_table.sequences, np.memmap)
+        assert len(loaded_table) == len(EXPECTED_RESULT_LIST)
+        assert loaded_table.get_sequences() == EXPECTED_RESULT_LIST
+        assert loaded_table.get_normalized_sequences() == [
+            sequence.replace("I", "L") for sequence in EXPECTED_RESULT_LIST
+        ]
+        assert loaded_table.get_sequence(3) == EXPECTED_RESULT_LIST[3]
+        assert loaded_table.lengths.tolist() == [
+            len(sequence) for sequence in EXPECTED_RESULT_LIST
+        ]
+        assert loaded_table.original_ids.tolist() == list(
+            range(0, len(EXPECTED_RESULT_LIST))
+        )
+        assert loaded_table.get_peptide_to_cluster_mapping() == EXPECTED_PEPTIDE_MAPPING
+        assert loaded_table.number_of_clusters == 7
+
+    @pytest.mark.parametrize(
+        "file_content, expected_mapping",
+        [
+            (MOCK_FILE_CONTENT, EXPECTED_PEPTIDE_MAPPING),
+            (PROTEIN_GROUPS_MOCK_FILE_CONTENT, EXPECTED_PEPTIDE_MAPPING_PROTEIN_GROUPS),
+        ],
+        ids=["simple", "protein_groups"],
+    )
+    def test_import_gzipped_file(self, tmp_path, file_content, expected_mapping):
+        peptide_file = tmp_path / "peptides.txt"
+        with open(peptide_file, "wt", encoding="utf-8") as file:
+            file.write(file_content)
+        with gzip.open(tmp_path / "peptides.txt.gz", "wt", encoding="utf-8") as file:
+            file.write(file_content)
+        peptide_table = PeptideToTableImporter().import_file(peptide_file)
+        gzipped_peptide_table = PeptideToTableImporter().import_file(
+            tmp_path / "peptides.txt.gz"
+        )
+        assert gzipped_peptide_table.get_sequences() == peptide_table.get_sequences()
+        assert gzipped_peptide_table.get_peptide_to_cluster_mapping() == (
+            expected_mapping
+        )
+        assert peptide_table.get_peptide_to_cluster_mapping() == expected_mapping
+
+
+class TestDeduplicatePeptides:
+    @pytest.mark.parametrize("index_type", ["dict", "array"])
+    @patch(
+        (
+            "pepti_map.importing.peptide_import.peptide_to_index_importer"
+            ".PeptideToIndexImporter._write_peptide_to_cluster_mapping_file"
+        )
+    )
+    def test_index_only_contains_canonical_peptides(
+        self, mock_write_peptide_to_cluster_mapping_file, tmp_path, index_type
+    ):
+        peptide_file = tmp_path / "peptides.txt"
+        with open(peptide_file, "wt", encoding="utf-8") as file:
+            file.write(MOCK_FILE_CONTENT)
+        peptide_table = PeptideToTableImporter().import_file(peptide_file)
+        duplicate_peptide_mapping = DuplicatePeptideMapping.from_peptide_table(
+            peptide_table
+        )
+        assert duplicate_peptide_mapping.canonical_peptide_ids == [
+            0, 1, 2, 3, 4, 5, 6, 7, 4, 9
+        ]  # fmt: skip
+        assert duplicate_peptide_mapping.get_number_of_duplicates() == 1
+        assert duplicate_peptide_mapping.get_multiplicity(8) == 2
+        assert duplicate_peptide_mapping.get_multiplicity(9) == 1
+        assert duplicate_peptide_mapping.expand_clusters([4], set([2])) == set([2, 5])
+
+        resulting_index, resulting_mapping = PeptideToIndexImporter(
+            index_type=index_type, deduplicate_peptides=True
+        ).import_file_to_index(peptide_file)
+        assert resulting_mapping == EXPECTED_PEPTIDE_MAPPING
+        for kmer, entry in EXPECTED_RESULT_INDEX_ISOLEUCINE_REPLACED.items():
+            assert list(resulting_index.getEntryForKmer(kmer)) == [
+                peptide_id for peptide_id in entry if peptide_id != 8
+            ]
+
+
+class TestAppendToIndex:
+    @pytest.fixture(autouse=True)
+    def _init_peptide_files(self, tmp_path):
+        self.peptide_files = [tmp_path / "peptides1.txt", tmp_path / "peptides2.txt"]
+        peptides = MOCK_FILE_CONTENT.split("\n")
+        for peptide_file, file_peptides in zip(
+            self.peptide_files, [peptides[0:6], peptides[6:]]
+        ):
+            with open(peptide_file, "wt", encoding="utf-8") as file:
+                file.write("\n".join(file_peptides))
+
+    @pytest.mark.parametrize("index_type", ["dict", "array"])
+    @patch(
+        (
+            "pepti_map.importing.peptide_import.peptide_to_index_importer"
+            ".PeptideToIndexImporter._write_peptide_to_cluster_mapping_file"
+        )
+    )
+    def test_append_peptide_table_to_index(
+        self, mock_write_peptide_to_cluster_mapping_file, index_type
+    ):
+        importer = PeptideToIndexImporter(index_type=index_type)
+        peptide_table = PeptideToTableImporter().import_file(self.peptide_files[0])
+        kmer_index, _ = importer.import_file_to_index(
+            self.peptide_files[0], peptide_table=peptide_table, finalize=False
+        )
+        combined_peptide_table, peptide_to_cluster_mapping, delta = (
+            importer.append_peptide_table_to_index(
+                kmer_index,
+                peptide_table,
+                PeptideToTableImporter().import_file(self.peptide_files[1]),
+                peptide_files=[self.peptide_files[1].as_posix()],
+            )
+        )
+        assert combined_peptide_table.get_sequences() == EXPECTED_RESULT_LIST
+        assert peptide_to_cluster_mapping == EXPECTED_PEPTIDE_MAPPING
+        assert kmer_index.number_of_peptides == 7
+        for kmer, entry in EXPECTED_RESULT_INDEX_ISOLEUCINE_REPLACED.items():
+            assert list(kmer_index.getEntryForKmer(kmer)) == entry
+
+        assert list(delta.get_new_peptide_ids()) == [6, 7, 8, 9]
+        assert list(delta.get_new_cluster_ids()) == [4, 5, 6]
+        assert set(delta.changed_kmers) == set(
+            [
+                kmer
+                for kmer, entry in EXPECTED_RESULT_INDEX_ISOLEUCINE_REPLACED.items()
+                if max(entry) >= 6
+            ]
+        )
+        assert delta.peptide_files == [self.peptide_files[1].as_posix()]
+
+    @pytest.mark.parametrize("index_type", ["dict", "array"])
+    @patch(
+        (
+            "pepti_map.importing.peptide_import.peptide_to_index_importer"
+            ".PeptideToIndexImporter._write_peptide_to_cluster_mapping_file"
+        )
+    )
+    def test_index_store_reuses_index_of_first_files(
+        self, mock_write_peptide_to_cluster_mapping_file, tmp_path, index_type
+    ):
+        importer = PeptideToIndexImporter(index_type=index_type)
+        peptide_table = PeptideToTableImporter().import_file(self.peptide_files[0])
+        kmer_index, _ = importer.import_file_to_index(
+            self.peptide_files[0], peptide_table=peptide_table, finalize=False
+        )
+        settings = {"index_type": index_type, "kmer_length": 7, "minimizer_window": 1}
+        index_store = PeptideIndexStore(tmp_path / "store")
+        index_store.store(
+            kmer_index, peptide_table, [self.peptide_files[0].as_posix()], settings
+        )
+        peptide_files = [peptide_file.as_posix() for peptide_file in self.peptide_files]
+
+        stored_index = index_store.load(peptide_files, settings)
+        assert stored_index is not None
+        stored_kmer_index, stored_peptide_table, number_of_stored_files = stored_index
+        assert number_of_stored_files == 1
+        assert stored_peptide_table.get_sequences() == peptide_table.get_sequences()
+        assert list(stored_kmer_index.getEntryForKmer("NCYQKAQ")) == [1]
+        assert index_store.load(peptide_files[1:], settings) is None
+        assert index_store.load(peptide_files, {**settings, "kmer_length": 8}) is None
+
+    @pytest.mark.parametrize("preview", [False, True])
+    @patch(
+        (
+            "pepti_map.importing.peptide_import.peptide_to_index_importer"
+            ".PeptideToIndexImporter._write_peptide_to_cluster_mapping_file"
+        )
+    )
+    def test_preview_does_not_write_files(
+        self, mock_write_peptide_to_cluster_mapping_file, tmp_path, preview
+    ):
+        delta_path = tmp_path / "peptide_index_delta.json"
+        with patch("pepti_map.main.dotenv_values", return_value={}), patch(
+            "pepti_map.main.PATH_TO_PEPTIDE_INDEX_DELTA", delta_path
+        ):
+            _, peptide_table, _ = _create_matching_engine(
+                [peptide_file.as_posix() for peptide_file in self.peptide_files],
+                "plain",
+                None,
+                None,
+                (tmp_path / "store").as_posix(),
+                7,
+                "kmer",
+                "array",
+                False,
+                None,
+                None,
+                None,
+                False,
+                1,
+                1,
+                False,
+                preview,
+            )
+        assert peptide_table.get_sequences() == EXPECTED_RESULT_LIST
+        assert mock_write_peptide_to_cluster_mapping_file.called != preview
+        assert delta_path.exists() != preview
+        assert (tmp_path / "store" / "manifest.json").exists() != preview
+
+
+class TestPeptideIndexDelta:
+    def test_combine_save_and_load(self, tmp_path):
+        delta = PeptideIndexDelta(
+            5, 2, 3, 1, ["AAAAAAA", "CCCCCCC"], ["a.txt"]
+        ).combine(PeptideIndexDelta(7, 3, 4, 3, ["CCCCCCC", "DDDDDDD"], ["b.txt"]))
+        delta.save(tmp_path / "delta.json")
+        loaded_delta = PeptideIndexDelta.load(tmp_path / "delta.json")
+        assert list(loaded_delta.get_new_peptide_ids()) == [5, 6, 7, 8, 9]
+        assert list(loaded_delta.get_new_cluster_ids()) == [3, 4, 5, 6]
+        assert loaded_delta.changed_kmers == ["AAAAAAA", "CCCCCCC", "DDDDDDD"]
+        assert loaded_delta.peptide_files == ["a.txt", "b.txt"]
+
+
+class TestPsmTableImporter:
+    def test_import_mztab(self, tmp_path):
+        psm_file = tmp_path / "psms.mzTab"
+        with open(psm_file, "wt", encoding="utf-8") as file:
+            file.write(MZTAB_MOCK_FILE_CONTENT)
+        peptide_table = PsmTableImporter(file_format="mztab").import_file(psm_file)
+        assert peptide_table.get_sequences() == [
+            EXPECTED_RESULT_LIST[1],
+            EXPECTED_RESULT_LIST[5],
+            EXPECTED_RESULT_LIST[4],
+            EXPECTED_RESULT_LIST[7],
+            EXPECTED_RESULT_LIST[9],
+        ]
+        assert peptide_table.original_ids.tolist() == [0, 1, 2, 4, 6]
+        # FNQGVRDQR and YCYRSEDLLK... were both reported with p4 and p5
+        assert peptide_table.get_peptide_to_cluster_mapping() == [0, 1, 1, -1, 0]
+
+    def test_import_gzipped_tsv_with_column_projection(self, tmp_path):
+        psm_file = tmp_path / "psms.tsv.gz"
+        with gzip.open(psm_file, "wt", encoding="utf-8") as file:
+            file.write(TSV_MOCK_FILE_CONTENT)
+        peptide_table = PsmTableImporter().import_file(psm_file)
+        assert peptide_table.get_sequences() == [
+            EXPECTED_RESULT_LIST[5],
+            EXPECTED_RESULT_LIST[3],
+            EXPECTED_RESULT_LIST[6],
+        ]
+        assert peptide_table.get_peptide_to_cluster_mapping() == [0, 1, 2]
+        assert peptide_table.original_ids.tolist() == [0, 1, 3]
+        peptide_table = PsmTableImporter(
+            sequence_column="peptide", protein_group_column="Charge"
+        ).import_file(psm_file)
+        # FNQGVRDQR was reported with charges 2 and 3
+        assert peptide_table.get_peptide_to_cluster_mapping() == [0, 1, 2]
+        assert peptide_table.number_of_clusters == 3
+
+    @pytest.mark.parametrize("index_type", ["dict", "array"])
+    @patch(
+        (
+            "pepti_map.importing.peptide_import.peptide_to_index_importer"
+            ".PeptideToIndexImporter._write_peptide_to_cluster_mapping_file"
+        )
+    )
+    def test_import_gzipped_tsv_to_index(
+        self, mock_write_peptide_to_cluster_mapping_file, tmp_path, index_type
+    ):
+        psm_file = tmp_path / "psms.tsv.gz"
+        with gzip.open(psm_file, "wt", encoding="utf-8") as file:
+            file.write(TSV_MOCK_FILE_CONTENT)
+        peptide_table = PsmTableImporter().import_file(psm_file)
+        resulting_index, resulting_mapping = PeptideToIndexImporter(
+            index_type=index_type, n_processes=2
+        ).import_file_to_index(psm_file, peptide_table=peptide_table)
+        assert resulting_mapping == [0, 1, 2]
+        assert resulting_index.number_of_peptides == 3
+        assert list(resulting_index.getEntryForKmer(EXPECTED_RESULT_LIST[3][0:7])) == [
+            1
+        ]
+
+    def test_missing_columns(self, tmp_path):
+        psm_file = tmp_path / "psms.tsv"
+        with open(psm_file, "wt", encoding="utf-8") as file:
+            file.write(TSV_MOCK_FILE_CONTENT)
+        with pytest.raises(ValueError):
+            PsmTableImporter(protein_group_column="Protein group").import_file(psm_file)
+        with pytest.raises(ValueError):
+            PsmTableImporter(file_format="mztab").import_file(psm_file)
+
+
+class TestKmerIndexStatistics:
+    def test_statistics(self):
+        kmer_index = ArrayPeptideKmerIndex()
+        kmer_index.extendEntryForKmer("EEEEEEE", [0, 1, 2, 3, 4])
+        kmer_index.extendEntryForKmer("KKKKKKK", [1, 2])
+        kmer_index.extendEntryForKmer("NCYQKAQ", [3])
+        statistics = KmerIndexStatistics.from_index(kmer_index, 2)
+        assert statistics.number_of_kmers == 3
+        assert statistics.total_postings == 8
+        assert statistics.postings_length_histogram == [1, 1, 1]
+        assert statistics.top_kmers == [("EEEEEEE", 5), ("KKKKKKK", 2)]
+        assert statistics.estimated_memory_usage == 3 * 8 + 4 * 8 + 8 * 4
+        assert "EEEEEEE: 5" in statistics.get_report()
+
+
+class TestPeptideIndexCache:
+    @pytest.fixture(autouse=True)
+    def _init_peptide_file(self, tmp_path):
+        self.peptide_file = tmp_path / "peptides.txt"
+        with open(self.peptide_file, "wt", encoding="utf-8") as peptide_file:
+            peptide_file.write(MOCK_FILE_CONTENT)
+        self.mapping_file = tmp_path / "peptide_to_cluster_mapping.txt"
+
+    def test_parse_size(self):
+        assert parse_size("512") == 512
+        assert parse_size("10k") == 10240
+        assert parse_size("1.5G") == 3 * (1 << 29)
+
+    def test_key_depends_on_settings(self):
+        key = PeptideIndexCache.compute_key(self.peptide_file, 7, True, False)
+        assert key == PeptideIndexCache.compute_key(self.peptide_file, 7, True, False)
+        assert key != PeptideIndexCache.compute_key(self.peptide_file, 8, True, False)
+        assert key != PeptideIndexCache.compute_key(self.peptide_file, 7, False, False)
+        assert key != PeptideIndexCache.compute_key(self.peptide_file, 7, True, True)
+        assert key != PeptideIndexCache.compute_key(
+            self.peptide_file, 7, True, False, deduplicate_peptides=True
+        )
+
+    def test_import_uses_cached_index(self, tmp_path):
+        index_cache = PeptideIndexCache(tmp_path / "cache", 1 << 20)
+        importer = PeptideToIndexImporter(index_type="array", index_cache=index_cache)
+        with patch(
+            (
+                "pepti_map.importing.peptide_import.peptide_to_index_importer"
+                ".PeptideToIndexImporter._process_simple_peptide_file"
+            ),
+            wraps=importer._process_simple_peptide_file,
+        ) as process_mock, patch(
+            (
+                "pepti_map.importing.peptide_import.peptide_to_index_importer"
+                ".PeptideToIndexImporter._write_peptide_to_cluster_mapping_file"
+            )
+        ) as mock_write_peptide_to_cluster_mapping_file:
+            for _ in range(2):
+                resulting_index, peptide_to_cluster_mapping = (
+                    importer.import_file_to_index(self.peptide_file)
+                )
+                assert (
+                    dict(resulting_index.items())
+                    == EXPECTED_RESULT_INDEX_ISOLEUCINE_REPLACED
+                )
+                assert resulting_index.number_of_peptides == 7
+                assert peptide_to_cluster_mapping == EXPECTED_PEPTIDE_MAPPING
+            process_mock.assert_called_once()
+            assert mock_write_peptide_to_cluster_mapping_file.call_count == 2
+
+    def test_import_with_deduplication_uses_cached_index(self, tmp_path):
+        index_cache = PeptideIndexCache(tmp_path / "cache", 1 << 20)
+        importer = PeptideToIndexImporter(
+            index_type="array", index_cache=index_cache, deduplicate_peptides=True
+        )
+        with patch(
+            (
+                "pepti_map.importing.peptide_import.peptide_to_index_importer"
+                ".PeptideToIndexImporter._process_peptide_table"
+            ),
+            wraps=importer._process_peptide_table,
+        ) as process_mock, patch(
+            (
+                "pepti_map.importing.peptide_import.peptide_to_index_importer"
+                ".PeptideToIndexImporter._write_peptide_to_cluster_mapping_file"
+            )
+        ):
+            for _ in range(2):
+                resulting_index, _ = importer.import_file_to_index(self.peptide_file)
+                assert 8 not in resulting_index.getEntryForKmer("YCYRSED")
+            process_mock.assert_called_once()
+            # The cached index without deduplication is a different entry
+            resulting_index, _ = PeptideToIndexImporter(
+                index_type="array", index_cache=index_cache
+            ).import_file_to_index(self.peptide_file)
+            assert 8 in resulting_index.getEntryForKmer("YCYRSED")
+
+    def test_evicts_least_recently_used_entries(self, tmp_path):
+        kmer_index = ArrayPeptideKmerIndex()
+        for kmer, entry in EXPECTED_RESULT_INDEX_ISOLEUCINE_REPLACED.items():
+            kmer_index.extendEntryForKmer(kmer, entry)
+        index_cache = PeptideIndexCache(tmp_path / "cache", 1 << 20)
+        index_cache.store("first", kmer_index, EXPECTED_PEPTIDE_MAPPING)
+        entry_size = (tmp_path / "cache" / "first.idx").stat().st_size
+        os.utime(tmp_path / "cache" / "first.idx", (0, 0))
+
+        index_cache = PeptideIndexCache(tmp_path / "cache", entry_size * 2)
+        index_cache.store("second", kmer_index, EXPECTED_PEPTIDE_MAPPING)
+        os.utime(tmp_path / "cache" / "second.idx", (1, 1))
+        assert index_cache.load("first") is not None
+        index_cache.store("third", kmer_index, EXPECTED_PEPTIDE_MAPPING)
+
+        assert index_cache.load("second") is None
+        assert index_cache.load("first") is not None
+        assert index_cache.load("third") is not None
+
+
+class TestParallelIndexBuild:
+    @pytest.mark.parametrize(
+        "file_content",
+        [
+            "\n".join([MOCK_FILE_CONTENT, "", MOCK_FILE_CONTENT.lower()[0:5]] * 5),
+            "\n".join([PROTEIN_GROUPS_MOCK_FILE_CONTENT] * 5),
+        ],
+        ids=["simple", "protein_groups"],
+    )
+    @pytest.mark.parametrize("minimizer_window", [1, 3])
+    @patch(
+        (
+            "pepti_map.importing.peptide_import.peptide_to_index_importer"
+            ".PeptideToIndexImporter._write_peptide_to_cluster_mapping_file"
+        )
+    )
+    def test_parallel_build_is_identical_to_serial_build(
+        self,
+        mock_write_peptide_to_cluster_mapping_file,
+        minimizer_window,
+        file_content,
+        tmp_path,
+    ):
+        peptide_filepath = tmp_path / "peptides.txt"
+        with open(peptide_filepath, "wt", encoding="utf-8") as peptide_file:
+            peptide_file.write(file_content + "\n")
+
+        serial_index, serial_mapping = PeptideToIndexImporter(
+            index_type="array", minimizer_window=minimizer_window
+        ).import_file_to_index(peptide_filepath)
+        parallel_index, parallel_mapping = PeptideToIndexImporter(
+            index_type="array", n_processes=3, minimizer_window=minimizer_window
+        ).import_file_to_index(peptide_filepath)
+
+        assert isinstance(serial_index, ArrayPeptideKmerIndex)
+        assert isinstance(parallel_index, ArrayPeptideKmerIndex)
+        np.testing.assert_array_equal(parallel_index.codes, serial_index.codes)
+        np.testing.assert_array_equal(parallel_index.offsets, serial_index.offsets)
+        np.testing.assert_array_equal(parallel_index.postings, serial_index.postings)
+        assert parallel_mapping == serial_mapping
+        assert parallel_index.number_of_peptides == serial_index.number_of_peptides
+        assert parallel_index.minimizer_window == minimizer_window
+        mock_write_peptide_to_cluster_mapping_file.assert_called_with(serial_mapping)
+
+    @pytest.mark.parametrize("minimizer_window", [1, 3])
+    @patch(
+        (
+            "pepti_map.importing.peptide_import.peptide_to_index_importer"
+            ".PeptideToIndexImporter._write_peptide_to_cluster_mapping_file"
+        )
+    )
+    def test_matching_engine_builds_index_from_table_in_parallel(
+        self, mock_write_peptide_to_cluster_mapping_file, minimizer_window, tmp_path
+    ):
+        peptide_filepath = tmp_path / "peptides.txt"
+        with open(peptide_filepath, "wt", encoding="utf-8") as peptide_file:
+            peptide_file.write("\n".join([MOCK_FILE_CONTENT] * 5) + "\n")
+        serial_index, _ = PeptideToIndexImporter(
+            index_type="array", minimizer_window=minimizer_window
+        ).import_file_to_index(peptide_filepath)
+
+        with patch(
+            "pepti_map.main.dotenv_values", return_value={"INDEX_N_PROCESSES": "2"}
+        ), patch(
+            "pepti_map.main.PATH_TO_PEPTIDE_INDEX_DELTA",
+            tmp_path / "peptide_index_delta.json",
+        ), patch(
+            (
+                "pepti_map.importing.peptide_import.peptide_to_index_importer"
+                ".encode_kmers_in_parallel"
+            ),
+            wraps=encode_kmers_in_parallel,
+        ) as encode_mock:
+            matching_engine, _, _ = _create_matching_engine(
+                [peptide_filepath.as_posix()],
+                "plain",
+                None,
+                None,
+                None,
+                7,
+                "kmer",
+                "array",
+                False,
+                None,
+                None,
+                None,
+                False,
+                minimizer_window,
+                1,
+                False,
+                False,
+            )
+        encode_mock.assert_called_once()
+        assert encode_mock.call_args.args[3] == 2
+        parallel_index = matching_engine._kmer_index
+        assert isinstance(parallel_index, ArrayPeptideKmerIndex)
+        np.testing.assert_array_equal(parallel_index.codes, serial_index.codes)
+        np.testing.assert_array_equal(parallel_index.offsets, serial_index.offsets)
+        np.testing.assert_array_equal(parallel_index.postings, serial_index.postings)
+        assert parallel_index.minimizer_window == minimizer_window
+
+    def test_shard_boundaries_start_at_lines(self, tmp_path):
+        peptide_filepath = tmp_path / "peptides.txt"
+        with open(peptide_filepath, "wt", encoding="utf-8") as peptide_file:
+            peptide_file.write(MOCK_FILE_CONTENT)
+        boundaries = get_shard_boundaries(peptide_filepath, 4)
+        with open(peptide_filepath, "rb") as peptide_file:
+            content = peptide_file.read()
+        assert boundaries[0] == 0
+        assert boundaries[-1] == len(content)
+        for boundary in boundaries[1:-1]:
+            assert content[boundary - 1 : boundary] == b"\n"  # noqa: E203
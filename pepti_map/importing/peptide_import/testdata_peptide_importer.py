@@ -391,3 +391,25 @@ EXPECTED_RESULT_INDEX_PROTEIN_GROUPS_ISOLEUCINE_REPLACED = dict(
 
 EXPECTED_PEPTIDE_MAPPING = [-1, 0, -1, 1, 2, 3, 4, -1, 5, 6]
 EXPECTED_PEPTIDE_MAPPING_PROTEIN_GROUPS = [-1, 0, -1, 1, 2, 2, 3, -1, 4, 0]
+
+MZTAB_MOCK_FILE_CONTENT = """MTD\tmzTab-version\t1.0.0
+MTD\tmzTab-mode\tSummary
+
+PRH\taccession\tdescription
+PRT\tp2\tnull
+PSH\tsequence\tPSM_ID\taccession\tunique\tdatabase
+PSM\tNCYQKAQHLYTPEGRKGMVHLTWDRTVLPPPCMDIVDRHRSSRY\t1\tp2\t1\tnull
+PSM\tFNQGVRDQR\t2\tp4\t0\tnull
+PSM\tYCYRSEDLLKISQQCARHRKAQPWETYVCIRTFTPHTMMHE\t3\tp5\t0\tnull
+PSM\tFNQGVRDQR\t4\tp5\t0\tnull
+PSM\tSHDTY\t5\tnull\t0\tnull
+PSM\tYCYRSEDLLKISQQCARHRKAQPWETYVCIRTFTPHTMMHE\t6\tp4\t0\tnull
+PEH\taccession\tsequence\tunique
+PEP\tp2\tFMRPCQFFHCWMFSMDDH\t1
+PEP\tp5;p4\tFNQGVRDQR\t0"""
+
+TSV_MOCK_FILE_CONTENT = """Scan\tPeptide\tCharge\tProteins\tScore
+1\tFNQGVRDQR\t2\tp4;p5\t10.2
+2\tLSVRCEVQCHWDYDLPVMRHKTFLAPCHTWM\t3\tp10\t8.1
+3\tFNQGVRDQR\t3\tp5;p4\t9.0
+4\tISNVGQYSQMLSEFEFCKKVYCSCEFDVDRGSQICSDDHVWSPKKSPKMC\t2\t\t7.7"""
@@ -1,17 +1,60 @@
 import gzip
 import logging
 from pathlib import Path
-from typing import List, TextIO, Tuple, Union
+from typing import BinaryIO, Iterator, List, Tuple, Union
+import numpy as np
+import numpy.typing as npt
 
-from Bio.Seq import MutableSeq
+from pepti_map.importing.rna_import.threaded_gzip_reader import ThreadedGzipReader
+from pepti_map.util.read_id import MAX_NUMBER_OF_LANES, encode_read_ids_of_records
 
 # TODO: Refactor to use pyfastx?
 
+# Complements of all IUPAC nucleotide codes, as used for the reverse complement
+_COMPLEMENT_TABLE = bytes.maketrans(
+    b"ACGTUMRWSYKVHDBNacgtumrwsykvhdbn", b"TGCAAKYWSRMBDHVNtgcaakywsrmbdhvn"
+)
+_COMPLEMENT_LOOKUP = np.frombuffer(_COMPLEMENT_TABLE, dtype=np.uint8)
+DEFAULT_BLOCK_SIZE = 1 << 22
+
 
 class LazyRNAReader(object):
-    def __init__(self, filepaths: List[Path], cutoff: Union[int, Tuple[int, int]] = -1):
+    """
+    Reads the records of one or two FASTQ files in batches. Each batch is
+    parsed from a large binary block of the file, splitting all of its lines
+    at once, and the cutoff and the reverse complement (for the second file)
+    are applied to the sequences of the whole batch.
+    Iterating over the reader itself yields single (read_id, sequence) tuples.
+    """
+
+    def __init__(
+        self,
+        filepaths: List[Path],
+        cutoff: Union[int, Tuple[int, int]] = -1,
+        block_size: int = DEFAULT_BLOCK_SIZE,
+        decompression_threads: int = 0,
+        start_position: Union[Tuple[int, int, int], None] = None,
+        sample_fraction: Union[float, None] = None,
+        sample_size: Union[int, None] = None,
+        sample_seed: int = 0,
+        record_offsets: bool = False,
+        lane: int = 0,
+    ):
+        """
+        :param Union[float, None] sample_fraction: If given, only this fraction
+        of the reads is read, chosen randomly.
+        :param Union[int, None] sample_size: If given, only at most this number
+        of reads is read per file, chosen randomly.
+        :param int sample_seed: The seed of the random choice of the sampled
+        reads. As a read is chosen only based on the seed and its record index,
+        the same reads are chosen from both files of paired-end data.
+        :param bool record_offsets: Whether to determine the uncompressed byte
+        offsets of the records of each batch, see `get_record_offsets`.
+        :param int lane: The lane of the files, i.e. their index among the files
+        or pairs of files of the same sample, which is encoded in the read ids.
+        """
         self._filepaths: List[Path] = filepaths
-        self._open_filehandle: Union[TextIO, None] = None
+        self._open_filehandle: Union[BinaryIO, ThreadedGzipReader, None] = None
         self._cutoff: Tuple[int, int]
         if isinstance(cutoff, int):
             self._cutoff = (cutoff, cutoff)
@@ -33,78 +76,395 @@ class LazyRNAReader(object):
             logging.error(error_message)
             raise ValueError(error_message)
 
-        self._line_count_for_current_sequence: int = 0
-        self._sequence: str = ""
+        if not 0 <= lane < MAX_NUMBER_OF_LANES:
+            error_message = (
+                f"Expected the lane to be in [0, {MAX_NUMBER_OF_LANES}), "
+                f"but was {lane}."
+            )
+            logging.error(error_message)
+            raise ValueError(error_message)
+        self._lane: int = lane
+
+        # The number of bytes read from the file per batch
+        self._block_size: int = block_size
+        # If larger than 0, gzip files are decompressed in a background thread,
+        # and BGZF files by this many threads
+        self._decompression_threads: int = decompression_threads
+        # The file index, the uncompressed byte offset and the record index
+        # at which reading starts and after the last batch, respectively
+        self._start_position: Tuple[int, int, int] = (
+            start_position if start_position is not None else (0, 0, 0)
+        )
+        self._position: Tuple[int, int, int] = self._start_position
+
+        if (sample_fraction is not None and not 0 < sample_fraction <= 1) or (
+            sample_size is not None and sample_size < 0
+        ):
+            error_message = (
+                "Expected the sample fraction to be in (0, 1] "
+                "and the sample size to be non-negative."
+            )
+            logging.error(error_message)
+            raise ValueError(error_message)
+        self._sample_fraction: Union[float, None] = sample_fraction
+        self._sample_size: Union[int, None] = sample_size
+        self._sample_seed: int = sample_seed
+        self._sampling_fraction: Union[float, None] = None
+        self._record_offsets: bool = record_offsets
+        self._batch_record_offsets: Union[npt.NDArray[np.uint64], None] = None
 
     @staticmethod
     def _is_gzip(filepath: Path) -> bool:
         return filepath.name.endswith(".gz")
 
     @staticmethod
-    def _construct_shortened_id(line_index: int, is_reverse_complement: bool) -> int:
-        return int(f"{str((line_index // 4) + 1)}{str(int(is_reverse_complement) + 1)}")
+    def _process_sequences(
+        sequences: List[bytes], is_reverse_complement: bool
+    ) -> List[str]:
+        # TODO: Exchange all T for U? (inplace?)
+        all_sequences = b"\n".join(sequences)
+        if is_reverse_complement:
+            # Reversing all sequences at once also reverses their order
+            return (
+                all_sequences.translate(_COMPLEMENT_TABLE)[::-1]
+                .decode("ascii")
+                .split("\n")[::-1]
+            )
+        return all_sequences.decode("ascii").split("\n")
 
-    def _process_line(
-        self,
-        line: str,
-        line_index: int,
-        is_reverse_complement: bool,
-        cutoff_to_use: int,
-    ) -> Union[Tuple[int, str], None]:
-        if self._line_count_for_current_sequence == 1:
-            self._sequence = line.strip()
-
-            # TODO: Exchange all T for U? (inplace?)
-
-            if cutoff_to_use > 0:
-                self._sequence = self._sequence[0:cutoff_to_use]  # noqa: E203
-
-            if is_reverse_complement:
-                self._sequence = str(
-                    MutableSeq(self._sequence).reverse_complement(inplace=True)
+    @staticmethod
+    def _convert_sequences_to_matrix(
+        sequences: List[bytes], is_reverse_complement: bool
+    ) -> Tuple[npt.NDArray[np.uint8], npt.NDArray[np.int32]]:
+        lengths = np.fromiter(
+            (len(sequence) for sequence in sequences),
+            dtype=np.int32,
+            count=len(sequences),
+        )
+        max_length = int(lengths.max()) if len(sequences) > 0 else 0
+        concatenated_sequences = np.frombuffer(b"".join(sequences), dtype=np.uint8)
+        is_fixed_length = bool(np.all(lengths == max_length))
+        if is_fixed_length:
+            sequence_matrix = concatenated_sequences.reshape(len(sequences), max_length)
+        else:
+            # Shorter reads are padded with zeros at the end
+            sequence_matrix = np.zeros((len(sequences), max_length), dtype=np.uint8)
+            sequence_matrix[np.arange(max_length) < lengths[:, np.newaxis]] = (
+                concatenated_sequences
+            )
+        if not is_reverse_complement:
+            return sequence_matrix, lengths
+
+        sequence_matrix = _COMPLEMENT_LOOKUP[sequence_matrix]
+        if is_fixed_length:
+            return np.ascontiguousarray(sequence_matrix[:, ::-1]), lengths
+        # Each read is reversed within its length, keeping the padding at the end
+        source_columns = lengths[:, np.newaxis] - 1 - np.arange(max_length)
+        sequence_matrix = np.take_along_axis(
+            sequence_matrix, np.maximum(source_columns, 0), axis=1
+        )
+        sequence_matrix[source_columns < 0] = 0
+        return sequence_matrix, lengths
+
+    def _read_batches(
+        self, filehandle: Union[BinaryIO, ThreadedGzipReader], start_offset: int
+    ) -> Iterator[Tuple[List[bytes], int, Union[npt.NDArray[np.uint64], None]]]:
+        """
+        :returns Tuples (sequences, end_offset, record_offsets) with the
+        uncompressed byte offset after the last record of the batch and,
+        if offsets are recorded, the offsets of the records of the batch.
+        """
+        if start_offset > 0:
+            filehandle.seek(start_offset)
+        end_offset = start_offset
+        # Incomplete lines and records at the end of the previous block
+        remainder = b""
+        while True:
+            block = filehandle.read(self._block_size)
+            end_offset += len(block)
+            buffer = remainder + block
+            buffer_offset = end_offset - len(buffer)
+            if len(block) > 0:
+                last_line_end = buffer.rfind(b"\n")
+                if last_line_end < 0:
+                    remainder = buffer
+                    continue
+                lines = buffer[0:last_line_end].split(b"\n")
+                remainder = buffer[last_line_end + 1 :]  # noqa: E203
+            else:
+                lines = buffer.split(b"\n")
+                remainder = b""
+                while len(lines) > 0 and len(lines[-1].strip()) == 0:
+                    lines.pop()
+
+            # Always read 4 lines per sequence, as per FASTQ format
+            number_of_lines = len(lines) - (len(lines) % 4)
+            if len(block) > 0 and number_of_lines < len(lines):
+                remainder = b"\n".join(lines[number_of_lines:]) + b"\n" + remainder
+            elif len(block) == 0 and number_of_lines < len(lines):
+                logging.warning("Ignoring incomplete record at the end of the file.")
+
+            # Information from field 2 (line 3) and the quality info (line 4)
+            # is not needed
+            sequences = lines[1:number_of_lines:4]
+            if len(sequences) > 0:
+                record_offsets = None
+                if self._record_offsets:
+                    record_lengths = (
+                        np.fromiter(
+                            map(len, lines[0:number_of_lines]),
+                            dtype=np.uint64,
+                            count=number_of_lines,
+                        ).reshape(-1, 4)
+                        + np.uint64(1)
+                    ).sum(axis=1, dtype=np.uint64)
+                    record_offsets = np.uint64(buffer_offset) + np.concatenate(
+                        (np.zeros(1, dtype=np.uint64), np.cumsum(record_lengths[:-1]))
+                    ).astype(np.uint64)
+                if b"\r" in sequences[0]:
+                    sequences = [sequence.rstrip(b"\r") for sequence in sequences]
+                yield sequences, end_offset - len(remainder), record_offsets
+            if len(block) == 0:
+                return
+
+    def _open_file(self, filepath: Path) -> Union[BinaryIO, ThreadedGzipReader]:
+        if LazyRNAReader._is_gzip(filepath):
+            logging.info(
+                f"Detected gzip file: {filepath}. Reading in compressed format..."
+            )
+            if self._decompression_threads > 0:
+                return ThreadedGzipReader(filepath, self._decompression_threads)
+            else:
+                return gzip.open(filepath, "rb")
+        else:
+            logging.info(
+                (
+                    f"File {filepath} is not a gzip file. "
+                    "Trying to read as uncompressed file..."
                 )
-        # Information from field 2 (line 3) is not needed
+            )
+            return open(filepath, "rb")
 
-        # Always read 4 lines per sequence, as per FASTQ format
-        # For now skip quality info (line 4), getting cutoff value supplied by user
-        elif self._line_count_for_current_sequence == 3:
-            self._line_count_for_current_sequence = 0
-            return (
-                LazyRNAReader._construct_shortened_id(
-                    line_index, is_reverse_complement
-                ),
-                self._sequence,
+    def _count_records(self, filepath: Path) -> int:
+        filehandle = self._open_file(filepath)
+        number_of_lines = 0
+        last_block = b"\n"
+        while True:
+            block = filehandle.read(self._block_size)
+            if len(block) == 0:
+                break
+            number_of_lines += block.count(b"\n")
+            last_block = block
+        filehandle.close()
+        if not last_block.endswith(b"\n"):
+            number_of_lines += 1
+        return number_of_lines // 4
+
+    def get_sampling_fraction(self) -> float:
+        """
+        Returns the (expected) fraction of the reads that is read. With a sample
+        size, this requires counting the records of the first file.
+        """
+        if self._sampling_fraction is None:
+            self._sampling_fraction = (
+                1.0 if self._sample_fraction is None else self._sample_fraction
             )
+            if self._sample_size == 0:
+                self._sampling_fraction = 0.0
+            elif self._sample_size is not None:
+                self._sampling_fraction = min(
+                    self._sample_size / max(self._count_records(self._filepaths[0]), 1),
+                    self._sampling_fraction,
+                )
+        return self._sampling_fraction
+
+    def _get_sampling_threshold(self) -> Union[np.uint64, None]:
+        if self._sample_fraction is None and self._sample_size is None:
+            return None
+        sampling_fraction = self.get_sampling_fraction()
+        if sampling_fraction >= 1.0:
+            return None
+        return np.uint64(min(int(sampling_fraction * (1 << 64)), (1 << 64) - 1))
 
-        self._line_count_for_current_sequence = (
-            self._line_count_for_current_sequence + 1
+    def _is_sampled(
+        self, record_indexes: npt.NDArray[np.uint64], sampling_threshold: np.uint64
+    ) -> npt.NDArray[np.bool_]:
+        # SplitMix64 hash of the record index and the seed
+        hashes = record_indexes + np.uint64(
+            (self._sample_seed * 0x9E3779B97F4A7C15) & ((1 << 64) - 1)
         )
+        hashes = (hashes ^ (hashes >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        hashes = (hashes ^ (hashes >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        hashes = hashes ^ (hashes >> np.uint64(31))
+        return hashes < sampling_threshold
 
-    def __iter__(self):
-        # TODO: Write logic for picking up where left off in file
-        for file_index, filepath in enumerate(self._filepaths):
-            if LazyRNAReader._is_gzip(filepath):
-                logging.info(
-                    f"Detected gzip file: {filepath}. Reading in compressed format..."
+    def _count_sampled_records(
+        self, number_of_records: int, sampling_threshold: np.uint64
+    ) -> int:
+        number_of_sampled_records = 0
+        for first_record_index in range(0, number_of_records, self._block_size):
+            number_of_sampled_records += int(
+                np.count_nonzero(
+                    self._is_sampled(
+                        np.arange(
+                            first_record_index,
+                            min(
+                                first_record_index + self._block_size, number_of_records
+                            ),
+                            dtype=np.uint64,
+                        ),
+                        sampling_threshold,
+                    )
                 )
-                self._open_filehandle = gzip.open(filepath, "rt", encoding="utf-8")
-            else:
+            )
+        return number_of_sampled_records
+
+    def _iter_raw_batches(
+        self,
+    ) -> Iterator[Tuple[int, npt.NDArray[np.uint64], List[bytes]]]:
+        """
+        Yields the sequences of all files in batches, with the cutoff and the
+        sampling applied.
+        :returns Tuples (file_index, record_indexes, sequences).
+        :rtype Iterator[Tuple[int, npt.NDArray[np.uint64], List[bytes]]]
+        """
+        sampling_threshold = self._get_sampling_threshold()
+        if sampling_threshold is not None and sampling_threshold == 0:
+            # No record is sampled, e.g. of a lane without a share of the sample
+            self._position = (len(self._filepaths), 0, 0)
+            return
+        start_file_index, start_offset, start_record_index = self._start_position
+        for file_index, filepath in enumerate(self._filepaths):
+            if file_index < start_file_index:
+                continue
+            if file_index > start_file_index:
+                start_offset, start_record_index = 0, 0
+            self._open_filehandle = self._open_file(filepath)
+
+            if start_offset > 0:
                 logging.info(
-                    (
-                        f"File {filepath} is not a gzip file. "
-                        "Trying to read as uncompressed file..."
-                    )
+                    f"Resuming at record {start_record_index + 1} of file {filepath}."
                 )
-                self._open_filehandle = open(filepath, "rt", encoding="utf-8")
 
-            for line_index, line in enumerate(self._open_filehandle):
-                processed_line = self._process_line(
-                    line, line_index, file_index == 1, self._cutoff[file_index]
+            cutoff_to_use = self._cutoff[file_index]
+            number_of_records = start_record_index
+            number_of_sampled_records = (
+                self._count_sampled_records(start_record_index, sampling_threshold)
+                if sampling_threshold is not None and self._sample_size is not None
+                else 0
+            )
+            for sequences, end_offset, record_offsets in self._read_batches(
+                self._open_filehandle, start_offset
+            ):
+                record_indexes = np.arange(
+                    number_of_records,
+                    number_of_records + len(sequences),
+                    dtype=np.uint64,
                 )
-                if processed_line is not None:
-                    yield processed_line
+                number_of_records += len(sequences)
+                self._position = (file_index, end_offset, number_of_records)
+                if sampling_threshold is not None:
+                    is_sampled = self._is_sampled(record_indexes, sampling_threshold)
+                    if self._sample_size is not None:
+                        is_sampled &= (
+                            np.cumsum(is_sampled) + number_of_sampled_records
+                            <= self._sample_size
+                        )
+                        number_of_sampled_records += int(np.count_nonzero(is_sampled))
+                    record_indexes = record_indexes[is_sampled]
+                    if record_offsets is not None:
+                        record_offsets = record_offsets[is_sampled]
+                    sequences = [
+                        sequence
+                        for sequence, is_sequence_sampled in zip(
+                            sequences, is_sampled.tolist()
+                        )
+                        if is_sequence_sampled
+                    ]
+                    if len(sequences) == 0:
+                        continue
+                if cutoff_to_use > 0:
+                    sequences = [sequence[0:cutoff_to_use] for sequence in sequences]
+                self._batch_record_offsets = record_offsets
+                yield file_index, record_indexes, sequences
 
             self._open_filehandle.close()
+            self._open_filehandle = None
+            self._position = (file_index + 1, 0, 0)
+
+    def get_position(self) -> Tuple[int, int, int]:
+        """
+        Returns the position after the last yielded batch, from which a new
+        reader can continue via its `start_position`.
+        :returns A Tuple (file_index, byte_offset, record_index) with the
+        uncompressed byte offset and the index of the next record in the file.
+        :rtype Tuple[int, int, int]
+        """
+        return self._position
+
+    def get_record_offsets(self) -> Union[npt.NDArray[np.uint64], None]:
+        """
+        Returns the uncompressed byte offsets in their file of the records
+        of the last yielded batch, or None if offsets are not recorded.
+        """
+        return self._batch_record_offsets
+
+    def iter_batches(self) -> Iterator[Tuple[npt.NDArray[np.uint64], List[str]]]:
+        """
+        Yields the reads of all files in batches.
+        :returns Tuples (read_ids, sequences) of the reads of one batch.
+        :rtype Iterator[Tuple[npt.NDArray[np.uint64], List[str]]]
+        """
+        for file_index, record_indexes, sequences in self._iter_raw_batches():
+            yield (
+                encode_read_ids_of_records(record_indexes, file_index, self._lane),
+                LazyRNAReader._process_sequences(sequences, file_index == 1),
+            )
+
+    def iter_matrix_batches(
+        self,
+    ) -> Iterator[
+        Tuple[npt.NDArray[np.uint64], npt.NDArray[np.uint8], npt.NDArray[np.int32]]
+    ]:
+        """
+        Yields the reads of all files in batches, with the sequences of each
+        batch as the rows of a matrix of ASCII codes. This is intended for
+        reads of (mostly) the same length, e.g. Illumina reads after the cutoff,
+        as shorter reads are padded with zeros up to the longest read.
+        :returns Tuples (read_ids, sequence_matrix, lengths) of the reads
+        of one batch.
+        :rtype Iterator[Tuple[npt.NDArray[np.uint64], npt.NDArray[np.uint8],
+        npt.NDArray[np.int32]]]
+        """
+        for file_index, record_indexes, sequences in self._iter_raw_batches():
+            yield (
+                encode_read_ids_of_records(record_indexes, file_index, self._lane),
+                *LazyRNAReader._convert_sequences_to_matrix(sequences, file_index == 1),
+            )
+
+    def iter_reads_for_ids(self, read_ids: List[int]) -> Iterator[Tuple[int, str]]:
+        """
+        Yields the reads with the given ids, in the order of the files.
+        :rtype Iterator[Tuple[int, str]]
+        """
+        # Sorted once, so that the reads of each batch are looked up by
+        # binary search instead of sorting the requested ids for every batch
+        requested_read_ids = np.unique(np.asarray(read_ids, dtype=np.uint64))
+        if len(requested_read_ids) == 0:
+            return
+        for batch_read_ids, sequences in self.iter_batches():
+            positions = np.minimum(
+                np.searchsorted(requested_read_ids, batch_read_ids),
+                len(requested_read_ids) - 1,
+            )
+            for row_index in np.flatnonzero(
+                requested_read_ids[positions] == batch_read_ids
+            ).tolist():
+                yield int(batch_read_ids[row_index]), sequences[row_index]
+
+    def __iter__(self) -> Iterator[Tuple[int, str]]:
+        for read_ids, sequences in self.iter_batches():
+            yield from zip(read_ids.tolist(), sequences)
 
     def __del__(self):
         if self._open_filehandle is not None:
@@ -0,0 +1,202 @@
+from pathlib import Path
+from typing import Iterator, List, Tuple, Union
+
+import numpy as np
+import numpy.typing as npt
+
+from pepti_map.importing.rna_import.read_store import AppendOnlyReadStore
+from pepti_map.util.read_id import READ_ID_DTYPE
+
+_READ_IDS_FILENAME = "read_ids.bin"
+_LENGTHS_FILENAME = "lengths.bin"
+_SEQUENCES_FILENAME = "sequences.bin"
+_EXCEPTIONS_FILENAME = "exceptions.bin"
+
+_LENGTH_DTYPE = np.uint32
+# Bases other than A, C, G and T, e.g. N, are stored as A and listed separately
+_EXCEPTION_DTYPE = np.dtype(
+    [("read_number", np.uint64), ("position", np.uint32), ("base", np.uint8)]
+)
+
+_BASES = b"ACGT"
+_PACK_LOOKUP = np.zeros(256, dtype=np.uint8)
+_IS_PACKABLE = np.zeros(256, dtype=np.bool_)
+for _code, _base in enumerate(_BASES):
+    _PACK_LOOKUP[_base] = _code
+    _IS_PACKABLE[_base] = True
+# The four bases of each packed byte, the first base in the lowest bits
+_UNPACK_LOOKUP = np.array(
+    [
+        [_BASES[(packed_byte >> shift) & 3] for shift in range(0, 8, 2)]
+        for packed_byte in range(0, 256)
+    ],
+    dtype=np.uint8,
+)
+
+
+class PackedReadStore(AppendOnlyReadStore):
+    """
+    Read store holding the sequences of the reads with their bases packed into
+    2 bits each, so that the reads matched during the matching step can be
+    kept for the assembly without reading the RNA-seq files again.
+    The reads are stored as they were matched, i.e. with the cutoff applied
+    and reverse complemented if they are from the second file.
+    """
+
+    def __init__(self, store_dir: Path):
+        super(PackedReadStore, self).__init__(store_dir)
+        # Loaded lazily for retrieving reads
+        self._is_loaded: bool = False
+        self._sorted_read_ids: npt.NDArray[np.uint64] = np.empty(0, READ_ID_DTYPE)
+        self._read_order: npt.NDArray[np.int64] = np.empty(0, np.int64)
+        self._lengths: npt.NDArray[np.uint32] = np.empty(0, _LENGTH_DTYPE)
+        self._offsets: npt.NDArray[np.int64] = np.zeros(1, np.int64)
+        self._sequences: npt.NDArray[np.uint8] = np.empty(0, np.uint8)
+        self._exceptions: npt.NDArray = np.empty(0, _EXCEPTION_DTYPE)
+        if self.exists():
+            self._number_of_reads = (
+                self._get_file_size(_READ_IDS_FILENAME)
+                // np.dtype(READ_ID_DTYPE).itemsize
+            )
+
+    def exists(self) -> bool:
+        return (self._store_dir / _SEQUENCES_FILENAME).is_file()
+
+    def append_batch(
+        self,
+        read_ids: npt.NDArray[np.uint64],
+        sequence_matrix: npt.NDArray[np.uint8],
+        lengths: npt.NDArray[np.int32],
+        record_offsets: Union[npt.NDArray[np.uint64], None] = None,
+    ) -> None:
+        if len(read_ids) == 0:
+            return
+        # Pad the rows to whole bytes of four bases
+        padded_width = (sequence_matrix.shape[1] + 3) // 4 * 4
+        padded_matrix = np.zeros((len(read_ids), padded_width), dtype=np.uint8)
+        padded_matrix[:, 0 : sequence_matrix.shape[1]] = sequence_matrix  # noqa: E203
+        is_in_read = np.arange(padded_width) < lengths[:, np.newaxis]
+
+        codes = _PACK_LOOKUP[padded_matrix].reshape(len(read_ids), -1, 4)
+        packed_matrix = (
+            codes[:, :, 0]
+            | (codes[:, :, 1] << 2)
+            | (codes[:, :, 2] << 4)
+            | (codes[:, :, 3] << 6)
+        )
+        is_packed_byte_in_read = (
+            np.arange(packed_matrix.shape[1]) < ((lengths + 3) // 4)[:, np.newaxis]
+        )
+
+        exception_rows, exception_positions = np.nonzero(
+            is_in_read & ~_IS_PACKABLE[padded_matrix]
+        )
+        exceptions = np.empty(len(exception_rows), dtype=_EXCEPTION_DTYPE)
+        exceptions["read_number"] = exception_rows + self._number_of_reads
+        exceptions["position"] = exception_positions
+        exceptions["base"] = padded_matrix[exception_rows, exception_positions]
+
+        self._get_filehandle(_READ_IDS_FILENAME).write(
+            np.asarray(read_ids, dtype=READ_ID_DTYPE).tobytes()
+        )
+        self._get_filehandle(_LENGTHS_FILENAME).write(
+            np.asarray(lengths, dtype=_LENGTH_DTYPE).tobytes()
+        )
+        self._get_filehandle(_SEQUENCES_FILENAME).write(
+            packed_matrix[is_packed_byte_in_read].tobytes()
+        )
+        self._get_filehandle(_EXCEPTIONS_FILENAME).write(exceptions.tobytes())
+        self._number_of_reads += len(read_ids)
+        self._is_loaded = False
+
+    def clear(self) -> None:
+        super(PackedReadStore, self).clear()
+        self._is_loaded = False
+
+    def get_size(self) -> Tuple[int, int, int]:
+        """
+        :returns A Tuple (number_of_reads, sequences_size, number_of_exceptions).
+        :rtype Tuple[int, int, int]
+        """
+        return (
+            self._number_of_reads,
+            self._get_file_size(_SEQUENCES_FILENAME),
+            self._get_file_size(_EXCEPTIONS_FILENAME) // _EXCEPTION_DTYPE.itemsize,
+        )
+
+    def truncate(self, size: Tuple[int, ...]) -> None:
+        number_of_reads, sequences_size, number_of_exceptions = size
+        self._truncate_files(
+            {
+                _READ_IDS_FILENAME: number_of_reads * np.dtype(READ_ID_DTYPE).itemsize,
+                _LENGTHS_FILENAME: number_of_reads * np.dtype(_LENGTH_DTYPE).itemsize,
+                _SEQUENCES_FILENAME: sequences_size,
+                _EXCEPTIONS_FILENAME: number_of_exceptions * _EXCEPTION_DTYPE.itemsize,
+            },
+            number_of_reads,
+        )
+        self._is_loaded = False
+
+    def _load(self) -> None:
+        self.close()
+        read_ids = np.fromfile(
+            self._store_dir / _READ_IDS_FILENAME, dtype=READ_ID_DTYPE
+        )
+        self._read_order = np.argsort(read_ids, kind="stable")
+        self._sorted_read_ids = read_ids[self._read_order]
+        self._lengths = np.fromfile(
+            self._store_dir / _LENGTHS_FILENAME, dtype=_LENGTH_DTYPE
+        )
+        packed_lengths = (self._lengths.astype(np.int64) + 3) // 4
+        self._offsets = np.concatenate(([0], np.cumsum(packed_lengths)))
+        self._sequences = (
+            np.memmap(self._store_dir / _SEQUENCES_FILENAME, dtype=np.uint8, mode="r")
+            if self._offsets[-1] > 0
+            else np.empty(0, dtype=np.uint8)
+        )
+        self._exceptions = np.fromfile(
+            self._store_dir / _EXCEPTIONS_FILENAME, dtype=_EXCEPTION_DTYPE
+        )
+        self._is_loaded = True
+
+    def _get_sequence(self, read_number: int) -> str:
+        start = self._offsets[read_number]
+        end = self._offsets[read_number + 1]
+        sequence = _UNPACK_LOOKUP[self._sequences[start:end]].reshape(-1)[
+            0 : self._lengths[read_number]  # noqa: E203
+        ]
+        exception_read_numbers = self._exceptions["read_number"]
+        first_exception = np.searchsorted(exception_read_numbers, read_number)
+        end_exception = np.searchsorted(
+            exception_read_numbers, read_number, side="right"
+        )
+        exceptions = self._exceptions[first_exception:end_exception]
+        sequence[exceptions["position"]] = exceptions["base"]
+        return sequence.tobytes().decode("ascii")
+
+    def get_read_sequences_for_ids(
+        self, read_ids: List[int]
+    ) -> Tuple[List[int], List[str]]:
+        if len(read_ids) == 0:
+            return read_ids, []
+        if not self._is_loaded:
+            self._load()
+        return read_ids, [
+            self._get_sequence(read_number)
+            for read_number in self._find_read_numbers(
+                self._sorted_read_ids, self._read_order, read_ids
+            ).tolist()
+        ]
+
+    def iter_read_sequences_for_ids(
+        self, read_ids: List[int]
+    ) -> Iterator[Tuple[int, str]]:
+        if len(read_ids) == 0:
+            return
+        if not self._is_loaded:
+            self._load()
+        read_numbers = self._find_read_numbers(
+            self._sorted_read_ids, self._read_order, read_ids
+        )
+        for position in np.argsort(read_numbers, kind="stable").tolist():
+            yield read_ids[position], self._get_sequence(int(read_numbers[position]))
@@ -0,0 +1,78 @@
+import logging
+import multiprocessing
+import os
+from pathlib import Path
+from typing import List, Union
+
+import pyfastx
+
+
+def get_read_index_filepaths(filepaths: List[Path], index_dir: Path) -> List[Path]:
+    """
+    Returns the paths of the pyfastx indexes of the given RNA-seq files
+    in the index directory.
+    """
+    return [
+        index_dir / f"{file_index}_{filepath.name}.fxi"
+        for file_index, filepath in enumerate(filepaths)
+    ]
+
+
+def build_read_indexes(filepaths: List[Path], index_dir: Path) -> None:
+    """
+    Builds the pyfastx indexes of the given RNA-seq files that do not exist yet.
+    Each index is built in a temporary file, which is only moved into place
+    when it is complete, so that the indexes of an interrupted run are
+    never mistaken for complete ones.
+    """
+    index_dir.mkdir(parents=True, exist_ok=True)
+    for filepath, index_filepath in zip(
+        filepaths, get_read_index_filepaths(filepaths, index_dir)
+    ):
+        if index_filepath.is_file():
+            continue
+        temp_index_filepath = index_filepath.with_name(index_filepath.name + ".tmp")
+        if temp_index_filepath.is_file():
+            temp_index_filepath.unlink()
+        pyfastx.Fastq(filepath.as_posix(), index_file=temp_index_filepath.as_posix())
+        os.replace(temp_index_filepath, index_filepath)
+
+
+class BackgroundReadIndexBuilder:
+    """
+    Builds the pyfastx indexes of the RNA-seq files in a background process,
+    so that they are built in parallel to the matching and only need to be
+    waited for when the matched reads are retrieved.
+    """
+
+    def __init__(self, filepaths: List[Path], index_dir: Path):
+        self._filepaths: List[Path] = filepaths
+        self._index_dir: Path = index_dir
+        self._process: Union[multiprocessing.Process, None] = None
+
+    def start(self) -> None:
+        if self._process is not None:
+            return
+        self._process = multiprocessing.Process(
+            target=build_read_indexes,
+            args=(self._filepaths, self._index_dir),
+            # Not waited for if the run is aborted
+            daemon=True,
+        )
+        self._process.start()
+
+    def wait(self) -> None:
+        """
+        Waits until all indexes are built, starting their build if needed.
+        :raises ValueError: Raised if building the indexes failed.
+        """
+        self.start()
+        assert self._process is not None
+        self._process.join()
+        if self._process.exitcode != 0:
+            error_message = (
+                f"Building the read indexes in {self._index_dir} failed with "
+                f"exit code {self._process.exitcode}."
+            )
+            logging.error(error_message)
+            raise ValueError(error_message)
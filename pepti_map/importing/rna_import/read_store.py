@@ -0,0 +1,170 @@
+from abc import ABC, abstractmethod
+import logging
+import os
+from pathlib import Path
+import shutil
+from typing import BinaryIO, Dict, Iterator, List, Tuple, Union
+
+import numpy as np
+import numpy.typing as npt
+
+
+class IReadStore(ABC):
+    """
+    Store to which the matched RNA-seq reads are appended during the matching
+    step, so that they can be retrieved by their read id for the assembly.
+    """
+
+    @abstractmethod
+    def exists(self) -> bool:
+        raise NotImplementedError
+
+    @abstractmethod
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+    @abstractmethod
+    def append_batch(
+        self,
+        read_ids: npt.NDArray[np.uint64],
+        sequence_matrix: npt.NDArray[np.uint8],
+        lengths: npt.NDArray[np.int32],
+        record_offsets: Union[npt.NDArray[np.uint64], None] = None,
+    ) -> None:
+        """
+        Appends a batch of reads in the format of
+        `LazyRNAReader.iter_matrix_batches`, together with the offsets of
+        their records as returned by `LazyRNAReader.get_record_offsets`.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_size(self) -> Tuple[int, ...]:
+        """
+        Returns the size of the store, from which it can be restored by
+        `truncate` after further reads were appended.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def truncate(self, size: Tuple[int, ...]) -> None:
+        """
+        Removes all reads appended after the store had the given size.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def close(self) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    def clear(self) -> None:
+        """
+        Removes all reads from the store.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_read_sequences_for_ids(
+        self, read_ids: List[int]
+    ) -> Tuple[List[int], List[str]]:
+        """
+        Returns the sequences of the given reads, in the same order, with the
+        cutoff applied and reverse complemented if they are from the second file.
+        :raises ValueError: Raised if a read is not contained in the store.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def iter_read_sequences_for_ids(
+        self, read_ids: List[int]
+    ) -> Iterator[Tuple[int, str]]:
+        """
+        Yields the given reads as Tuples (read_id, sequence) in the order in
+        which they are stored, so that the store is read sequentially.
+        :raises ValueError: Raised if a read is not contained in the store.
+        """
+        raise NotImplementedError
+
+
+class AppendOnlyReadStore(IReadStore):
+    """
+    Base class of read stores consisting of binary files in a directory,
+    to which the data of each batch of reads is appended.
+    """
+
+    def __init__(self, store_dir: Path):
+        self._store_dir: Path = store_dir
+        self._filehandles: Dict[str, BinaryIO] = {}
+        self._number_of_reads: int = 0
+
+    def __len__(self) -> int:
+        return self._number_of_reads
+
+    def _get_filehandle(self, filename: str) -> BinaryIO:
+        if filename not in self._filehandles:
+            self._store_dir.mkdir(parents=True, exist_ok=True)
+            self._filehandles[filename] = open(self._store_dir / filename, "ab")
+        return self._filehandles[filename]
+
+    def _get_file_size(self, filename: str) -> int:
+        if filename in self._filehandles:
+            self._filehandles[filename].flush()
+        if not (self._store_dir / filename).is_file():
+            return 0
+        return (self._store_dir / filename).stat().st_size
+
+    def _truncate_files(self, file_sizes: Dict[str, int], number_of_reads: int) -> None:
+        if number_of_reads > self._number_of_reads:
+            error_message = (
+                f"Cannot restore the read store {self._store_dir} to "
+                f"{number_of_reads} reads, as it only contains "
+                f"{self._number_of_reads} reads."
+            )
+            logging.error(error_message)
+            raise ValueError(error_message)
+        self.close()
+        for filename, file_size in file_sizes.items():
+            if (self._store_dir / filename).is_file():
+                os.truncate(self._store_dir / filename, file_size)
+        self._number_of_reads = number_of_reads
+
+    def close(self) -> None:
+        for filehandle in self._filehandles.values():
+            filehandle.close()
+        self._filehandles = {}
+
+    def clear(self) -> None:
+        self.close()
+        shutil.rmtree(self._store_dir, ignore_errors=True)
+        self._number_of_reads = 0
+
+    def _find_read_numbers(
+        self,
+        sorted_read_ids: npt.NDArray[np.uint64],
+        read_order: npt.NDArray[np.int64],
+        read_ids: List[int],
+    ) -> npt.NDArray[np.int64]:
+        """
+        Returns the positions in the store of the given reads.
+        :param npt.NDArray[np.uint64] sorted_read_ids: The sorted ids of all
+        stored reads.
+        :param npt.NDArray[np.int64] read_order: The positions in the store
+        of the sorted read ids.
+        :raises ValueError: Raised if a read is not contained in the store.
+        """
+        requested_read_ids = np.array(read_ids, dtype=sorted_read_ids.dtype)
+        sorted_positions = np.minimum(
+            np.searchsorted(sorted_read_ids, requested_read_ids),
+            len(sorted_read_ids) - 1,
+        )
+        if len(sorted_read_ids) == 0 or np.any(
+            sorted_read_ids[sorted_positions] != requested_read_ids
+        ):
+            error_message = (
+                f"Not all requested reads are contained in the read store "
+                f"{self._store_dir}."
+            )
+            logging.error(error_message)
+            raise ValueError(error_message)
+        return read_order[sorted_positions]
@@ -0,0 +1,218 @@
+from bisect import bisect_right
+import gzip
+import logging
+from pathlib import Path
+from typing import BinaryIO, Dict, Iterator, List, Tuple, Union
+
+from Bio import bgzf
+import numpy as np
+import numpy.typing as npt
+
+from pepti_map.importing.rna_import.lazy_rna_reader import LazyRNAReader
+from pepti_map.importing.rna_import.read_store import AppendOnlyReadStore
+from pepti_map.importing.rna_import.threaded_gzip_reader import (
+    get_bgzf_block_offsets,
+    is_bgzf,
+)
+from pepti_map.util.read_id import READ_ID_DTYPE, decode_read_ids
+
+_READ_IDS_FILENAME = "read_ids.bin"
+_RECORD_OFFSETS_FILENAME = "record_offsets.bin"
+_OFFSET_DTYPE = np.uint64
+# The number of reads read at once during retrieval
+_CHUNK_SIZE = 1 << 16
+
+
+class _BgzfRecordReader:
+    """
+    Reads lines at uncompressed offsets of a BGZF file, by seeking directly
+    to the block containing the offset.
+    """
+
+    def __init__(self, filepath: Path):
+        self._compressed_offsets, self._uncompressed_offsets = get_bgzf_block_offsets(
+            filepath
+        )
+        self._reader = bgzf.BgzfReader(filepath, "rb")
+
+    def seek(self, offset: int) -> None:
+        block_index = bisect_right(self._uncompressed_offsets, offset) - 1
+        self._reader.seek(
+            bgzf.make_virtual_offset(
+                self._compressed_offsets[block_index],
+                offset - self._uncompressed_offsets[block_index],
+            )
+        )
+
+    def readline(self) -> bytes:
+        return self._reader.readline()
+
+    def close(self) -> None:
+        self._reader.close()
+
+
+class RecordOffsetStore(AppendOnlyReadStore):
+    """
+    Read store holding only the uncompressed byte offsets of the records of the
+    reads in the RNA-seq files, from which the reads are read again when they
+    are retrieved. The requested reads are read in the order of their offsets,
+    so that plain files are read with forward seeks only and gzip files in a
+    single forward pass. BGZF files are read by seeking directly to the blocks
+    containing the records. The files stay open between retrievals, but
+    a gzip file is decompressed from its start again whenever a read before
+    the previously retrieved one is requested.
+    """
+
+    def __init__(self, store_dir: Path, filepaths: List[Path], cutoff: Tuple[int, int]):
+        super(RecordOffsetStore, self).__init__(store_dir)
+        self._filepaths: List[Path] = filepaths
+        self._cutoff: Tuple[int, int] = cutoff
+        self._rna_filehandles: Dict[int, Union[BinaryIO, _BgzfRecordReader]] = {}
+        # Loaded lazily for retrieving reads
+        self._is_loaded: bool = False
+        self._sorted_read_ids: npt.NDArray[np.uint64] = np.empty(0, READ_ID_DTYPE)
+        self._read_order: npt.NDArray[np.int64] = np.empty(0, np.int64)
+        self._record_offsets: npt.NDArray[np.uint64] = np.empty(0, _OFFSET_DTYPE)
+        if self.exists():
+            self._number_of_reads = (
+                self._get_file_size(_RECORD_OFFSETS_FILENAME)
+                // np.dtype(_OFFSET_DTYPE).itemsize
+            )
+
+    def exists(self) -> bool:
+        return (self._store_dir / _RECORD_OFFSETS_FILENAME).is_file()
+
+    def append_batch(
+        self,
+        read_ids: npt.NDArray[np.uint64],
+        sequence_matrix: npt.NDArray[np.uint8],
+        lengths: npt.NDArray[np.int32],
+        record_offsets: Union[npt.NDArray[np.uint64], None] = None,
+    ) -> None:
+        if record_offsets is None:
+            error_message = "Expected the record offsets of the reads to store."
+            logging.error(error_message)
+            raise ValueError(error_message)
+        self._get_filehandle(_READ_IDS_FILENAME).write(
+            np.asarray(read_ids, dtype=READ_ID_DTYPE).tobytes()
+        )
+        self._get_filehandle(_RECORD_OFFSETS_FILENAME).write(
+            np.asarray(record_offsets, dtype=_OFFSET_DTYPE).tobytes()
+        )
+        self._number_of_reads += len(read_ids)
+        self._is_loaded = False
+
+    def get_size(self) -> Tuple[int]:
+        return (self._number_of_reads,)
+
+    def truncate(self, size: Tuple[int, ...]) -> None:
+        number_of_reads = size[0]
+        self._truncate_files(
+            {
+                _READ_IDS_FILENAME: number_of_reads * np.dtype(READ_ID_DTYPE).itemsize,
+                _RECORD_OFFSETS_FILENAME: number_of_reads
+                * np.dtype(_OFFSET_DTYPE).itemsize,
+            },
+            number_of_reads,
+        )
+        self._is_loaded = False
+
+    def close(self) -> None:
+        for filehandle in self._rna_filehandles.values():
+            filehandle.close()
+        self._rna_filehandles = {}
+        super(RecordOffsetStore, self).close()
+
+    def clear(self) -> None:
+        super(RecordOffsetStore, self).clear()
+        self._is_loaded = False
+
+    def _load(self) -> None:
+        self.close()
+        read_ids = np.fromfile(
+            self._store_dir / _READ_IDS_FILENAME, dtype=READ_ID_DTYPE
+        )
+        self._read_order = np.argsort(read_ids, kind="stable")
+        self._sorted_read_ids = read_ids[self._read_order]
+        self._record_offsets = np.fromfile(
+            self._store_dir / _RECORD_OFFSETS_FILENAME, dtype=_OFFSET_DTYPE
+        )
+        self._is_loaded = True
+
+    def _open_file(self, filepath: Path) -> Union[BinaryIO, _BgzfRecordReader]:
+        if LazyRNAReader._is_gzip(filepath):
+            if is_bgzf(filepath):
+                return _BgzfRecordReader(filepath)
+            # Seeking forward decompresses the file up to the offset
+            return gzip.open(filepath, "rb")
+        return open(filepath, "rb")
+
+    def _read_sequences(self, file_index: int, offsets: List[int]) -> List[bytes]:
+        """
+        Reads the sequences of the records at the given ascending offsets.
+        """
+        if file_index not in self._rna_filehandles:
+            self._rna_filehandles[file_index] = self._open_file(
+                self._filepaths[file_index]
+            )
+        filehandle = self._rna_filehandles[file_index]
+        sequences: List[bytes] = []
+        for offset in offsets:
+            filehandle.seek(offset)
+            filehandle.readline()
+            sequences.append(filehandle.readline().rstrip(b"\r\n"))
+        if self._cutoff[file_index] > 0:
+            sequences = [
+                sequence[0 : self._cutoff[file_index]]  # noqa: E203
+                for sequence in sequences
+            ]
+        return sequences
+
+    def _iter_sequences_in_file_order(
+        self, read_ids: List[int]
+    ) -> Iterator[Tuple[List[int], List[str]]]:
+        """
+        Reads the given reads in chunks, sorted by their file and offset.
+        :returns Tuples (positions, sequences) with the positions of the reads
+        in the given list and their sequences.
+        :rtype Iterator[Tuple[List[int], List[str]]]
+        """
+        if not self._is_loaded:
+            self._load()
+        record_offsets = self._record_offsets[
+            self._find_read_numbers(self._sorted_read_ids, self._read_order, read_ids)
+        ]
+        _, _, mates = decode_read_ids(np.array(read_ids, dtype=READ_ID_DTYPE))
+        for file_index in range(0, len(self._filepaths)):
+            positions = np.flatnonzero(mates == file_index)
+            positions = positions[np.argsort(record_offsets[positions], kind="stable")]
+            for chunk_start in range(0, len(positions), _CHUNK_SIZE):
+                chunk_positions = positions[
+                    chunk_start : chunk_start + _CHUNK_SIZE  # noqa: E203
+                ]
+                yield chunk_positions.tolist(), LazyRNAReader._process_sequences(
+                    self._read_sequences(
+                        file_index, record_offsets[chunk_positions].tolist()
+                    ),
+                    file_index == 1,
+                )
+
+    def get_read_sequences_for_ids(
+        self, read_ids: List[int]
+    ) -> Tuple[List[int], List[str]]:
+        if len(read_ids) == 0:
+            return read_ids, []
+        sequences: List[str] = ["" for _ in read_ids]
+        for positions, chunk_sequences in self._iter_sequences_in_file_order(read_ids):
+            for position, sequence in zip(positions, chunk_sequences):
+                sequences[position] = sequence
+        return read_ids, sequences
+
+    def iter_read_sequences_for_ids(
+        self, read_ids: List[int]
+    ) -> Iterator[Tuple[int, str]]:
+        if len(read_ids) == 0:
+            return
+        for positions, sequences in self._iter_sequences_in_file_order(read_ids):
+            for position, sequence in zip(positions, sequences):
+                yield read_ids[position], sequence
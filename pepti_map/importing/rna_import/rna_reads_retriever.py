@@ -1,13 +1,28 @@
 import logging
 import pyfastx
 from pathlib import Path
-from typing import List, Tuple, Union
+from typing import Iterator, List, Tuple, Union
 
 from Bio.Seq import MutableSeq
 
+from pepti_map.importing.rna_import.read_index_builder import (
+    get_read_index_filepaths,
+)
+from pepti_map.util.read_id import decode_read_id
+
 
 class RNAReadsRetriever:
-    def __init__(self, filepaths: List[Path], cutoff: Union[int, Tuple[int, int]] = -1):
+    def __init__(
+        self,
+        filepaths: List[Path],
+        cutoff: Union[int, Tuple[int, int]] = -1,
+        index_dir: Union[Path, None] = None,
+    ):
+        """
+        :param Union[Path, None] index_dir: The directory containing the
+        pyfastx indexes of the files, as built by `build_read_indexes`. Missing
+        indexes are built there. If None, the indexes are built next to the files.
+        """
         self._filepaths: List[Path] = filepaths
         self._cutoff: Tuple[int, int]
         if isinstance(cutoff, int):
@@ -32,9 +47,21 @@ class RNAReadsRetriever:
 
         # TODO: Delete index files again after use?
 
-        self._first_file_index = pyfastx.Fastq(self._filepaths[0].as_posix())
-        if len(self._filepaths) == 2:
-            self._second_file_index = pyfastx.Fastq(self._filepaths[1].as_posix())
+        if index_dir is None:
+            self._first_file_index = pyfastx.Fastq(self._filepaths[0].as_posix())
+            if len(self._filepaths) == 2:
+                self._second_file_index = pyfastx.Fastq(self._filepaths[1].as_posix())
+        else:
+            index_dir.mkdir(parents=True, exist_ok=True)
+            index_filepaths = get_read_index_filepaths(self._filepaths, index_dir)
+            self._first_file_index = pyfastx.Fastq(
+                self._filepaths[0].as_posix(), index_file=index_filepaths[0].as_posix()
+            )
+            if len(self._filepaths) == 2:
+                self._second_file_index = pyfastx.Fastq(
+                    self._filepaths[1].as_posix(),
+                    index_file=index_filepaths[1].as_posix(),
+                )
 
     def _process_line(
         self,
@@ -49,23 +76,34 @@ class RNAReadsRetriever:
             line = str(MutableSeq(line).reverse_complement(inplace=True))
         return line
 
+    def _get_read_sequence(self, read_id: int) -> str:
+        _, record_index, mate = decode_read_id(read_id)
+        if mate == 0:
+            # Read id is from first file
+            sequence = self._first_file_index[record_index].seq
+            return self._process_line(sequence, False, self._cutoff[0])
+        # Read id is from second file
+        sequence = self._second_file_index[record_index].seq
+        return self._process_line(sequence, True, self._cutoff[1])
+
     def get_read_sequences_for_ids(
         self, read_ids: List[int]
     ) -> Tuple[List[int], List[str]]:
         if len(read_ids) == 0:
             return read_ids, []
 
-        sequences = []
-
-        for read_id in read_ids:
-            actual_id = int(str(read_id)[0:-1])
-            if str(read_id)[-1] == "1":
-                # Read id is from first file
-                sequence = self._first_file_index[actual_id - 1].seq
-                sequences.append(self._process_line(sequence, False, self._cutoff[0]))
-            else:
-                # Read id is from second file
-                sequence = self._second_file_index[actual_id - 1].seq
-                sequences.append(self._process_line(sequence, True, self._cutoff[1]))
+        sequences = [self._get_read_sequence(read_id) for read_id in read_ids]
 
         return read_ids, sequences
+
+    def iter_read_sequences_for_ids(
+        self, read_ids: List[int]
+    ) -> Iterator[Tuple[int, str]]:
+        """
+        Yields the given reads as Tuples (read_id, sequence), ordered by their
+        file and position in it, so that each file is read sequentially.
+        """
+        for read_id in sorted(
+            read_ids, key=lambda read_id: decode_read_id(read_id)[::-1]
+        ):
+            yield read_id, self._get_read_sequence(read_id)
@@ -1,13 +1,27 @@
 import gzip
+import zlib
 from pathlib import Path
 from unittest.mock import mock_open, patch
-from io import StringIO
+from io import BytesIO
 import pandas as pd
 
+import numpy as np
 import pytest
+from Bio import bgzf
 
 from pepti_map.importing.rna_import.lazy_rna_reader import LazyRNAReader
+from pepti_map.importing.rna_import.packed_read_store import PackedReadStore
+from pepti_map.importing.rna_import.read_index_builder import (
+    BackgroundReadIndexBuilder,
+    get_read_index_filepaths,
+)
+from pepti_map.importing.rna_import.record_offset_store import RecordOffsetStore
 from pepti_map.importing.rna_import.rna_reads_retriever import RNAReadsRetriever
+from pepti_map.importing.rna_import.threaded_gzip_reader import (
+    ThreadedGzipReader,
+    get_bgzf_block_offsets,
+    is_bgzf,
+)
 from pepti_map.importing.rna_import.testdata_rna_importer import (
     EXPECTED_RESULT_LINES_PAIRED_END,
     EXPECTED_RESULT_LINES_SINGLE_END,
@@ -15,6 +29,7 @@ from pepti_map.importing.rna_import.testdata_rna_importer import (
     MOCK_FILE_1_CONTENT,
     MOCK_FILE_2_CONTENT,
 )
+from pepti_map.util.read_id import decode_read_ids
 
 
 class TestLazyRNAReader:
@@ -28,7 +43,7 @@ class TestLazyRNAReader:
             for _ in LazyRNAReader([Path("file1"), Path("file2"), Path("file3")]):
                 continue
 
-    @patch("gzip.open", return_value=StringIO(MOCK_FILE_1_CONTENT))
+    @patch("gzip.open", return_value=BytesIO(MOCK_FILE_1_CONTENT.encode("utf-8")))
     def test_read_single_end_file_gzipped(self, _):
         read_lines = []
         for line in LazyRNAReader([Path("path/to/file.gz")]):
@@ -38,8 +53,8 @@ class TestLazyRNAReader:
     @patch(
         "builtins.open",
         side_effect=[
-            StringIO(MOCK_FILE_1_CONTENT),
-            StringIO(MOCK_FILE_2_CONTENT),
+            BytesIO(MOCK_FILE_1_CONTENT.encode("utf-8")),
+            BytesIO(MOCK_FILE_2_CONTENT.encode("utf-8")),
         ],
     )
     def test_read_paired_end_file(self, _):
@@ -48,13 +63,407 @@ class TestLazyRNAReader:
             read_lines.append(line)
         assert read_lines == EXPECTED_RESULT_LINES_PAIRED_END
 
-    @patch("builtins.open", mock_open(read_data=MOCK_FILE_1_CONTENT))
+    @patch("builtins.open", mock_open(read_data=MOCK_FILE_1_CONTENT.encode("utf-8")))
     def test_read_single_end_file_cutoff(self):
         read_lines = []
         for line in LazyRNAReader([Path("path/to/file")], cutoff=10):
             read_lines.append(line)
         assert read_lines == EXPECTED_RESULT_LINES_SINGLE_END_CUTOFF
 
+    @patch(
+        "builtins.open",
+        side_effect=[
+            BytesIO(MOCK_FILE_1_CONTENT.encode("utf-8")),
+            BytesIO(MOCK_FILE_2_CONTENT.encode("utf-8")),
+        ],
+    )
+    def test_read_paired_end_file_of_lane(self, _):
+        read_lines = list(
+            LazyRNAReader([Path("path/to/file1"), Path("path/to/file2")], lane=3)
+        )
+        assert [sequence for _, sequence in read_lines] == [
+            sequence for _, sequence in EXPECTED_RESULT_LINES_PAIRED_END
+        ]
+        lanes, record_indexes, mates = decode_read_ids(
+            np.array([read_id for read_id, _ in read_lines], dtype=np.uint64)
+        )
+        assert np.all(lanes == 3)
+        assert (record_indexes << 1 | mates).tolist() == [
+            read_id for read_id, _ in EXPECTED_RESULT_LINES_PAIRED_END
+        ]
+
+    def test_raises_error_on_invalid_lane(self):
+        with pytest.raises(ValueError):
+            LazyRNAReader([Path("file1")], lane=-1)
+
+    @pytest.mark.parametrize("block_size", [1, 7, 100, 1000])
+    def test_read_paired_end_file_in_batches(self, tmp_path, block_size):
+        with open(tmp_path / "file1.fq", "wt", encoding="utf-8") as test_file:
+            test_file.write(MOCK_FILE_1_CONTENT)
+        with gzip.open(tmp_path / "file2.fq.gz", "wt", encoding="utf-8") as test_file:
+            # Windows line endings and no newline at the end of the file
+            test_file.write(MOCK_FILE_2_CONTENT.rstrip("\n").replace("\n", "\r\n"))
+        reader = LazyRNAReader(
+            [tmp_path / "file1.fq", tmp_path / "file2.fq.gz"], block_size=block_size
+        )
+        read_lines = []
+        for read_ids, sequences in reader.iter_batches():
+            assert len(read_ids) == len(sequences)
+            read_lines.extend(zip(read_ids.tolist(), sequences))
+        assert read_lines == EXPECTED_RESULT_LINES_PAIRED_END
+        assert list(reader) == EXPECTED_RESULT_LINES_PAIRED_END
+
+    @pytest.mark.parametrize("block_size", [7, 100])
+    def test_read_reads_for_ids(self, tmp_path, block_size):
+        with open(tmp_path / "file1.fq", "wt", encoding="utf-8") as test_file:
+            test_file.write(MOCK_FILE_1_CONTENT)
+        with open(tmp_path / "file2.fq", "wt", encoding="utf-8") as test_file:
+            test_file.write(MOCK_FILE_2_CONTENT)
+        reader = LazyRNAReader(
+            [tmp_path / "file1.fq", tmp_path / "file2.fq"], block_size=block_size
+        )
+        assert len(list(reader.iter_batches())) > 2
+        expected_read_lines = EXPECTED_RESULT_LINES_PAIRED_END[::3]
+        # Unsorted and duplicate ids as well as ids of reads that do not exist
+        read_ids = [read_id for read_id, _ in expected_read_lines][::-1]
+        read_ids += read_ids[0:2] + [1 << 40]
+        assert list(reader.iter_reads_for_ids(read_ids)) == expected_read_lines
+        assert list(reader.iter_reads_for_ids([])) == []
+
+    @pytest.mark.parametrize("decompression_threads", [0, 2])
+    def test_resume_from_position(self, tmp_path, decompression_threads):
+        with gzip.open(tmp_path / "file1.fq.gz", "wt", encoding="utf-8") as test_file:
+            test_file.write(
+                MOCK_FILE_1_CONTENT  # pyright: ignore[reportGeneralTypeIssues]
+            )
+        with open(tmp_path / "file2.fq", "wt", encoding="utf-8") as test_file:
+            test_file.write(MOCK_FILE_2_CONTENT)
+        filepaths = [tmp_path / "file1.fq.gz", tmp_path / "file2.fq"]
+        for number_of_batches in range(1, 4):
+            reader = LazyRNAReader(
+                filepaths,
+                block_size=600,
+                decompression_threads=decompression_threads,
+            )
+            read_lines = []
+            for batch_index, (read_ids, sequences) in enumerate(reader.iter_batches()):
+                read_lines.extend(zip(read_ids.tolist(), sequences))
+                if batch_index + 1 == number_of_batches:
+                    break
+            resumed_reader = LazyRNAReader(
+                filepaths,
+                block_size=600,
+                decompression_threads=decompression_threads,
+                start_position=reader.get_position(),
+            )
+            assert read_lines + list(resumed_reader) == EXPECTED_RESULT_LINES_PAIRED_END
+
+    @pytest.mark.parametrize("cutoff", [-1, 10])
+    def test_read_paired_end_file_as_matrix(self, tmp_path, cutoff):
+        with open(tmp_path / "file1.fq", "wt", encoding="utf-8") as test_file:
+            test_file.write(MOCK_FILE_1_CONTENT)
+        with open(tmp_path / "file2.fq", "wt", encoding="utf-8") as test_file:
+            # Reads of different lengths
+            test_file.write(MOCK_FILE_2_CONTENT.replace("\nCACCGCGAAT", "\nCAC"))
+        reader = LazyRNAReader(
+            [tmp_path / "file1.fq", tmp_path / "file2.fq"], cutoff, block_size=1000
+        )
+        read_lines = []
+        for read_ids, sequence_matrix, lengths in reader.iter_matrix_batches():
+            assert sequence_matrix.dtype == np.uint8
+            assert sequence_matrix.shape == (len(read_ids), lengths.max())
+            for read_id, row, length in zip(read_ids, sequence_matrix, lengths):
+                assert not np.any(row[length:])
+                read_lines.append((read_id, row[0:length].tobytes().decode("ascii")))
+        assert read_lines == list(reader)
+
+    @pytest.mark.parametrize(
+        "sample_fraction,sample_size", [(0.3, None), (None, 40), (0.5, 40)]
+    )
+    def test_sample_paired_end_file(self, tmp_path, sample_fraction, sample_size):
+        with open(tmp_path / "file1.fq", "wt", encoding="utf-8") as test_file:
+            test_file.write(MOCK_FILE_1_CONTENT * 50)
+        with open(tmp_path / "file2.fq", "wt", encoding="utf-8") as test_file:
+            test_file.write(MOCK_FILE_2_CONTENT * 50)
+        filepaths = [tmp_path / "file1.fq", tmp_path / "file2.fq"]
+        all_read_lines = list(LazyRNAReader(filepaths, block_size=600))
+        reader = LazyRNAReader(
+            filepaths,
+            block_size=600,
+            sample_fraction=sample_fraction,
+            sample_size=sample_size,
+            sample_seed=1,
+        )
+        read_lines = list(reader)
+        assert set(read_lines) < set(all_read_lines)
+        assert read_lines == list(
+            LazyRNAReader(
+                filepaths,
+                sample_fraction=sample_fraction,
+                sample_size=sample_size,
+                sample_seed=1,
+            )
+        )
+        assert read_lines != list(
+            LazyRNAReader(
+                filepaths,
+                sample_fraction=sample_fraction,
+                sample_size=sample_size,
+                sample_seed=2,
+            )
+        )
+
+        _, record_indexes, mates = decode_read_ids(
+            np.array([read_id for read_id, _ in read_lines], dtype=np.uint64)
+        )
+        assert np.array_equal(record_indexes[mates == 0], record_indexes[mates == 1])
+        number_of_records = len(all_read_lines) // 2
+        if sample_size is not None:
+            assert 0 < np.count_nonzero(mates == 0) <= sample_size
+        assert reader.get_sampling_fraction() == min(
+            sample_fraction or 1.0,
+            (sample_size or number_of_records) / number_of_records,
+        )
+
+    def test_raises_error_on_invalid_sample_fraction(self):
+        with pytest.raises(ValueError):
+            LazyRNAReader([Path("file1.fq")], sample_fraction=1.5)
+        with pytest.raises(ValueError):
+            LazyRNAReader([Path("file1.fq")], sample_size=-1)
+
+    def test_empty_sample(self):
+        # The files are not even opened
+        reader = LazyRNAReader([Path("file1.fq"), Path("file2.fq")], sample_size=0)
+        assert list(reader) == []
+        assert reader.get_sampling_fraction() == 0.0
+        assert reader.get_position() == (2, 0, 0)
+
+
+class TestThreadedGzipReader:
+    def _write_test_files(self, tmp_path):
+        file_content = (MOCK_FILE_1_CONTENT * 200).encode("utf-8")
+        with open(tmp_path / "test_file.fq", "wb") as test_file:
+            test_file.write(file_content)
+        # Concatenated gzip members
+        with open(tmp_path / "test_file.fq.gz", "wb") as test_file:
+            test_file.write(gzip.compress(file_content[0:1000]))
+            test_file.write(gzip.compress(file_content[1000:]))
+        with bgzf.BgzfWriter(tmp_path / "test_file.fq.bgz", "wb") as test_file:
+            test_file.write(file_content)
+        return file_content
+
+    def test_detects_bgzf(self, tmp_path):
+        self._write_test_files(tmp_path)
+        assert is_bgzf(tmp_path / "test_file.fq.bgz")
+        assert not is_bgzf(tmp_path / "test_file.fq.gz")
+        assert not is_bgzf(tmp_path / "test_file.fq")
+
+    @pytest.mark.parametrize("filename", ["test_file.fq.gz", "test_file.fq.bgz"])
+    @pytest.mark.parametrize("n_threads", [1, 3])
+    def test_read(self, tmp_path, filename, n_threads):
+        file_content = self._write_test_files(tmp_path)
+        with ThreadedGzipReader(tmp_path / filename, n_threads, 2) as gzip_reader:
+            blocks = []
+            while True:
+                block = gzip_reader.read(777)
+                if len(block) == 0:
+                    break
+                blocks.append(block)
+        assert b"".join(blocks) == file_content
+
+    def test_close_before_end_of_file(self, tmp_path):
+        file_content = self._write_test_files(tmp_path)
+        gzip_reader = ThreadedGzipReader(tmp_path / "test_file.fq.bgz", 2, 1)
+        assert gzip_reader.read(10) == file_content[0:10]
+        gzip_reader.close()
+
+    def test_get_bgzf_block_offsets(self, tmp_path):
+        file_content = self._write_test_files(tmp_path)
+        compressed_offsets, uncompressed_offsets = get_bgzf_block_offsets(
+            tmp_path / "test_file.fq.bgz"
+        )
+        assert len(compressed_offsets) > 2
+        with open(tmp_path / "test_file.fq.bgz", "rb") as test_file:
+            for compressed_offset, uncompressed_offset in zip(
+                compressed_offsets, uncompressed_offsets
+            ):
+                test_file.seek(compressed_offset)
+                block = zlib.decompressobj(wbits=31).decompress(test_file.read())
+                assert file_content[uncompressed_offset:].startswith(block)
+
+    def test_raises_error_on_invalid_file(self, tmp_path):
+        with open(tmp_path / "test_file.fq.gz", "wb") as test_file:
+            test_file.write(gzip.compress(b"ACGT")[0:12] + b"invalid data")
+        with pytest.raises(zlib.error):
+            with ThreadedGzipReader(tmp_path / "test_file.fq.gz") as gzip_reader:
+                gzip_reader.read()
+
+    @pytest.mark.parametrize("filename", ["test_file.fq.gz", "test_file.fq.bgz"])
+    def test_raises_error_on_truncated_file(self, tmp_path, filename):
+        self._write_test_files(tmp_path)
+        with open(tmp_path / filename, "rb") as test_file:
+            compressed_content = test_file.read()
+        truncated_length = len(compressed_content) // 2
+        with open(tmp_path / filename, "wb") as test_file:
+            test_file.write(compressed_content[0:truncated_length])
+        with pytest.raises(EOFError):
+            with ThreadedGzipReader(tmp_path / filename) as gzip_reader:
+                gzip_reader.read()
+
+    def test_raises_error_on_corrupt_bgzf_block(self, tmp_path):
+        self._write_test_files(tmp_path)
+        compressed_offsets, _ = get_bgzf_block_offsets(tmp_path / "test_file.fq.bgz")
+        with open(tmp_path / "test_file.fq.bgz", "r+b") as test_file:
+            # Flip a bit of the CRC32 at the end of the first block
+            test_file.seek(compressed_offsets[1] - 8)
+            crc_byte = test_file.read(1)[0]
+            test_file.seek(compressed_offsets[1] - 8)
+            test_file.write(bytes([crc_byte ^ 1]))
+        with pytest.raises(ValueError):
+            with ThreadedGzipReader(tmp_path / "test_file.fq.bgz", 2) as gzip_reader:
+                gzip_reader.read()
+
+    def test_lazy_rna_reader(self, tmp_path):
+        with bgzf.BgzfWriter(tmp_path / "file1.fq.gz", "wb") as test_file:
+            test_file.write(MOCK_FILE_1_CONTENT.encode("utf-8"))
+        with gzip.open(tmp_path / "file2.fq.gz", "wt", encoding="utf-8") as test_file:
+            test_file.write(
+                MOCK_FILE_2_CONTENT  # pyright: ignore[reportGeneralTypeIssues]
+            )
+        read_lines = list(
+            LazyRNAReader(
+                [tmp_path / "file1.fq.gz", tmp_path / "file2.fq.gz"],
+                decompression_threads=2,
+            )
+        )
+        assert read_lines == EXPECTED_RESULT_LINES_PAIRED_END
+
+
+class TestPackedReadStore:
+    def _write_test_files(self, tmp_path):
+        with open(tmp_path / "file1.fq", "wt", encoding="utf-8") as test_file:
+            # Bases that cannot be packed into 2 bits
+            test_file.write(MOCK_FILE_1_CONTENT.replace("\nGCGTGTAATG", "\nNNGTGTARTn"))
+        with open(tmp_path / "file2.fq", "wt", encoding="utf-8") as test_file:
+            # Reads of different lengths
+            test_file.write(MOCK_FILE_2_CONTENT.replace("\nCACCGCGAAT", "\nCAN"))
+        return [tmp_path / "file1.fq", tmp_path / "file2.fq"]
+
+    @pytest.mark.parametrize("cutoff", [-1, 11])
+    def test_store_reads(self, tmp_path, cutoff):
+        reader = LazyRNAReader(self._write_test_files(tmp_path), cutoff, block_size=600)
+        read_store = PackedReadStore(tmp_path / "read_store")
+        for read_ids, sequence_matrix, lengths in reader.iter_matrix_batches():
+            read_store.append_batch(read_ids, sequence_matrix, lengths)
+        read_store.close()
+
+        expected_reads = list(reader)
+        assert any("N" in sequence for _, sequence in expected_reads)
+        stored_read_store = PackedReadStore(tmp_path / "read_store")
+        assert len(stored_read_store) == len(expected_reads)
+        read_ids = [read_id for read_id, _ in expected_reads][::-1]
+        assert stored_read_store.get_read_sequences_for_ids(read_ids) == (
+            read_ids,
+            [sequence for _, sequence in expected_reads][::-1],
+        )
+        assert list(stored_read_store.iter_read_sequences_for_ids(read_ids)) == (
+            expected_reads
+        )
+
+    def test_truncate(self, tmp_path):
+        reader = LazyRNAReader(self._write_test_files(tmp_path), block_size=600)
+        read_store = PackedReadStore(tmp_path / "read_store")
+        assert read_store.get_size() == (0, 0, 0)
+        batches = list(reader.iter_matrix_batches())
+        read_store.append_batch(*batches[0])
+        size = read_store.get_size()
+        for batch in batches[1:]:
+            read_store.append_batch(*batch)
+        read_store.truncate(size)
+
+        assert read_store.get_size() == size
+        assert len(read_store) == len(batches[0][0])
+        first_read_ids = batches[0][0].tolist()
+        assert read_store.get_read_sequences_for_ids(first_read_ids) == (
+            first_read_ids,
+            [
+                sequence
+                for read_id, sequence in reader
+                if read_id in set(first_read_ids)
+            ],
+        )
+        with pytest.raises(ValueError):
+            read_store.get_read_sequences_for_ids(batches[1][0].tolist())
+        with pytest.raises(ValueError):
+            read_store.truncate((len(read_store) + 1, 0, 0))
+
+
+class TestRecordOffsetStore:
+    @pytest.mark.parametrize("file_format", ["plain", "gzip", "bgzf"])
+    @pytest.mark.parametrize("cutoff", [-1, 11])
+    def test_store_reads(self, tmp_path, file_format, cutoff):
+        filepaths = [tmp_path / "file1.fq", tmp_path / "file2.fq"]
+        if file_format != "plain":
+            filepaths = [filepath.with_suffix(".fq.gz") for filepath in filepaths]
+        for filepath, file_content in zip(
+            filepaths, [MOCK_FILE_1_CONTENT * 300, MOCK_FILE_2_CONTENT * 300]
+        ):
+            if file_format == "bgzf":
+                with bgzf.BgzfWriter(filepath, "wb") as test_file:
+                    test_file.write(file_content.encode("utf-8"))
+            elif file_format == "gzip":
+                with gzip.open(filepath, "wt", encoding="utf-8") as test_file:
+                    test_file.write(
+                        file_content  # pyright: ignore[reportGeneralTypeIssues]
+                    )
+            else:
+                with open(filepath, "wt", encoding="utf-8") as test_file:
+                    test_file.write(file_content)
+        reader = LazyRNAReader(
+            filepaths,
+            (cutoff, cutoff),
+            block_size=10000,
+            sample_fraction=0.5,
+            record_offsets=True,
+        )
+        read_store = RecordOffsetStore(
+            tmp_path / "read_store", filepaths, (cutoff, cutoff)
+        )
+        expected_reads = {}
+        for read_ids, sequence_matrix, lengths in reader.iter_matrix_batches():
+            record_offsets = reader.get_record_offsets()
+            assert record_offsets is not None
+            assert len(record_offsets) == len(read_ids)
+            read_store.append_batch(read_ids, sequence_matrix, lengths, record_offsets)
+            for read_id, row, length in zip(read_ids, sequence_matrix, lengths):
+                expected_reads[read_id] = row[0:length].tobytes().decode("ascii")
+        read_store.close()
+
+        stored_read_store = RecordOffsetStore(
+            tmp_path / "read_store", filepaths, (cutoff, cutoff)
+        )
+        assert len(stored_read_store) == len(expected_reads)
+        read_ids = list(expected_reads.keys())[::-7]
+        for _ in range(2):
+            assert stored_read_store.get_read_sequences_for_ids(read_ids) == (
+                read_ids,
+                [expected_reads[read_id] for read_id in read_ids],
+            )
+        assert sorted(stored_read_store.iter_read_sequences_for_ids(read_ids)) == (
+            sorted((read_id, expected_reads[read_id]) for read_id in read_ids)
+        )
+        assert list(stored_read_store.iter_read_sequences_for_ids([])) == []
+        stored_read_store.close()
+
+    def test_raises_error_without_offsets(self, tmp_path):
+        read_store = RecordOffsetStore(tmp_path / "read_store", [], (-1, -1))
+        with pytest.raises(ValueError):
+            read_store.append_batch(
+                np.array([0], dtype=np.uint64),
+                np.zeros((1, 4), dtype=np.uint8),
+                np.array([4], dtype=np.int32),
+            )
+
 
 class TestRNAReadsRetriever:
     def test_raises_error_when_no_file_given(self):
@@ -72,7 +481,7 @@ class TestRNAReadsRetriever:
             )
 
         reads_retriever = RNAReadsRetriever([tmp_path / "test_file.gz"])
-        expected_ids = [11, 41, 51]
+        expected_ids = [0, 6, 8]
         expected_reads = [
             (
                 "GCGTGTAATGTTATGATCTTATGCTTGTTTTAGTCCGCTAGGTTCTTT"
@@ -87,7 +496,7 @@ class TestRNAReadsRetriever:
                 "GTACAAACAGAGCTGATGCCCACTATTTCACGTAAGTAGTGGGAGGGTCGCGTGC"
             ),
         ]
-        assert reads_retriever.get_read_sequences_for_ids([11, 41, 51]) == (
+        assert reads_retriever.get_read_sequences_for_ids([0, 6, 8]) == (
             expected_ids,
             expected_reads,
         )
@@ -109,7 +518,7 @@ class TestRNAReadsRetriever:
         reads_retriever = RNAReadsRetriever(
             [tmp_path / "test_file_1.gz", tmp_path / "test_file_2.gz"]
         )
-        expected_ids = [12, 21, 31, 32, 41, 52]
+        expected_ids = [1, 2, 4, 5, 6, 9]
         expected_reads = [
             (
                 "GAGCTCGATTTGCAATGAGCCGCCCCTCTTCCATAAAATCTTGCAAATTC"
@@ -136,7 +545,7 @@ class TestRNAReadsRetriever:
                 "TTCATCTTATAGCAACACCCCGGAGTAAGCGCACTCATCCTCTCCTATC"
             ),
         ]
-        assert reads_retriever.get_read_sequences_for_ids([12, 21, 31, 32, 41, 52]) == (
+        assert reads_retriever.get_read_sequences_for_ids([1, 2, 4, 5, 6, 9]) == (
             expected_ids,
             expected_reads,
         )
@@ -145,13 +554,42 @@ class TestRNAReadsRetriever:
         with open(tmp_path / "test_file_1.fq", "wt", encoding="utf-8") as test_file:
             test_file.write(MOCK_FILE_1_CONTENT)
         reads_retriever = RNAReadsRetriever([tmp_path / "test_file_1.fq"], cutoff=10)
-        expected_ids = [11, 41, 51]
+        expected_ids = [0, 6, 8]
         expected_reads = [
             "GCGTGTAATG",
             "GCGTGTAATG",
             "ACCGCCACGC",
         ]
-        assert reads_retriever.get_read_sequences_for_ids([11, 41, 51]) == (
+        assert reads_retriever.get_read_sequences_for_ids([0, 6, 8]) == (
             expected_ids,
             expected_reads,
         )
+
+    def test_background_index_builder(self, tmp_path):
+        filepaths = [tmp_path / "test_file_1.fq.gz", tmp_path / "test_file_2.fq.gz"]
+        for filepath, file_content in zip(
+            filepaths, [MOCK_FILE_1_CONTENT, MOCK_FILE_2_CONTENT]
+        ):
+            with gzip.open(filepath, "wt", encoding="utf-8") as test_file:
+                test_file.write(
+                    file_content  # pyright: ignore[reportGeneralTypeIssues]
+                )
+        index_dir = tmp_path / "read_indexes"
+        index_filepaths = get_read_index_filepaths(filepaths, index_dir)
+        # Leftover of an interrupted build
+        index_dir.mkdir()
+        (index_dir / (index_filepaths[1].name + ".tmp")).write_bytes(b"incomplete")
+
+        read_index_builder = BackgroundReadIndexBuilder(filepaths, index_dir)
+        read_index_builder.start()
+        read_index_builder.wait()
+        assert all(index_filepath.is_file() for index_filepath in index_filepaths)
+        assert list(index_dir.glob("*.tmp")) == []
+        assert list(tmp_path.glob("*.fxi")) == []
+
+        read_ids = [9, 6, 5, 4, 2, 1]
+        reads_retriever = RNAReadsRetriever(filepaths, index_dir=index_dir)
+        _, sequences = reads_retriever.get_read_sequences_for_ids(read_ids)
+        assert list(reads_retriever.iter_read_sequences_for_ids(read_ids)) == sorted(
+            zip(read_ids, sequences), key=lambda read: (read[0] & 1, read[0])
+        )
@@ -47,35 +47,35 @@ GATAGGAGAGGATGAGTGCGCTTACTCCGGGGTGTTGCTATAAGATGAAAACAGGGGTATAAAACAGTTGGGAGCGTACT
 
 EXPECTED_RESULT_LINES_SINGLE_END = [
     (
-        11,
+        0,
         (
             "GCGTGTAATGTTATGATCTTATGCTTGTTTTAGTCCGCTAGGTTCT"
             "TTGGTGTACTGCCACTTTTCGATGCCATGCGCATTCTTGGGACTAGGAAGTACGA"
         ),
     ),
     (
-        21,
+        2,
         (
             "ACCGCCACGCTTACCGTTTTGGCGCTATGCTTCCATTCTGTTGTCTACGAGGC"
             "GATAACAACACGATACGCTCTGTTCTTACTCAGACTTATTCCGAAGCC"
         ),
     ),
     (
-        31,
+        4,
         (
             "GGCCCTCGAGATACGCGCGGGAGTACGCTCCCAACTGTTTTATACCCCTGTTTT"
             "CATCTTATAGCAACACCCCGGAGTAAGCGCACTCATCCTCTCCTATC"
         ),
     ),
     (
-        41,
+        6,
         (
             "GCGTGTAATGTTATGATCTTATGCTTGTTTTAGTCCGCTAGGTTCTTT"
             "GGTGTACTGCCACTTTTCGATGCCATGCGCATTCTTGGGACTAGGAAGTACGA"
         ),
     ),
     (
-        51,
+        8,
         (
             "ACCGCCACGCATCCTACCTTGTAAGAGGATATCAATGGCGATCGGTGTACA"
             "AACAGAGCTGATGCCCACTATTTCACGTAAGTAGTGGGAGGGTCGCGTGC"
@@ -84,44 +84,44 @@ EXPECTED_RESULT_LINES_SINGLE_END = [
 ]
 
 EXPECTED_RESULT_LINES_SINGLE_END_CUTOFF = [
-    (11, "GCGTGTAATG"),
-    (21, "ACCGCCACGC"),
-    (31, "GGCCCTCGAG"),
-    (41, "GCGTGTAATG"),
-    (51, "ACCGCCACGC"),
+    (0, "GCGTGTAATG"),
+    (2, "ACCGCCACGC"),
+    (4, "GGCCCTCGAG"),
+    (6, "GCGTGTAATG"),
+    (8, "ACCGCCACGC"),
 ]
 
 EXPECTED_RESULT_LINES_PAIRED_END = EXPECTED_RESULT_LINES_SINGLE_END + [
     (
-        12,
+        1,
         (
             "GAGCTCGATTTGCAATGAGCCGCCCCTCTTCCATAAAATCTTGCAAATTC"
             "CGCGTCTCGGGCTCTGTCCAACACGTATGCCTCCCTTCACGATGACTTAAG"
         ),
     ),
     (
-        22,
+        3,
         (
             "TCTGGATCCTGACCAGCGTCTGACGAGAATTTTCTTTTTTGGAGAAATAC"
             "CGTGAGAGAAATACCCGAAAGCGGATCCCCTGGGCGGAAACCGTGCAGCCT"
         ),
     ),
     (
-        32,
+        5,
         (
             "AGCACCTGGTGCATTACTTCCTACCAACATGGATACAAGATGGGCCTTGCG"
             "CTCTTTAAGTCCGCTGAGATTGCTCTATTCACTAAATCGTACGTACTGGA"
         ),
     ),
     (
-        42,
+        7,
         (
             "GCTTGTGCGAGTTCTACCAACGGGCAACGGTACACAACTTAACTCTGGACTCT"
             "NGCAGCTGGTAATGCGTCTGCCCCAGACAAGCATTGTAATTCGCGGTG"
         ),
     ),
     (
-        52,
+        9,
         (
             "GGCCCTCGAGATACGCGCGGGAGTACGCTCCCAACTGTTTTATACCCCTGTT"
             "TTCATCTTATAGCAACACCCCGGAGTAAGCGCACTCATCCTCTCCTATC"
@@ -0,0 +1,278 @@
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+import logging
+from pathlib import Path
+import queue
+import struct
+import threading
+from typing import BinaryIO, Deque, List, Tuple, Union
+import zlib
+
+_GZIP_MAGIC = b"\x1f\x8b\x08"
+_FEXTRA = 4
+_RAW_CHUNK_SIZE = 1 << 20
+
+
+def _get_bgzf_block_size(extra_field: bytes) -> Union[int, None]:
+    """
+    Reads the size of a BGZF block from the extra field of its gzip header.
+    :returns The total size of the block or None if the header has no BGZF
+    subfield.
+    :rtype Union[int, None]
+    """
+    position = 0
+    while position + 4 <= len(extra_field):
+        subfield_id = extra_field[position : position + 2]  # noqa: E203
+        (subfield_length,) = struct.unpack(
+            "<H", extra_field[position + 2 : position + 4]  # noqa: E203
+        )
+        if subfield_id == b"BC" and subfield_length == 2:
+            return (
+                struct.unpack(
+                    "<H", extra_field[position + 4 : position + 6]  # noqa: E203
+                )[0]
+                + 1
+            )
+        position += 4 + subfield_length
+    return None
+
+
+def is_bgzf(filepath: Path) -> bool:
+    """
+    Checks whether the given file is a BGZF file, i.e. a gzip file consisting
+    of independently compressed blocks whose sizes are stored in their headers.
+    """
+    with open(filepath, "rb") as gzip_file:
+        header = gzip_file.read(12)
+        if len(header) < 12 or header[0:3] != _GZIP_MAGIC or not header[3] & _FEXTRA:
+            return False
+        (extra_length,) = struct.unpack("<H", header[10:12])
+        return _get_bgzf_block_size(gzip_file.read(extra_length)) is not None
+
+
+def get_bgzf_block_offsets(filepath: Path) -> Tuple[List[int], List[int]]:
+    """
+    Determines the compressed and uncompressed start offsets of all blocks of
+    a BGZF file from the block headers and trailers, without decompressing it.
+    :returns A Tuple (compressed_offsets, uncompressed_offsets).
+    :rtype Tuple[List[int], List[int]]
+    """
+    compressed_offsets: List[int] = []
+    uncompressed_offsets: List[int] = []
+    compressed_offset = 0
+    uncompressed_offset = 0
+    with open(filepath, "rb") as gzip_file:
+        while True:
+            header = gzip_file.read(12)
+            if len(header) == 0:
+                break
+            block_size = None
+            if len(header) == 12 and header[0:3] == _GZIP_MAGIC:
+                (extra_length,) = struct.unpack("<H", header[10:12])
+                block_size = _get_bgzf_block_size(gzip_file.read(extra_length))
+            if block_size is None:
+                error_message = f"Invalid BGZF block header in file {filepath}."
+                logging.error(error_message)
+                raise ValueError(error_message)
+            # The uncompressed size is stored at the end of the block
+            gzip_file.seek(compressed_offset + block_size - 4)
+            (uncompressed_size,) = struct.unpack("<I", gzip_file.read(4))
+            compressed_offsets.append(compressed_offset)
+            uncompressed_offsets.append(uncompressed_offset)
+            compressed_offset += block_size
+            uncompressed_offset += uncompressed_size
+    return compressed_offsets, uncompressed_offsets
+
+
+class ThreadedGzipReader:
+    """
+    Binary file-like object that decompresses a gzip file in a background
+    thread, which hands the decompressed blocks to the reading thread via a
+    bounded queue. As zlib releases the GIL, decompression then runs in
+    parallel to the processing of the blocks that were already read.
+    BGZF files are decompressed block by block by `n_threads` threads in
+    parallel, other gzip files by the background thread alone.
+    """
+
+    def __init__(self, filepath: Path, n_threads: int = 1, queue_size: int = 16):
+        self._filepath: Path = filepath
+        self._n_threads: int = max(n_threads, 1)
+        self._queue: "queue.Queue[Union[bytes, BaseException, None]]" = queue.Queue(
+            maxsize=queue_size
+        )
+        self._stop_event: threading.Event = threading.Event()
+        self._buffer: bytes = b""
+        self._is_eof: bool = False
+        self._position: int = 0
+        if is_bgzf(filepath):
+            logging.info(
+                f"Detected BGZF file: {filepath}. "
+                f"Decompressing its blocks with {self._n_threads} threads..."
+            )
+            target = self._decompress_bgzf
+        else:
+            target = self._decompress_gzip
+        self._thread: threading.Thread = threading.Thread(target=target, daemon=True)
+        self._thread.start()
+
+    def _put(self, item: Union[bytes, BaseException, None]) -> bool:
+        """
+        Puts the item into the queue, waiting until there is space or the
+        reader is closed.
+        :returns Whether the item was put into the queue.
+        """
+        while not self._stop_event.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _raise_truncated_file_error(self) -> None:
+        error_message = (
+            f"The gzip file {self._filepath} ended before the end of its "
+            "last block. It is probably truncated."
+        )
+        logging.error(error_message)
+        raise EOFError(error_message)
+
+    def _decompress_gzip(self) -> None:
+        try:
+            with open(self._filepath, "rb") as gzip_file:
+                # None between two gzip members
+                decompressor = None
+                while not self._stop_event.is_set():
+                    compressed_data = gzip_file.read(_RAW_CHUNK_SIZE)
+                    if len(compressed_data) == 0:
+                        if decompressor is not None and not decompressor.eof:
+                            self._raise_truncated_file_error()
+                        break
+                    while len(compressed_data) > 0:
+                        if decompressor is None:
+                            decompressor = zlib.decompressobj(wbits=31)
+                        data = decompressor.decompress(compressed_data)
+                        if len(data) > 0 and not self._put(data):
+                            return
+                        compressed_data = b""
+                        if decompressor.eof:
+                            # Multiple gzip members are concatenated
+                            compressed_data = decompressor.unused_data
+                            decompressor = None
+            self._put(None)
+        except BaseException as error:
+            self._put(error)
+
+    def _read_bgzf_block(self, gzip_file: BinaryIO) -> Union[bytes, None]:
+        """
+        :returns The raw deflate data of the next block, followed by its CRC32
+        and uncompressed size, or None at the end of the file.
+        raises EOFError: Raised if the file ends within the block.
+        """
+        header = gzip_file.read(12)
+        if len(header) == 0:
+            return None
+        if len(header) < 12:
+            self._raise_truncated_file_error()
+        (extra_length,) = struct.unpack("<H", header[10:12])
+        extra_field = gzip_file.read(extra_length)
+        block_size = _get_bgzf_block_size(extra_field)
+        if header[0:3] != _GZIP_MAGIC or block_size is None:
+            error_message = f"Invalid BGZF block header in file {self._filepath}."
+            logging.error(error_message)
+            raise ValueError(error_message)
+        remaining_size = block_size - 12 - extra_length
+        block = gzip_file.read(remaining_size)
+        if len(block) < remaining_size or remaining_size < 8:
+            self._raise_truncated_file_error()
+        return block
+
+    def _decompress_bgzf_block(self, block: bytes) -> bytes:
+        """
+        Decompresses the raw deflate data of a block and verifies it against
+        the CRC32 and the uncompressed size at the end of the block.
+        raises ValueError: Raised if the block is corrupt.
+        """
+        crc, uncompressed_size = struct.unpack("<II", block[-8:])
+        data = zlib.decompress(block[0:-8], -15)
+        if len(data) != uncompressed_size or zlib.crc32(data) != crc:
+            error_message = f"Corrupt BGZF block in file {self._filepath}."
+            logging.error(error_message)
+            raise ValueError(error_message)
+        return data
+
+    def _decompress_bgzf(self) -> None:
+        try:
+            with open(self._filepath, "rb") as gzip_file, ThreadPoolExecutor(
+                self._n_threads
+            ) as executor:
+                pending_blocks: Deque[Future] = deque()
+                while not self._stop_event.is_set():
+                    compressed_data = self._read_bgzf_block(gzip_file)
+                    if compressed_data is not None:
+                        pending_blocks.append(
+                            executor.submit(
+                                self._decompress_bgzf_block, compressed_data
+                            )
+                        )
+                    # Keep all threads busy, while passing on the blocks in order
+                    while len(pending_blocks) > 0 and (
+                        compressed_data is None
+                        or len(pending_blocks) >= 2 * self._n_threads
+                    ):
+                        data = pending_blocks.popleft().result()
+                        if len(data) > 0 and not self._put(data):
+                            return
+                    if compressed_data is None:
+                        break
+            self._put(None)
+        except BaseException as error:
+            self._put(error)
+
+    def read(self, size: int = -1) -> bytes:
+        blocks: List[bytes] = [self._buffer]
+        number_of_bytes = len(self._buffer)
+        while not self._is_eof and (size < 0 or number_of_bytes < size):
+            item = self._queue.get()
+            if item is None:
+                self._is_eof = True
+            elif isinstance(item, BaseException):
+                self._is_eof = True
+                raise item
+            else:
+                blocks.append(item)
+                number_of_bytes += len(item)
+        data = b"".join(blocks)
+        if size < 0:
+            self._buffer = b""
+            self._position += len(data)
+            return data
+        self._buffer = data[size:]
+        self._position += min(size, len(data))
+        return data[0:size]
+
+    def seek(self, offset: int) -> int:
+        """
+        Moves to the given uncompressed offset by decompressing and discarding
+        all data up to it. Only seeking forward is supported.
+        raises ValueError: Raised if the offset is before the current position.
+        """
+        if offset < self._position:
+            error_message = "Can only seek forward in a gzip file read by threads."
+            logging.error(error_message)
+            raise ValueError(error_message)
+        while self._position < offset and len(
+            self.read(min(offset - self._position, _RAW_CHUNK_SIZE))
+        ):
+            continue
+        return self._position
+
+    def close(self) -> None:
+        self._stop_event.set()
+        self._thread.join()
+
+    def __enter__(self) -> "ThreadedGzipReader":
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
@@ -1,27 +1,67 @@
+from functools import partial
 import logging
+import multiprocessing
 from pathlib import Path
 import shutil
-from typing import List, Literal, Set, Tuple, Union
+import tempfile
+from typing import Callable, Dict, Iterator, List, Literal, Set, Tuple, Union
 import click
+from dotenv import dotenv_values
 import numpy as np
 import numpy.typing as npt
 from pepti_map.aligning.gmap_wrapper import GmapWrapper
-from pepti_map.assembling.assembly_helper import AssemblyHelper
+from pepti_map.assembling.multiplexed_fasta_writer import (
+    DEFAULT_MAX_OPEN_FILES,
+    write_read_sets_to_fasta_files,
+)
 from pepti_map.assembling.trinity_wrapper import TrinityWrapper
 from pepti_map.constants import (
     PATH_PEPTIDE_TO_CLUSTER_MAPPING_FILE,
     PATH_TO_LAST_STEP_FILE,
+    PATH_TO_MATCHING_CHECKPOINT,
     PATH_TO_MERGED_INDEXES,
+    PATH_TO_PEPTIDE_INDEX_DELTA,
+    PATH_TO_PEPTIDE_TABLE,
+    PATH_TO_READ_INDEXES,
+    PATH_TO_READ_STORE,
     PATH_TO_TEMP_FILES,
     Step,
 )
-from pepti_map.importing.peptide_import.peptide_importer import PeptideImporter
+from pepti_map.importing.peptide_import.peptide_index_cache import (
+    PeptideIndexCache,
+    compute_file_hash,
+)
+from pepti_map.importing.peptide_import.peptide_index_store import PeptideIndexStore
 from pepti_map.importing.peptide_import.peptide_to_index_importer import (
     PeptideToIndexImporter,
 )
+from pepti_map.importing.peptide_import.peptide_to_table_importer import (
+    PeptideToTableImporter,
+)
+from pepti_map.importing.peptide_import.psm_table_importer import PsmTableImporter
 from pepti_map.importing.rna_import.lazy_rna_reader import LazyRNAReader
+from pepti_map.importing.rna_import.packed_read_store import PackedReadStore
+from pepti_map.importing.rna_import.read_index_builder import (
+    BackgroundReadIndexBuilder,
+)
+from pepti_map.importing.rna_import.read_store import IReadStore
+from pepti_map.importing.rna_import.record_offset_store import RecordOffsetStore
 from pepti_map.importing.rna_import.rna_reads_retriever import RNAReadsRetriever
 from pepti_map.matching.match_merger import MatchMerger
+from pepti_map.matching.lane_matcher import (
+    LaneMatcher,
+    match_lanes_in_parallel,
+)
+from pepti_map.matching.matching_engines.aho_corasick_matching_engine import (
+    AhoCorasickMatchingEngine,
+)
+from pepti_map.matching.matching_engines.kmer_matching_engine import (
+    KmerMatchingEngine,
+)
+from pepti_map.matching.matching_engines.matching_engine import IMatchingEngine
+from pepti_map.matching.matching_engines.verifying_kmer_matching_engine import (
+    VerifyingKmerMatchingEngine,
+)
 from pepti_map.matching.precomputing_rna_to_peptide_matcher import (
     PrecomputingRNAToPeptideMatcher,
 )
@@ -29,6 +69,19 @@ from pepti_map.matching.rna_to_peptide_matcher import RNAToPeptideMatcher
 from pepti_map.output_generation.pogo_input_helper import PoGoInputHelper
 from pepti_map.output_generation.pogo_output_helper import PoGoOutputHelper
 from pepti_map.output_generation.pogo_wrapper import PoGoWrapper
+from pepti_map.peptide_data.array_peptide_kmer_index import ArrayPeptideKmerIndex
+from pepti_map.peptide_data.duplicate_peptide_mapping import DuplicatePeptideMapping
+from pepti_map.peptide_data.kmer_bloom_filter import KmerBloomFilter
+from pepti_map.peptide_data.kmer_index import IKmerIndex
+from pepti_map.peptide_data.peptide_index_delta import PeptideIndexDelta
+from pepti_map.peptide_data.peptide_table import PeptideTable
+from pepti_map.util.read_id import (
+    MAX_NUMBER_OF_LANES,
+    decode_read_ids,
+    split_read_ids_by_lane,
+)
+
+DEFAULT_PREVIEW_SAMPLE_SIZE = 1_000_000
 
 
 def _setup(output_dir: str):
@@ -54,6 +107,49 @@ def _get_last_step() -> int:
         return -1
 
 
+def _get_index_n_processes() -> int:
+    try:
+        n_processes = dotenv_values().get("INDEX_N_PROCESSES")
+        assert isinstance(n_processes, str)
+        return int(n_processes)
+    except (AssertionError, ValueError):
+        return 1
+
+
+def _get_decompression_n_threads() -> int:
+    try:
+        n_threads = dotenv_values().get("DECOMPRESSION_N_THREADS")
+        assert isinstance(n_threads, str)
+        return int(n_threads)
+    except (AssertionError, ValueError):
+        return 0
+
+
+def _get_lane_n_processes(number_of_lanes: int) -> int:
+    try:
+        n_processes = dotenv_values().get("LANE_N_PROCESSES")
+        assert isinstance(n_processes, str)
+        return int(n_processes)
+    except (AssertionError, ValueError):
+        return min(multiprocessing.cpu_count(), number_of_lanes)
+
+
+def _get_trinity_input_max_open_files() -> int:
+    try:
+        max_open_files = dotenv_values().get("TRINITY_INPUT_MAX_OPEN_FILES")
+        assert isinstance(max_open_files, str)
+        return int(max_open_files)
+    except (AssertionError, ValueError):
+        return DEFAULT_MAX_OPEN_FILES
+
+
+def _read_kmer_stop_list(kmer_stop_list_file: Union[str, None]) -> List[str]:
+    if kmer_stop_list_file is None:
+        return []
+    with open(kmer_stop_list_file, "rt", encoding="utf-8") as stop_list_file:
+        return [line.strip() for line in stop_list_file if line.strip() != ""]
+
+
 def load_matches(
     precompute_intersections: bool,
 ) -> Tuple[List[Union[Set[int], None]], Union[npt.NDArray[np.uint32], None]]:
@@ -69,40 +165,464 @@ def load_matches(
     return matches, precomputed_intersections
 
 
-def compute_matches(
+def _load_peptide_table(peptide_files: List[str]) -> PeptideTable:
+    if PeptideTable.exists(PATH_TO_PEPTIDE_TABLE):
+        return PeptideTable.load(PATH_TO_PEPTIDE_TABLE)
+    # Temp directory of a run before the peptide table was introduced,
+    # which only supported a single peptide file
+    logging.info("No peptide table found, importing peptide file again.")
+    peptide_table = PeptideToTableImporter().import_file(Path(peptide_files[0]))
+    with open(
+        PATH_PEPTIDE_TO_CLUSTER_MAPPING_FILE, "rt", encoding="utf-8"
+    ) as peptide_to_cluster_file:
+        peptide_table.cluster_ids = np.array(
+            [int(line.strip()) for line in peptide_to_cluster_file], dtype=np.int32
+        )
+    return peptide_table
+
+
+def _import_peptide_table(
     peptide_file: str,
-    rna_file: str,
-    paired_end_file: str,
+    peptide_format: Literal["plain", "mztab", "tsv"],
+    min_peptide_length: int,
+    sequence_column: Union[str, None],
+    protein_group_column: Union[str, None],
+) -> PeptideTable:
+    if peptide_format == "plain":
+        return PeptideToTableImporter(min_peptide_length).import_file(
+            Path(peptide_file)
+        )
+    return PsmTableImporter(
+        min_peptide_length, peptide_format, sequence_column, protein_group_column
+    ).import_file(Path(peptide_file))
+
+
+def _import_peptides(
+    peptide_files: List[str],
+    peptide_format: Literal["plain", "mztab", "tsv"],
+    min_peptide_length: int,
+    sequence_column: Union[str, None],
+    protein_group_column: Union[str, None],
+    importer: Union[PeptideToIndexImporter, None],
+    index_store_dir: Union[str, None],
+    preview: bool,
+) -> Tuple[PeptideTable, Union[IKmerIndex, None]]:
+    """
+    Imports the peptide files in the given order into one peptide table and,
+    if an importer is given, into one unmasked k-mer index. The peptides of each
+    further file are appended to the ones of the previous files, and the delta
+    of these appends is written to the temp directory.
+    If a directory for the index store is given, only the files not yet
+    contained in the stored index are appended to it.
+    """
+    index_store = None
+    index_store_settings: Dict[str, Union[str, int, None]] = {}
+    if importer is not None and index_store_dir is not None:
+        index_store = PeptideIndexStore(Path(index_store_dir))
+        index_store_settings = {
+            "kmer_length": importer.kmer_length,
+            "index_type": importer.index_type,
+            "min_peptide_length": importer.min_peptide_length,
+            "minimizer_window": importer.minimizer_window,
+            "deduplicate_peptides": importer.deduplicate_peptides,
+            "peptide_format": peptide_format,
+            "sequence_column": sequence_column,
+            "protein_group_column": protein_group_column,
+        }
+
+    peptide_table: Union[PeptideTable, None] = None
+    kmer_index: Union[IKmerIndex, None] = None
+    number_of_imported_files = 0
+    if index_store is not None:
+        stored_index = index_store.load(peptide_files, index_store_settings)
+        if stored_index is not None:
+            kmer_index, peptide_table, number_of_imported_files = stored_index
+
+    delta: Union[PeptideIndexDelta, None] = None
+    for peptide_file in peptide_files[number_of_imported_files:]:
+        new_peptide_table = _import_peptide_table(
+            peptide_file,
+            peptide_format,
+            min_peptide_length,
+            sequence_column,
+            protein_group_column,
+        )
+        logging.info(f"Imported {len(new_peptide_table)} peptides from {peptide_file}.")
+        if peptide_table is None:
+            peptide_table = new_peptide_table
+            if importer is not None:
+                kmer_index, _ = importer.import_file_to_index(
+                    Path(peptide_file), peptide_table=peptide_table, finalize=False
+                )
+        elif importer is None or kmer_index is None:
+            peptide_table = peptide_table.append(new_peptide_table)
+        else:
+            peptide_table, _, file_delta = importer.append_peptide_table_to_index(
+                kmer_index, peptide_table, new_peptide_table, True, [peptide_file]
+            )
+            delta = file_delta if delta is None else delta.combine(file_delta)
+    assert peptide_table is not None
+
+    # A preview does not change the temporary files or the stored index
+    if preview:
+        return peptide_table, kmer_index
+    if delta is not None:
+        delta.save(PATH_TO_PEPTIDE_INDEX_DELTA)
+    else:
+        PATH_TO_PEPTIDE_INDEX_DELTA.unlink(missing_ok=True)
+    if (
+        index_store is not None
+        and kmer_index is not None
+        and number_of_imported_files < len(peptide_files)
+    ):
+        index_store.store(
+            kmer_index, peptide_table, peptide_files, index_store_settings
+        )
+    return peptide_table, kmer_index
+
+
+def _create_matching_engine(
+    peptide_files: List[str],
+    peptide_format: Literal["plain", "mztab", "tsv"],
+    sequence_column: Union[str, None],
+    protein_group_column: Union[str, None],
+    index_store_dir: Union[str, None],
+    kmer_length: int,
+    matching_engine: Literal["kmer", "aho-corasick"],
+    index_type: Literal["dict", "array"],
+    cluster_postings: bool,
+    max_postings_length: Union[int, None],
+    kmer_stop_list_file: Union[str, None],
+    min_peptide_length: Union[int, None],
+    bloom_filter: bool,
+    minimizer_window: int,
+    min_shared_kmers: int,
+    deduplicate_peptides: bool,
+    preview: bool,
+) -> Tuple[IMatchingEngine, PeptideTable, Union[DuplicatePeptideMapping, None]]:
+    index_cache = PeptideIndexCache.from_env()
+    index_n_processes = _get_index_n_processes()
+    if peptide_format != "plain":
+        # The cache key does not include the settings of the other formats
+        index_cache = None
+    importer = PeptideToIndexImporter(
+        kmer_length,
+        index_type,
+        index_cache,
+        index_n_processes,
+        max_postings_length,
+        _read_kmer_stop_list(kmer_stop_list_file),
+        min_peptide_length,
+        minimizer_window,
+        deduplicate_peptides,
+        not preview,
+    )
+    peptide_table, kmer_index = _import_peptides(
+        peptide_files,
+        peptide_format,
+        importer.min_peptide_length,
+        sequence_column,
+        protein_group_column,
+        importer if matching_engine == "kmer" else None,
+        index_store_dir,
+        preview,
+    )
+    peptide_to_cluster_mapping = peptide_table.get_peptide_to_cluster_mapping()
+    duplicate_peptide_mapping = None
+    if deduplicate_peptides:
+        duplicate_peptide_mapping = DuplicatePeptideMapping.from_peptide_table(
+            peptide_table
+        )
+        logging.info(
+            f"Collapsed {duplicate_peptide_mapping.get_number_of_duplicates()} "
+            "duplicate peptides."
+        )
+    if matching_engine == "aho-corasick":
+        automaton_peptide_to_cluster_mapping = peptide_to_cluster_mapping
+        if duplicate_peptide_mapping is not None:
+            # Peptides with a cluster id of -1 are left out of the automaton
+            automaton_peptide_to_cluster_mapping = [
+                cluster_id if duplicate_peptide_mapping.is_canonical(peptide_id) else -1
+                for peptide_id, cluster_id in enumerate(peptide_to_cluster_mapping)
+            ]
+        automaton = AhoCorasickMatchingEngine(
+            peptide_table.get_normalized_sequences(),
+            automaton_peptide_to_cluster_mapping,
+            False,
+        )
+        logging.info(
+            "Compiled peptides into automaton with "
+            f"{automaton.get_number_of_nodes()} nodes."
+        )
+        return automaton, peptide_table, duplicate_peptide_mapping
+
+    assert kmer_index is not None
+    importer.finalize_index(kmer_index)
+    logging.info("Imported peptides to index.")
+    if cluster_postings:
+        if isinstance(kmer_index, ArrayPeptideKmerIndex):
+            kmer_index.build_cluster_postings(peptide_to_cluster_mapping)
+            logging.info("Built cluster postings for index.")
+        else:
+            logging.warning(
+                "Cluster postings are only supported for the array index, "
+                "ignoring the option."
+            )
+    kmer_filter = None
+    if bloom_filter:
+        kmer_filter = KmerBloomFilter.from_index(kmer_index)
+        logging.info(
+            f"Built Bloom filter of {kmer_filter.get_size_in_bytes()} bytes for index."
+        )
+    if min_shared_kmers > 1:
+        return (
+            VerifyingKmerMatchingEngine(
+                kmer_index,
+                peptide_to_cluster_mapping,
+                peptide_table.get_normalized_sequences(),
+                min_shared_kmers,
+                kmer_filter,
+                False,
+            ),
+            peptide_table,
+            duplicate_peptide_mapping,
+        )
+    return (
+        KmerMatchingEngine(kmer_index, peptide_to_cluster_mapping, kmer_filter),
+        peptide_table,
+        duplicate_peptide_mapping,
+    )
+
+
+def _get_rna_files_per_lane(
+    rna_files: Tuple[str, ...], paired_end_files: Tuple[str, ...]
+) -> List[List[Path]]:
+    """
+    Pairs the given RNA-seq files by their position, with each pair
+    (or single file in case of single-end sequencing) forming one lane.
+    """
+    if len(paired_end_files) not in [0, len(rna_files)]:
+        error_message = (
+            "Expected either no paired-end files or one for each RNA-seq file, "
+            f"but received {len(paired_end_files)} paired-end files "
+            f"for {len(rna_files)} RNA-seq files."
+        )
+        logging.error(error_message)
+        raise ValueError(error_message)
+    if len(rna_files) > MAX_NUMBER_OF_LANES:
+        error_message = (
+            f"At most {MAX_NUMBER_OF_LANES} lanes are supported, "
+            f"but received {len(rna_files)}."
+        )
+        logging.error(error_message)
+        raise ValueError(error_message)
+    if len(paired_end_files) == 0:
+        return [[Path(rna_file)] for rna_file in rna_files]
+    return [
+        [Path(rna_file), Path(paired_end_file)]
+        for rna_file, paired_end_file in zip(rna_files, paired_end_files)
+    ]
+
+
+def _get_lane_path(path: Path, lane: int, number_of_lanes: int) -> Path:
+    """
+    Returns the path of the temporary files of the given lane. With a single
+    lane, the path itself is used.
+    """
+    if number_of_lanes == 1:
+        return path
+    return path / f"lane_{lane}"
+
+
+def _create_read_store(
+    read_store_type: Literal["packed", "offsets", "index"],
+    rna_files: List[Path],
+    cutoff: Tuple[int, int],
+    store_dir: Path = PATH_TO_READ_STORE,
+) -> Union[IReadStore, None]:
+    """
+    Returns None for the 'index' type, for which no reads are stored, as they
+    are retrieved using the read indexes built by `BackgroundReadIndexBuilder`.
+    """
+    if read_store_type == "index":
+        return None
+    if read_store_type == "offsets":
+        return RecordOffsetStore(store_dir, rna_files, cutoff)
+    return PackedReadStore(store_dir)
+
+
+def compute_matches(
+    peptide_files: List[str],
+    rna_files_per_lane: List[List[Path]],
     cutoff: Tuple[int, int],
     kmer_length: int,
     output_dir: str,
     precompute_intersections: bool,
-) -> Tuple[List[Union[Set[int], None]], Union[npt.NDArray[np.uint32], None]]:
-    kmer_index, peptide_to_cluster_mapping = PeptideToIndexImporter(
-        kmer_length
-    ).import_file_to_index(Path(peptide_file))
-    logging.info("Imported peptides to index.")
+    index_type: Literal["dict", "array"] = "dict",
+    cluster_postings: bool = False,
+    max_postings_length: Union[int, None] = None,
+    kmer_stop_list_file: Union[str, None] = None,
+    matching_engine: Literal["kmer", "aho-corasick"] = "kmer",
+    min_peptide_length: Union[int, None] = None,
+    bloom_filter: bool = False,
+    minimizer_window: int = 1,
+    min_shared_kmers: int = 1,
+    peptide_format: Literal["plain", "mztab", "tsv"] = "plain",
+    sequence_column: Union[str, None] = None,
+    protein_group_column: Union[str, None] = None,
+    index_store_dir: Union[str, None] = None,
+    deduplicate_peptides: bool = False,
+    checkpoint_interval: float = 600,
+    read_cache_size: int = 0,
+    sample_fraction: Union[float, None] = None,
+    sample_size: Union[int, None] = None,
+    sample_seed: int = 0,
+    preview: bool = False,
+    read_store_type: Literal["packed", "offsets", "index"] = "packed",
+) -> Tuple[
+    List[Union[Set[int], None]], Union[npt.NDArray[np.uint32], None], List[float]
+]:
+    """
+    Matches the (sampled) RNA-seq reads to the peptides. In preview mode,
+    neither checkpoints nor results are written.
+    :returns A Tuple (matches, precomputed_intersections, sampling_fractions)
+    with the fraction of the reads of each lane that was sampled.
+    """
+    engine, peptide_table, duplicate_peptide_mapping = _create_matching_engine(
+        peptide_files,
+        peptide_format,
+        sequence_column,
+        protein_group_column,
+        index_store_dir,
+        kmer_length,
+        matching_engine,
+        index_type,
+        cluster_postings,
+        max_postings_length,
+        kmer_stop_list_file,
+        min_peptide_length,
+        bloom_filter,
+        minimizer_window,
+        min_shared_kmers,
+        deduplicate_peptides,
+        preview,
+    )
+    if not preview:
+        peptide_table.save(PATH_TO_PEPTIDE_TABLE)
+    peptide_to_cluster_mapping = peptide_table.get_peptide_to_cluster_mapping()
+    number_of_clusters = peptide_table.number_of_clusters
 
-    rna_files = [Path(rna_file)]
-    if paired_end_file != "":
-        rna_files.append(Path(paired_end_file))
+    number_of_lanes = len(rna_files_per_lane)
 
-    if precompute_intersections:
-        matcher = PrecomputingRNAToPeptideMatcher(
-            kmer_index, kmer_index.number_of_peptides, peptide_to_cluster_mapping
+    def create_matcher(
+        read_store: Union[IReadStore, None],
+    ) -> RNAToPeptideMatcher:
+        if precompute_intersections:
+            return PrecomputingRNAToPeptideMatcher(
+                None,
+                number_of_clusters,
+                peptide_to_cluster_mapping,
+                engine,
+                duplicate_peptide_mapping,
+                read_cache_size,
+                read_store,
+            )
+        return RNAToPeptideMatcher(
+            None,
+            number_of_clusters,
+            peptide_to_cluster_mapping,
+            engine,
+            duplicate_peptide_mapping,
+            read_cache_size,
+            read_store,
         )
+
+    def create_read_store(lane: int) -> Union[IReadStore, None]:
+        # The matched reads are stored for generating the input of Trinity
+        if preview:
+            return None
+        return _create_read_store(
+            read_store_type,
+            rna_files_per_lane[lane],
+            cutoff,
+            _get_lane_path(PATH_TO_READ_STORE, lane, number_of_lanes),
+        )
+
+    if precompute_intersections:
         logging.info("Precomputing intersections during matching.")
+    # In preview mode, the states of multiple lanes are only kept until merged
+    checkpoint_dir = (
+        Path(tempfile.mkdtemp())
+        if preview and number_of_lanes > 1
+        else PATH_TO_MATCHING_CHECKPOINT
+    )
+    lane_matcher = LaneMatcher(
+        rna_files_per_lane,
+        cutoff,
+        create_matcher,
+        create_read_store,
+        partial(_get_lane_path, checkpoint_dir, number_of_lanes=number_of_lanes),
+        {
+            # The peptide files are identified by their content, not their path
+            "peptide_file_hashes": [
+                compute_file_hash(Path(peptide_file)) for peptide_file in peptide_files
+            ],
+            "peptide_format": peptide_format,
+            "sequence_column": sequence_column,
+            "protein_group_column": protein_group_column,
+            "deduplicate_peptides": deduplicate_peptides,
+            "number_of_peptides": len(peptide_table),
+            "number_of_clusters": number_of_clusters,
+            "cutoff": cutoff,
+            "kmer_length": kmer_length,
+            "precompute_intersections": precompute_intersections,
+            "matching_engine": matching_engine,
+            "min_peptide_length": min_peptide_length,
+            "minimizer_window": minimizer_window,
+            "min_shared_kmers": min_shared_kmers,
+            "max_postings_length": max_postings_length,
+            "kmer_stop_list": kmer_stop_list_file,
+            "sample_fraction": sample_fraction,
+            "sample_size": sample_size,
+            "sample_seed": sample_seed,
+            "read_store": read_store_type,
+        },
+        0 if preview else checkpoint_interval,
+        resume=not preview,
+        decompression_threads=_get_decompression_n_threads(),
+        sample_fraction=sample_fraction,
+        sample_size=sample_size,
+        sample_seed=sample_seed,
+    )
+    sampling_fractions: List[float] = []
+    if number_of_lanes == 1:
+        matcher, sampling_fraction = lane_matcher.match_lane(0)
+        sampling_fractions.append(sampling_fraction)
     else:
-        matcher = RNAToPeptideMatcher(
-            kmer_index, kmer_index.number_of_peptides, peptide_to_cluster_mapping
+        lane_results = match_lanes_in_parallel(
+            lane_matcher, _get_lane_n_processes(number_of_lanes)
         )
-    logging.info("Matching RNA-seq reads to peptides...")
-    for sequence_id, sequence in LazyRNAReader(rna_files, cutoff):
-        matcher.add_peptide_matches_for_rna_read(sequence_id, sequence)
-    logging.info("Generated all matches.")
-    del kmer_index
+        matcher = create_matcher(None)
+        for lane_state_dir, sampling_fraction in lane_results:
+            matcher.merge_state(lane_state_dir)
+            sampling_fractions.append(sampling_fraction)
+        logging.info("Merged the matches of all lanes.")
+    if preview and number_of_lanes > 1:
+        shutil.rmtree(checkpoint_dir, ignore_errors=True)
+    # The k-mer filters of the worker processes of multiple lanes are copies
+    if number_of_lanes == 1 and isinstance(engine, KmerMatchingEngine):
+        kmer_filter = engine.get_kmer_filter()
+        if kmer_filter is not None:
+            logging.info(f"Bloom filter usage: {kmer_filter.get_report()}.")
+    if preview:
+        precomputed_intersections = (
+            matcher.get_precomputed_intersections()
+            if isinstance(matcher, PrecomputingRNAToPeptideMatcher)
+            else None
+        )
+        return matcher.get_matches(), precomputed_intersections, sampling_fractions
     matcher.write_peptide_read_quant_file(
-        Path(output_dir), PeptideImporter().import_file(Path(peptide_file))
+        Path(output_dir), peptide_table.get_sequences()
     )
     matcher.save_matches()
     matches = matcher.get_matches()
@@ -112,8 +632,73 @@ def compute_matches(
     else:
         precomputed_intersections = None
     _write_last_step(Step.MATCHING.value)
+    lane_matcher.remove_checkpoints()
+    if number_of_lanes > 1:
+        shutil.rmtree(PATH_TO_MATCHING_CHECKPOINT, ignore_errors=True)
     logging.info("Saved results of matching step.")
-    return matches, precomputed_intersections
+    return matches, precomputed_intersections, sampling_fractions
+
+
+def print_preview(
+    sampling_fractions: List[float],
+    jaccard_index_threshold: float,
+    merging_method: Literal["agglomerative-clustering", "full-matrix"],
+    matches: List[Union[Set[int], None]],
+    precomputed_intersections: Union[npt.NDArray[np.uint32], None],
+) -> None:
+    """
+    Merges the matches of a sample of the RNA-seq reads and prints the set
+    sizes projected to all reads, together with the memory needed for the
+    matrices of the merging step.
+    :param List[float] sampling_fractions: The fraction of the reads of each lane
+    that was sampled.
+    """
+    number_of_matched_clusters = sum(
+        1 for match in matches if match is not None and len(match) > 0
+    )
+    merged_sets, _ = MatchMerger(
+        matches, jaccard_index_threshold, precomputed_intersections
+    ).merge_matches(merging_method)
+    # Each sampled read stands for the reads of its lane that were not sampled
+    read_weights = 1 / np.maximum(np.array(sampling_fractions, dtype=np.float64), 1e-12)
+    projected_set_sizes = np.array(
+        [
+            read_weights[
+                decode_read_ids(np.fromiter(merged_set, dtype=np.uint64))[0]
+            ].sum()
+            for merged_set in merged_sets
+        ],
+        dtype=np.float64,
+    )
+
+    click.echo(
+        "Sampled fraction of RNA-seq reads: "
+        + ", ".join(
+            [f"{sampling_fraction:.4g}" for sampling_fraction in sampling_fractions]
+        )
+        + (" (per lane)" if len(sampling_fractions) > 1 else "")
+    )
+    click.echo(f"Clusters with matches: {number_of_matched_clusters}")
+    click.echo(f"Merged sets: {len(merged_sets)}")
+    if len(merged_sets) > 0:
+        click.echo(
+            "Projected reads per merged set: "
+            f"min {projected_set_sizes.min():.0f}, "
+            f"median {np.median(projected_set_sizes):.0f}, "
+            f"max {projected_set_sizes.max():.0f}, "
+            f"total {projected_set_sizes.sum():.0f}"
+        )
+    # Matched clusters may grow with more reads, so the Jaccard Index matrix
+    # of the full data set may be larger
+    click.echo(
+        "Jaccard Index matrix: at least "
+        f"{number_of_matched_clusters ** 2 * np.dtype(np.uint16).itemsize / 2**20:.1f}"
+        " MiB"
+    )
+    click.echo(
+        "Precomputed intersections matrix: "
+        f"{len(matches) ** 2 * np.dtype(np.uint32).itemsize / 2**20:.1f} MiB"
+    )
 
 
 def load_merge_results() -> Tuple[List[Set[int]], List[List[int]]]:
@@ -142,35 +727,107 @@ def compute_merge_results(
     return merged_sets, peptide_indexes
 
 
+def _iter_rna_reads_for_ids(
+    rna_files: List[Path], cutoff: Tuple[int, int], lane: int, read_ids: List[int]
+) -> Iterator[Tuple[int, str]]:
+    """
+    Yields the given reads of the given lane by reading its RNA-seq files once.
+    """
+    return LazyRNAReader(
+        rna_files,
+        cutoff,
+        decompression_threads=_get_decompression_n_threads(),
+        lane=lane,
+    ).iter_reads_for_ids(read_ids)
+
+
+def _iter_reads_of_lanes(
+    iter_reads_per_lane: List[Callable[[List[int]], Iterator[Tuple[int, str]]]],
+    read_ids: List[int],
+) -> Iterator[Tuple[int, str]]:
+    """
+    Yields the given reads, retrieving the ones of each lane from its source.
+    """
+    for lane, lane_read_ids in split_read_ids_by_lane(read_ids).items():
+        yield from iter_reads_per_lane[lane](lane_read_ids)
+
+
+def _create_read_index_builders(
+    rna_files_per_lane: List[List[Path]],
+) -> List[BackgroundReadIndexBuilder]:
+    return [
+        BackgroundReadIndexBuilder(
+            rna_files,
+            _get_lane_path(PATH_TO_READ_INDEXES, lane, len(rna_files_per_lane)),
+        )
+        for lane, rna_files in enumerate(rna_files_per_lane)
+    ]
+
+
 def generate_trinity_input(
-    rna_file: str,
-    paired_end_file: str,
+    rna_files_per_lane: List[List[Path]],
     cutoff: Tuple[int, int],
     merged_sets: List[Set[int]],
+    read_store_type: Literal["packed", "offsets", "index"] = "packed",
+    read_index_builders: Union[List[BackgroundReadIndexBuilder], None] = None,
 ) -> List[Path]:
-    rna_files = [Path(rna_file)]
-    if paired_end_file != "":
-        rna_files.append(Path(paired_end_file))
-    rna_reads_retriever = RNAReadsRetriever(rna_files, cutoff)
-
-    relative_filepaths: List[Path] = []
-    # TODO: Could be parallelized?
-    for set_index, merged_set in enumerate(merged_sets):
-        relative_filepath = Path(f"{str(set_index)}/{str(set_index)}.fa")
-        if (PATH_TO_TEMP_FILES / relative_filepath).is_file():
-            relative_filepaths.append(relative_filepath)
-            continue
-
-        read_ids, read_sequences = rna_reads_retriever.get_read_sequences_for_ids(
-            list(merged_set)
-        )
-        (PATH_TO_TEMP_FILES / f"{str(set_index)}").mkdir()
-        AssemblyHelper.write_fasta_with_sequences(
-            (zip([str(read_id) for read_id in read_ids], read_sequences)),
-            PATH_TO_TEMP_FILES / relative_filepath,
+    """
+    :param Union[List[BackgroundReadIndexBuilder], None] read_index_builders:
+    The builders of the read indexes of the lanes started at the beginning of
+    the run, which are waited for with the 'index' read store type. If None,
+    the indexes are built if needed.
+    """
+    number_of_lanes = len(rna_files_per_lane)
+    relative_filepaths = generate_relative_filepaths_for_trinity(len(merged_sets))
+    # Files of a previous run are complete, as they are moved into place
+    # only after all reads were written
+    missing_set_indexes = [
+        set_index
+        for set_index, relative_filepath in enumerate(relative_filepaths)
+        if not (PATH_TO_TEMP_FILES / relative_filepath).is_file()
+    ]
+    if len(missing_set_indexes) > 0:
+        if read_store_type == "index" and read_index_builders is None:
+            read_index_builders = _create_read_index_builders(rna_files_per_lane)
+        read_stores: List[IReadStore] = []
+        iter_reads_per_lane: List[Callable[[List[int]], Iterator[Tuple[int, str]]]] = []
+        for lane, rna_files in enumerate(rna_files_per_lane):
+            read_store = _create_read_store(
+                read_store_type,
+                rna_files,
+                cutoff,
+                _get_lane_path(PATH_TO_READ_STORE, lane, number_of_lanes),
+            )
+            if read_store_type == "index" and read_index_builders is not None:
+                logging.info("Waiting for the read indexes to be built.")
+                read_index_builders[lane].wait()
+                iter_reads_per_lane.append(
+                    RNAReadsRetriever(
+                        rna_files,
+                        cutoff,
+                        _get_lane_path(PATH_TO_READ_INDEXES, lane, number_of_lanes),
+                    ).iter_read_sequences_for_ids
+                )
+            elif read_store is not None and read_store.exists():
+                read_stores.append(read_store)
+                iter_reads_per_lane.append(read_store.iter_read_sequences_for_ids)
+            else:
+                # Matching results from a run that did not store the matched reads
+                iter_reads_per_lane.append(
+                    partial(_iter_rna_reads_for_ids, rna_files, cutoff, lane)
+                )
+
+        write_read_sets_to_fasta_files(
+            [merged_sets[set_index] for set_index in missing_set_indexes],
+            [
+                PATH_TO_TEMP_FILES / relative_filepaths[set_index]
+                for set_index in missing_set_indexes
+            ],
+            partial(_iter_reads_of_lanes, iter_reads_per_lane),
+            _get_trinity_input_max_open_files(),
         )
-        relative_filepaths.append(relative_filepath)
-        # TODO: Delete input fasta?
+        for read_store in read_stores:
+            read_store.close()
 
     _write_last_step(Step.TRINITY_INPUT.value)
     logging.info("Generated input files for assembly with Trinity.")
@@ -229,10 +886,10 @@ def align_reads_to_genome(
     logging.info("Generated alignment of assembled contigs with GMAP.")
 
 
-def generate_pogo_input(paths_to_subdirectories: List[Path], peptide_file: str) -> None:
-    pogo_input_helper = PoGoInputHelper(
-        Path(peptide_file), PATH_PEPTIDE_TO_CLUSTER_MAPPING_FILE
-    )
+def generate_pogo_input(
+    paths_to_subdirectories: List[Path], peptide_files: List[str]
+) -> None:
+    pogo_input_helper = PoGoInputHelper(_load_peptide_table(peptide_files))
     pogo_input_helper.generate_all_peptide_input_files(
         paths_to_subdirectories, PATH_TO_MERGED_INDEXES
     )
@@ -266,16 +923,62 @@ def concat_output(paths_to_subdirectories: List[Path], output_dir: str) -> None:
     "--peptide-file",
     required=True,
     type=str,
-    help="The path to the peptide file.",
+    multiple=True,
+    help=(
+        "The path to the peptide file. Can be used multiple times "
+        "(e.g. '-p fraction1.txt -p fraction2.txt'), in which case the "
+        "peptides of each file are appended to the ones of the previous files, "
+        "with each file forming its own groups."
+    ),
+)
+@click.option(
+    "-pf",
+    "--peptide-format",
+    required=False,
+    type=click.Choice(["plain", "mztab", "tsv"]),
+    default="plain",
+    show_default=True,
+    help=(
+        "The format of the peptide file. 'plain' is a list of peptides, "
+        "'mztab' the PSM and PEP sections of an mzTab file and 'tsv' a "
+        "tab-separated search engine output with a header line. "
+        "Peptides of 'mztab' and 'tsv' files are deduplicated while reading."
+    ),
+)
+@click.option(
+    "-sc",
+    "--sequence-column",
+    required=False,
+    type=str,
+    default=None,
+    help=(
+        "The name of the sequence column of a 'tsv' peptide file. "
+        "If not set, common column names like 'Sequence' or 'Peptide' are tried."
+    ),
+)
+@click.option(
+    "-pc",
+    "--protein-group-column",
+    required=False,
+    type=str,
+    default=None,
+    help=(
+        "The name of the protein group column of a 'tsv' peptide file. "
+        "If not set, common column names like 'Proteins' are tried. If none "
+        "is found, each peptide is treated as a separate group."
+    ),
 )
 @click.option(
     "-r",
     "--rna-file",
     required=True,
     type=str,
+    multiple=True,
     help=(
         "The path to the RNA-seq file. In case of paired-end sequencing, "
-        "this file is expected to be in forward orientation."
+        "this file is expected to be in forward orientation. Can be used "
+        "multiple times for the files of multiple lanes of the same sample, "
+        "which are matched in parallel."
     ),
 )
 @click.option(
@@ -283,13 +986,14 @@ def concat_output(paths_to_subdirectories: List[Path], output_dir: str) -> None:
     "--paired-end-file",
     required=False,
     type=str,
-    default="",
+    multiple=True,
     show_default=False,
     help=(
         "The path to the second RNA-seq file in case of paired-end sequencing. "
         "This file is expected to be in reverse orientation. "
         'If none is given, the RNA-seq file given with the "-r" option '
-        "is assumed to result from single-end sequencing."
+        "is assumed to result from single-end sequencing. With multiple lanes, "
+        'it must be used once for each "-r" option, in the same order.'
     ),
 )
 @click.option(
@@ -325,6 +1029,171 @@ def concat_output(paths_to_subdirectories: List[Path], output_dir: str) -> None:
         "the k-mer size refers to amino acids."
     ),
 )
+@click.option(
+    "-e",
+    "--matching-engine",
+    required=False,
+    type=click.Choice(["kmer", "aho-corasick"]),
+    default="kmer",
+    show_default=True,
+    help=(
+        "How RNA-seq reads are matched to peptides. "
+        '"kmer" matches a read to all peptides sharing a k-mer with it, '
+        '"aho-corasick" only to the peptides fully contained in one of its '
+        "translated frames, by scanning each frame with an automaton "
+        "of all peptides. The k-mer index options are ignored for "
+        '"aho-corasick".'
+    ),
+)
+@click.option(
+    "-ml",
+    "--min-peptide-length",
+    required=False,
+    type=click.IntRange(min=1),
+    default=None,
+    help=(
+        "Peptides shorter than this are ignored during the matching. "
+        "Defaults to the k-mer length. Lower values are only useful "
+        'with "--matching-engine aho-corasick", as shorter peptides '
+        "contain no k-mers."
+    ),
+)
+@click.option(
+    "-dd",
+    "--deduplicate-peptides",
+    is_flag=True,
+    help=(
+        "If used, peptides with the same sequence (with I and L treated as "
+        "equal) are only indexed and matched once. Their matches are counted "
+        "for all of them in the quantification file and the PoGo input."
+    ),
+)
+@click.option(
+    "-it",
+    "--index-type",
+    required=False,
+    type=click.Choice(["dict", "array"]),
+    default="dict",
+    show_default=True,
+    help=(
+        "Which data structure to use for the peptide k-mer index. "
+        '"array" stores the k-mers as integer codes in NumPy arrays, '
+        "which needs considerably less memory for large peptide files, "
+        "but only supports k-mer lengths of up to 12."
+    ),
+)
+@click.option(
+    "-w",
+    "--minimizer-window",
+    required=False,
+    type=click.IntRange(min=1),
+    default=1,
+    show_default=True,
+    help=(
+        "If larger than 1, the index only stores the (w,k)-minimizers of each "
+        "peptide for this window size w, which shrinks the index roughly "
+        "by a factor of (w + 1) / 2. Reads are then matched via their "
+        "minimizers, which misses matches sharing only few k-mers."
+    ),
+)
+@click.option(
+    "-sk",
+    "--min-shared-kmers",
+    required=False,
+    type=click.IntRange(min=1),
+    default=1,
+    show_default=True,
+    help=(
+        "If larger than 1, the peptides found in the index are verified "
+        "against their full sequence and only kept as matches if they share "
+        "at least this many distinct k-mers with the read."
+    ),
+)
+@click.option(
+    "-cp",
+    "--cluster-postings",
+    is_flag=True,
+    help=(
+        "If used, the array index additionally stores the deduplicated "
+        "clusters per k-mer, which speeds up the matching if many peptides "
+        'share k-mers. Only has an effect with "--index-type array".'
+    ),
+)
+@click.option(
+    "-bf",
+    "--bloom-filter",
+    is_flag=True,
+    help=(
+        "If used, a Bloom filter over the k-mers of the index rejects most "
+        "k-mers of the reads not contained in any peptide before they are "
+        "looked up in the index. Its hits, misses and false positives are "
+        'reported in the log. Mainly speeds up "--index-type array", as '
+        "lookups in the dict index are about as cheap as the filter itself."
+    ),
+)
+@click.option(
+    "-mp",
+    "--max-postings-length",
+    required=False,
+    type=click.IntRange(min=1),
+    default=None,
+    help=(
+        "If set, k-mers contained in more than the given number of peptides "
+        "are removed from the index before the matching. "
+        "The removed k-mers are listed in the log."
+    ),
+)
+@click.option(
+    "-sl",
+    "--kmer-stop-list",
+    required=False,
+    type=str,
+    default=None,
+    help=(
+        "The path to a file with k-mers to remove from the index before "
+        "the matching, one k-mer per line."
+    ),
+)
+@click.option(
+    "-is",
+    "--index-store",
+    required=False,
+    type=str,
+    default=None,
+    help=(
+        "The path to a directory in which the peptide index is stored. If it "
+        "already contains an index built from the first of the given peptide "
+        "files with the same settings, only the remaining files are appended "
+        "to it. Only used with '--matching-engine kmer'."
+    ),
+)
+@click.option(
+    "-rc",
+    "--read-cache-size",
+    required=False,
+    type=int,
+    default=0,
+    show_default=True,
+    help=(
+        "If larger than 0, the matches of up to this many distinct RNA-seq read "
+        "sequences are cached, so that duplicate reads are only matched once."
+    ),
+)
+@click.option(
+    "-rs",
+    "--read-store",
+    required=False,
+    type=click.Choice(["packed", "offsets", "index"]),
+    default="packed",
+    show_default=True,
+    help=(
+        "How the matched RNA-seq reads are stored for the assembly: 'packed' "
+        "stores their sequences with 2 bits per base, 'offsets' only the offsets "
+        "of their records in the RNA-seq files, from which they are read again. "
+        "'index' stores no reads, but builds pyfastx indexes of the RNA-seq "
+        "files in the background during the matching, from which they are read."
+    ),
+)
 @click.option(
     "-o",
     "--output-dir",
@@ -343,6 +1212,63 @@ def concat_output(paths_to_subdirectories: List[Path], output_dir: str) -> None:
         "calculation are precomputed during the matching phase."
     ),
 )
+@click.option(
+    "-ci",
+    "--checkpoint-interval",
+    required=False,
+    type=float,
+    default=600,
+    show_default=True,
+    help=(
+        "The number of seconds between two checkpoints of the matching step, "
+        "from which an interrupted run resumes. If 0, no checkpoints are written."
+    ),
+)
+@click.option(
+    "-sf",
+    "--sample-fraction",
+    required=False,
+    type=click.FloatRange(0, 1, min_open=True),
+    default=None,
+    help=(
+        "If given, only this fraction of the RNA-seq reads is used, chosen "
+        "randomly but reproducibly by the '--sample-seed'."
+    ),
+)
+@click.option(
+    "-sn",
+    "--sample-size",
+    required=False,
+    type=click.IntRange(min=1),
+    default=None,
+    help=(
+        "If given, only at most this number of RNA-seq reads (or read pairs) "
+        "is used, chosen randomly but reproducibly by the '--sample-seed'. "
+        "With multiple lanes, it is split evenly between them, independently "
+        "of their number of reads, so that the reads of smaller lanes are "
+        "overrepresented in the sample."
+    ),
+)
+@click.option(
+    "-ss",
+    "--sample-seed",
+    required=False,
+    type=int,
+    default=0,
+    show_default=True,
+    help="The seed for sampling the RNA-seq reads.",
+)
+@click.option(
+    "-pv",
+    "--preview",
+    is_flag=True,
+    help=(
+        "If used, only the matching and merging steps are run on a sample "
+        "of the RNA-seq reads (by default 1,000,000 reads) without writing "
+        "any results, and the projected sizes of the merged sets and the memory "
+        "needed for the merging matrices are printed."
+    ),
+)
 @click.option(
     "-j",
     "--jaccard-index-threshold",
@@ -395,13 +1321,34 @@ def concat_output(paths_to_subdirectories: List[Path], output_dir: str) -> None:
     ),
 )
 def main(
-    peptide_file: str,
-    rna_file: str,
-    paired_end_file: str,
+    peptide_file: Tuple[str, ...],
+    peptide_format: Literal["plain", "mztab", "tsv"],
+    sequence_column: Union[str, None],
+    protein_group_column: Union[str, None],
+    rna_file: Tuple[str, ...],
+    paired_end_file: Tuple[str, ...],
     cutoff: Tuple[int, int],
     kmer_length: int,
+    matching_engine: Literal["kmer", "aho-corasick"],
+    min_peptide_length: Union[int, None],
+    deduplicate_peptides: bool,
+    index_type: Literal["dict", "array"],
+    cluster_postings: bool,
+    minimizer_window: int,
+    min_shared_kmers: int,
+    bloom_filter: bool,
+    max_postings_length: Union[int, None],
+    kmer_stop_list: Union[str, None],
+    index_store: Union[str, None],
+    read_cache_size: int,
+    read_store: Literal["packed", "offsets", "index"],
     output_dir: str,
     precompute_intersections: bool,
+    checkpoint_interval: float,
+    sample_fraction: Union[float, None],
+    sample_size: Union[int, None],
+    sample_seed: int,
+    preview: bool,
     jaccard_index_threshold: float,
     merging_method: Literal["agglomerative-clustering", "full-matrix"],
     min_contig_length: int,
@@ -416,20 +1363,86 @@ def main(
 
     # TODO: Add full docstrings for all relevant methods
 
+    rna_files_per_lane = _get_rna_files_per_lane(rna_file, paired_end_file)
+    if preview:
+        if sample_fraction is None and sample_size is None:
+            sample_size = DEFAULT_PREVIEW_SAMPLE_SIZE
+        matches, precomputed_intersections, sampling_fractions = compute_matches(
+            list(peptide_file),
+            rna_files_per_lane,
+            cutoff,
+            kmer_length,
+            output_dir,
+            precompute_intersections,
+            index_type,
+            cluster_postings,
+            max_postings_length,
+            kmer_stop_list,
+            matching_engine,
+            min_peptide_length,
+            bloom_filter,
+            minimizer_window,
+            min_shared_kmers,
+            peptide_format,
+            sequence_column,
+            protein_group_column,
+            index_store,
+            deduplicate_peptides,
+            checkpoint_interval,
+            read_cache_size,
+            sample_fraction,
+            sample_size,
+            sample_seed,
+            preview=True,
+        )
+        print_preview(
+            sampling_fractions,
+            jaccard_index_threshold,
+            merging_method,
+            matches,
+            precomputed_intersections,
+        )
+        return
+
     last_step = _get_last_step()
+    read_index_builders: Union[List[BackgroundReadIndexBuilder], None] = None
+    if read_store == "index" and last_step < Step.TRINITY_INPUT.value:
+        # Built in parallel to the matching and merging
+        read_index_builders = _create_read_index_builders(rna_files_per_lane)
+        for read_index_builder in read_index_builders:
+            read_index_builder.start()
     # TODO: Make more beautiful?
     matches: List[Union[Set[int], None]] = []
     precomputed_intersections: Union[npt.NDArray[np.uint32], None] = None
     if last_step < Step.MATCHING.value:
         logging.info("Computing matches from the given files.")
-        matches, precomputed_intersections = compute_matches(
-            peptide_file,
-            rna_file,
-            paired_end_file,
+        matches, precomputed_intersections, _ = compute_matches(
+            list(peptide_file),
+            rna_files_per_lane,
             cutoff,
             kmer_length,
             output_dir,
             precompute_intersections,
+            index_type,
+            cluster_postings,
+            max_postings_length,
+            kmer_stop_list,
+            matching_engine,
+            min_peptide_length,
+            bloom_filter,
+            minimizer_window,
+            min_shared_kmers,
+            peptide_format,
+            sequence_column,
+            protein_group_column,
+            index_store,
+            deduplicate_peptides,
+            checkpoint_interval,
+            read_cache_size,
+            sample_fraction,
+            sample_size,
+            sample_seed,
+            read_store_type=read_store,
         )
     elif last_step == Step.MATCHING.value:
         logging.info("Using already computed matches from last run.")
@@ -448,7 +1461,11 @@ def main(
     if last_step < Step.TRINITY_INPUT.value:
         logging.info("Generating input files for Trinity.")
         relative_filepaths = generate_trinity_input(
-            rna_file, paired_end_file, cutoff, merged_sets
+            rna_files_per_lane,
+            cutoff,
+            merged_sets,
+            read_store,
+            read_index_builders,
         )
     # TODO: What if Trinity step not needed?
     else:
@@ -478,7 +1495,7 @@ def main(
 
     if last_step < Step.POGO_INPUT.value:
         logging.info("Generating input files for PoGo.")
-        generate_pogo_input(paths_to_subdirectories, peptide_file)
+        generate_pogo_input(paths_to_subdirectories, list(peptide_file))
     else:
         logging.info("Using already generated PoGo input files.")
 
@@ -81,7 +81,7 @@ class TestMinHashCalculator:
             min_hash_calculator.get_jaccard_index_matrix()
             / MinHashCalculator.JACCARD_INT_MULTIPLICATION_FACTOR,
             expected_jaccard_indexes,
-            atol=0.015,
+            atol=0.03,
             rtol=0.0,
         )
 
@@ -98,23 +98,23 @@ class TestMinHashCalculator:
             min_hash_calculator.get_jaccard_index(0, 2),
             1 / 3,
             rel_tol=0.0,
-            abs_tol=0.015,
+            abs_tol=0.03,
         )
         assert isclose(
             min_hash_calculator.get_jaccard_index(1, 1),
             1.0,
             rel_tol=0.0,
-            abs_tol=0.015,
+            abs_tol=0.03,
         )
         assert isclose(
             min_hash_calculator.get_jaccard_index(3, 0),
             0.0,
             rel_tol=0.0,
-            abs_tol=0.015,
+            abs_tol=0.03,
         )
         assert isclose(
             min_hash_calculator.get_jaccard_index(2, 3),
             1 / 7,
             rel_tol=0.0,
-            abs_tol=0.015,
+            abs_tol=0.03,
         )
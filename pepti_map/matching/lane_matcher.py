@@ -0,0 +1,223 @@
+import logging
+import multiprocessing
+from pathlib import Path
+import sys
+from typing import Callable, Dict, List, Tuple, Union
+
+from pepti_map.importing.rna_import.lazy_rna_reader import LazyRNAReader
+from pepti_map.importing.rna_import.read_store import IReadStore
+from pepti_map.importing.rna_import.record_offset_store import RecordOffsetStore
+from pepti_map.matching.matching_checkpoint import MatchingCheckpoint
+from pepti_map.matching.rna_to_peptide_matcher import RNAToPeptideMatcher
+
+
+def get_lane_sample_size(
+    sample_size: Union[int, None], lane: int, number_of_lanes: int
+) -> Union[int, None]:
+    """
+    Splits the given sample size evenly between the lanes, so that the sample
+    sizes of the lanes add up to it. Lanes after the remainder of the division
+    get no reads if the sample size is smaller than the number of lanes.
+    The split does not depend on the number of reads of the lanes, so the reads
+    of smaller lanes are overrepresented in the sample.
+    """
+    if sample_size is None:
+        return None
+    return sample_size // number_of_lanes + (
+        1 if lane < sample_size % number_of_lanes else 0
+    )
+
+
+class LaneMatcher:
+    """
+    Matches the reads of each lane, i.e. of each single RNA-seq file or pair of
+    files of the same sample, with a separate matcher, read store and checkpoint,
+    so that the lanes can be matched independently of each other, e.g. in
+    parallel by `match_lanes_in_parallel`. The matches of the lanes can then be
+    combined via `RNAToPeptideMatcher.merge_state`.
+    """
+
+    def __init__(
+        self,
+        rna_files_per_lane: List[List[Path]],
+        cutoff: Tuple[int, int],
+        create_matcher: Callable[[Union[IReadStore, None]], RNAToPeptideMatcher],
+        create_read_store: Callable[[int], Union[IReadStore, None]],
+        get_checkpoint_dir: Callable[[int], Path],
+        checkpoint_settings: Dict[str, Union[str, int, bool, List, None]],
+        checkpoint_interval: float = 600,
+        resume: bool = True,
+        decompression_threads: int = 0,
+        sample_fraction: Union[float, None] = None,
+        sample_size: Union[int, None] = None,
+        sample_seed: int = 0,
+    ):
+        """
+        :param Callable[[Union[IReadStore, None]], RNAToPeptideMatcher]
+        create_matcher: Creates a matcher storing the matched reads in the given
+        read store.
+        :param Callable[[int], Union[IReadStore, None]] create_read_store:
+        Creates the read store of the given lane.
+        :param Callable[[int], Path] get_checkpoint_dir: Returns the directory
+        of the checkpoints of the given lane.
+        :param bool resume: Whether to resume from the checkpoints of a previous
+        run. If False, checkpoints are still written.
+        :param Union[int, None] sample_size: The total sample size, which is
+        split evenly between the lanes, see `get_lane_sample_size`.
+        """
+        self._rna_files_per_lane: List[List[Path]] = rna_files_per_lane
+        self._cutoff: Tuple[int, int] = cutoff
+        self._create_matcher = create_matcher
+        self._create_read_store = create_read_store
+        self._get_checkpoint_dir = get_checkpoint_dir
+        self._checkpoint_settings = checkpoint_settings
+        self._checkpoint_interval: float = checkpoint_interval
+        self._resume: bool = resume
+        self._decompression_threads: int = decompression_threads
+        self._sample_fraction: Union[float, None] = sample_fraction
+        self._sample_size: Union[int, None] = sample_size
+        self._sample_seed: int = sample_seed
+
+    def get_number_of_lanes(self) -> int:
+        return len(self._rna_files_per_lane)
+
+    def _get_checkpoint(self, lane: int) -> MatchingCheckpoint:
+        return MatchingCheckpoint(
+            {
+                **self._checkpoint_settings,
+                "rna_files": [
+                    rna_file.as_posix() for rna_file in self._rna_files_per_lane[lane]
+                ],
+                "lane": lane,
+            },
+            self._checkpoint_interval,
+            self._get_checkpoint_dir(lane),
+        )
+
+    def _match_lane(
+        self, lane: int
+    ) -> Tuple[RNAToPeptideMatcher, MatchingCheckpoint, Tuple[int, int, int], float]:
+        read_store = self._create_read_store(lane)
+        matcher = self._create_matcher(read_store)
+        checkpoint = self._get_checkpoint(lane)
+        start_position = checkpoint.load(matcher) if self._resume else None
+        if read_store is not None and start_position is None:
+            read_store.clear()
+        lane_name = f" of lane {lane + 1}" if self.get_number_of_lanes() > 1 else ""
+        logging.info(f"Matching RNA-seq reads{lane_name} to peptides...")
+        rna_reader = LazyRNAReader(
+            self._rna_files_per_lane[lane],
+            self._cutoff,
+            decompression_threads=self._decompression_threads,
+            start_position=start_position,
+            sample_fraction=self._sample_fraction,
+            sample_size=get_lane_sample_size(
+                self._sample_size, lane, self.get_number_of_lanes()
+            ),
+            sample_seed=self._sample_seed,
+            record_offsets=isinstance(read_store, RecordOffsetStore),
+            lane=lane,
+        )
+        for read_ids, sequence_matrix, lengths in rna_reader.iter_matrix_batches():
+            matcher.add_peptide_matches_for_rna_read_batch(
+                read_ids, sequence_matrix, lengths, rna_reader.get_record_offsets()
+            )
+            checkpoint.save_if_due(matcher, rna_reader.get_position())
+        logging.info(f"Generated all matches{lane_name}.")
+        if read_store is not None:
+            read_store.close()
+            logging.info(f"Stored {len(read_store)} matched reads{lane_name}.")
+        read_match_cache = matcher.get_read_match_cache()
+        if read_match_cache is not None:
+            logging.info(
+                f"Read cache usage{lane_name}: {read_match_cache.get_report()}."
+            )
+        return (
+            matcher,
+            checkpoint,
+            rna_reader.get_position(),
+            rna_reader.get_sampling_fraction(),
+        )
+
+    def match_lane(self, lane: int) -> Tuple[RNAToPeptideMatcher, float]:
+        """
+        Matches the reads of the given lane.
+        :returns A Tuple (matcher, sampling_fraction) with the fraction of
+        the reads of the lane that was sampled.
+        :rtype Tuple[RNAToPeptideMatcher, float]
+        """
+        matcher, _, _, sampling_fraction = self._match_lane(lane)
+        return matcher, sampling_fraction
+
+    def match_lane_to_state(self, lane: int) -> Tuple[Path, float]:
+        """
+        Matches the reads of the given lane and saves the final state of its
+        matcher as a checkpoint, so that a restarted run does not match
+        the lane again.
+        :returns A Tuple (state_dir, sampling_fraction) with the directory of
+        the saved state and the fraction of the reads of the lane that was
+        sampled.
+        :rtype Tuple[Path, float]
+        """
+        matcher, checkpoint, position, sampling_fraction = self._match_lane(lane)
+        checkpoint.save(matcher, position)
+        return self._get_checkpoint_dir(lane), sampling_fraction
+
+    def remove_checkpoints(self) -> None:
+        for lane in range(0, self.get_number_of_lanes()):
+            self._get_checkpoint(lane).remove()
+
+
+# Set before the worker processes are forked, so that they inherit it instead
+# of receiving a pickled copy of the matching engine
+_lane_matcher: Union[LaneMatcher, None] = None
+
+
+def _match_lane_in_worker(lane: int) -> Tuple[Path, float]:
+    assert _lane_matcher is not None
+    return _lane_matcher.match_lane_to_state(lane)
+
+
+def _supports_fork() -> bool:
+    # Forking is unsafe on macOS, where spawn is the default start method
+    return (
+        "fork" in multiprocessing.get_all_start_methods() and sys.platform != "darwin"
+    )
+
+
+def match_lanes_in_parallel(
+    lane_matcher: LaneMatcher, n_processes: int
+) -> List[Tuple[Path, float]]:
+    """
+    Matches each lane in a separate worker process. The workers are forked,
+    as the matcher factories of the `LaneMatcher` cannot be pickled, so the
+    lanes are matched one after another if forking is not supported.
+    :returns The directories of the states of the matchers of the lanes and
+    their sampling fractions, see `LaneMatcher.match_lane_to_state`.
+    :rtype List[Tuple[Path, float]]
+    """
+    global _lane_matcher
+    if not _supports_fork():
+        logging.warning(
+            "Matching the lanes in parallel requires forking processes, which is "
+            "not supported on this platform. Matching them one after another."
+        )
+        return [
+            lane_matcher.match_lane_to_state(lane)
+            for lane in range(0, lane_matcher.get_number_of_lanes())
+        ]
+    n_processes = max(min(n_processes, lane_matcher.get_number_of_lanes()), 1)
+    logging.info(
+        f"Matching {lane_matcher.get_number_of_lanes()} lanes "
+        f"with {n_processes} processes."
+    )
+    _lane_matcher = lane_matcher
+    try:
+        with multiprocessing.get_context("fork").Pool(n_processes) as pool:
+            return pool.map(
+                _match_lane_in_worker,
+                range(0, lane_matcher.get_number_of_lanes()),
+                chunksize=1,
+            )
+    finally:
+        _lane_matcher = None
@@ -16,7 +16,8 @@ from pepti_map.matching.jaccard_index_calculation.min_hash_calculator import (
 from pepti_map.matching.merging_methods.merging_method_helper import get_merging_method
 from pepti_map.constants import PATH_TO_MERGED_INDEXES, PATH_TO_MERGED_MATCHES
 
-NUM_BYTES_FOR_MIN_HASH_VALUES = 4
+# Read ids are uint64, see pepti_map.util.read_id
+NUM_BYTES_FOR_MIN_HASH_VALUES = 8
 
 
 class MatchMerger:
@@ -0,0 +1,104 @@
+import json
+import logging
+import os
+from pathlib import Path
+import shutil
+import time
+from typing import Dict, List, Tuple, Union
+
+from pepti_map.constants import PATH_TO_MATCHING_CHECKPOINT
+from pepti_map.matching.rna_to_peptide_matcher import RNAToPeptideMatcher
+
+_POSITION_FILENAME = "position.json"
+
+
+class MatchingCheckpoint:
+    """
+    Periodically persists the state of the matcher together with the position
+    in the RNA-seq files up to which all reads were matched, so that an
+    interrupted matching step can be resumed from there.
+    A checkpoint is only resumed from if it was written with the same settings.
+    """
+
+    def __init__(
+        self,
+        settings: Dict[str, Union[str, int, bool, List, None]],
+        interval: float = 600,
+        checkpoint_dir: Path = PATH_TO_MATCHING_CHECKPOINT,
+    ):
+        """
+        :param float interval: The minimum number of seconds between two
+        checkpoints. If it is 0 or smaller, no checkpoints are written.
+        """
+        # Settings are compared with the ones loaded from JSON, e.g. tuples
+        # become lists
+        self._settings = json.loads(json.dumps(settings))
+        self._interval: float = interval
+        self._checkpoint_dir: Path = checkpoint_dir
+        self._last_checkpoint_time: float = time.monotonic()
+
+    def _get_temp_dir(self) -> Path:
+        return self._checkpoint_dir.with_name(self._checkpoint_dir.name + ".tmp")
+
+    def load(self, matcher: RNAToPeptideMatcher) -> Union[Tuple[int, int, int], None]:
+        """
+        Restores the state of the given matcher from the last checkpoint.
+        :returns The position in the RNA-seq files at which to continue reading,
+        see `LazyRNAReader.get_position`, or None if there is no checkpoint
+        to resume from.
+        :rtype Union[Tuple[int, int, int], None]
+        """
+        checkpoint_dir = self._checkpoint_dir
+        if not (checkpoint_dir / _POSITION_FILENAME).is_file():
+            # The process may have stopped while replacing the checkpoint
+            checkpoint_dir = self._get_temp_dir()
+            if not (checkpoint_dir / _POSITION_FILENAME).is_file():
+                return None
+        with open(
+            checkpoint_dir / _POSITION_FILENAME, "rt", encoding="utf-8"
+        ) as position_file:
+            checkpoint = json.load(position_file)
+        if checkpoint["settings"] != self._settings:
+            logging.warning(
+                "Not resuming from the matching checkpoint, "
+                "as it was written with different settings."
+            )
+            return None
+        matcher.load_state(checkpoint_dir)
+        position = checkpoint["position"]
+        logging.info(
+            f"Resuming matching from checkpoint at file {position[0] + 1}, "
+            f"record {position[2] + 1}."
+        )
+        return (position[0], position[1], position[2])
+
+    def save(
+        self, matcher: RNAToPeptideMatcher, position: Tuple[int, int, int]
+    ) -> None:
+        temp_dir = self._get_temp_dir()
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        temp_dir.mkdir(parents=True)
+        matcher.save_state(temp_dir)
+        # The position is written last, as it marks the checkpoint as complete
+        with open(temp_dir / _POSITION_FILENAME, "wt", encoding="utf-8") as file:
+            json.dump({"settings": self._settings, "position": position}, file)
+        shutil.rmtree(self._checkpoint_dir, ignore_errors=True)
+        os.replace(temp_dir, self._checkpoint_dir)
+        self._last_checkpoint_time = time.monotonic()
+        logging.info(
+            f"Saved matching checkpoint at file {position[0] + 1}, "
+            f"record {position[2] + 1}."
+        )
+
+    def save_if_due(
+        self, matcher: RNAToPeptideMatcher, position: Tuple[int, int, int]
+    ) -> None:
+        if (
+            self._interval > 0
+            and time.monotonic() - self._last_checkpoint_time >= self._interval
+        ):
+            self.save(matcher, position)
+
+    def remove(self) -> None:
+        shutil.rmtree(self._checkpoint_dir, ignore_errors=True)
+        shutil.rmtree(self._get_temp_dir(), ignore_errors=True)
@@ -0,0 +1,125 @@
+from array import array
+from collections import deque
+import logging
+from typing import Dict, Iterable, List, Set, Tuple
+
+from pepti_map.matching.matching_engines.matching_engine import IMatchingEngine
+
+# Transitions are stored in a single dict keyed by node * _ALPHABET_SIZE + ord(char),
+# which needs far less memory than one dict per node
+_ALPHABET_SIZE = 128
+_ROOT = 0
+
+
+class AhoCorasickMatchingEngine(IMatchingEngine):
+    """
+    Compiles all peptides into an Aho-Corasick automaton, so that each
+    translated frame is scanned in a single pass and a read only matches
+    the peptides that are fully contained in one of its frames.
+    Peptides with a cluster id of -1 are not added to the automaton.
+    """
+
+    def __init__(
+        self,
+        peptide_sequences: List[str],
+        peptide_to_cluster_mapping: List[int],
+        replace_isoleucine=True,
+    ):
+        if len(peptide_sequences) != len(peptide_to_cluster_mapping):
+            error_message = (
+                "Expected the number of given peptide sequences to be the same "
+                "as used for the mapping, but was different."
+            )
+            logging.error(error_message)
+            raise ValueError(error_message)
+        self._peptide_to_cluster_mapping: List[int] = peptide_to_cluster_mapping
+        self._transitions: Dict[int, int] = {}
+        # For each node, the peptide ids of the peptides ending there
+        self._node_outputs: Dict[int, List[int]] = {}
+        self._failure_links: array = array("I", [_ROOT])
+        # For each node, the nearest node on its failure path with an output
+        self._output_links: array = array("I", [_ROOT])
+
+        children: List[List[int]] = [[]]
+        for peptide_index, peptide_sequence in enumerate(peptide_sequences):
+            if peptide_to_cluster_mapping[peptide_index] < 0:
+                continue
+            if replace_isoleucine:
+                peptide_sequence = peptide_sequence.replace("I", "L")
+            node = _ROOT
+            for amino_acid in peptide_sequence:
+                transition = node * _ALPHABET_SIZE + ord(amino_acid)
+                child = self._transitions.get(transition)
+                if child is None:
+                    child = len(children)
+                    self._transitions[transition] = child
+                    children[node].append(transition)
+                    children.append([])
+                node = child
+            self._node_outputs.setdefault(node, []).append(peptide_index)
+        self._build_failure_links(children)
+
+    def _build_failure_links(self, children: List[List[int]]) -> None:
+        number_of_nodes = len(children)
+        self._failure_links = array("I", [_ROOT]) * number_of_nodes
+        self._output_links = array("I", [_ROOT]) * number_of_nodes
+        queue = deque([_ROOT])
+        while len(queue) > 0:
+            node = queue.popleft()
+            for transition in children[node]:
+                child = self._transitions[transition]
+                queue.append(child)
+                if node == _ROOT:
+                    continue
+                amino_acid_code = transition % _ALPHABET_SIZE
+                failure_node = self._failure_links[node]
+                while True:
+                    failure_child = self._transitions.get(
+                        failure_node * _ALPHABET_SIZE + amino_acid_code
+                    )
+                    if failure_child is not None:
+                        break
+                    if failure_node == _ROOT:
+                        failure_child = _ROOT
+                        break
+                    failure_node = self._failure_links[failure_node]
+                self._failure_links[child] = failure_child
+                self._output_links[child] = (
+                    failure_child
+                    if failure_child in self._node_outputs
+                    else self._output_links[failure_child]
+                )
+
+    def get_number_of_nodes(self) -> int:
+        return len(self._failure_links)
+
+    def _scan_translation(self, translation: str, matched_peptides: Set[int]) -> None:
+        transitions = self._transitions
+        failure_links = self._failure_links
+        output_links = self._output_links
+        node_outputs = self._node_outputs
+        node = _ROOT
+        for amino_acid in translation:
+            amino_acid_code = ord(amino_acid)
+            while True:
+                child = transitions.get(node * _ALPHABET_SIZE + amino_acid_code)
+                if child is not None:
+                    node = child
+                    break
+                if node == _ROOT:
+                    break
+                node = failure_links[node]
+            output_node = node if node in node_outputs else output_links[node]
+            while output_node != _ROOT:
+                matched_peptides.update(node_outputs[output_node])
+                output_node = output_links[output_node]
+
+    def get_matches_for_translations(
+        self, translations: Iterable[str]
+    ) -> Tuple[Iterable[int], Set[int]]:
+        matched_peptides: Set[int] = set()
+        for translation in translations:
+            self._scan_translation(translation, matched_peptides)
+        return matched_peptides, set(
+            [self._peptide_to_cluster_mapping[match] for match in matched_peptides]
+        )
@@ -0,0 +1,93 @@
+from itertools import compress
+from typing import Iterable, List, Set, Tuple, Union
+import numpy as np
+
+from pepti_map.matching.matching_engines.matching_engine import IMatchingEngine
+from pepti_map.peptide_data.array_peptide_kmer_index import ArrayPeptideKmerIndex
+from pepti_map.peptide_data.kmer_bloom_filter import KmerBloomFilter
+from pepti_map.peptide_data.kmer_index import IKmerIndex
+from pepti_map.util.k_mer import get_minimizers, split_into_kmer
+
+
+class KmerMatchingEngine(IMatchingEngine):
+    """
+    Matches reads to all peptides sharing at least one k-mer with any
+    of the translated frames, using a lookup in the k-mer index per window.
+    If the index only contains minimizers, the minimizers of the translated
+    frames are looked up instead.
+    If a Bloom filter is given, k-mers rejected by it are not looked up.
+    """
+
+    def __init__(
+        self,
+        kmer_index: IKmerIndex,
+        peptide_to_cluster_mapping: List[int],
+        kmer_filter: Union[KmerBloomFilter, None] = None,
+    ):
+        self._kmer_index: IKmerIndex = kmer_index
+        self._peptide_to_cluster_mapping: List[int] = peptide_to_cluster_mapping
+        self._kmer_filter: Union[KmerBloomFilter, None] = kmer_filter
+
+    def _split_translations_into_kmers(
+        self, translations: Iterable[str]
+    ) -> Iterable[str]:
+        kmer_length = self._kmer_index.kmer_length
+        minimizer_window = self._kmer_index.minimizer_window
+        kmers: List[str] = []
+        for translation in translations:
+            if minimizer_window > 1:
+                kmers.extend(get_minimizers(translation, kmer_length, minimizer_window))
+            else:
+                kmers.extend(
+                    [kmer[0] for kmer in split_into_kmer(translation, kmer_length)]
+                )
+        if self._kmer_filter is None or len(kmers) == 0:
+            return kmers
+        # The k-mers of all frames of the read are checked at once
+        return compress(kmers, self._kmer_filter.might_contain_kmers(kmers).tolist())
+
+    def _get_matches_using_cluster_postings(
+        self, kmer_index: ArrayPeptideKmerIndex, translations: Iterable[str]
+    ) -> Tuple[Iterable[int], Set[int]]:
+        # Work per k-mer hit is proportional to the number of distinct clusters,
+        # the peptide ids are only deduplicated once per read
+        matched_clusters: Set[int] = set()
+        matched_peptide_entries = []
+        for kmer in self._split_translations_into_kmers(translations):
+            peptide_entry, cluster_entry = kmer_index.getEntriesForKmer(kmer)
+            if len(cluster_entry) == 0:
+                if self._kmer_filter is not None:
+                    self._kmer_filter.register_false_positive()
+                continue
+            matched_clusters.update(cluster_entry)
+            matched_peptide_entries.append(peptide_entry)
+        if len(matched_peptide_entries) == 0:
+            return [], matched_clusters
+        return (
+            np.unique(np.concatenate(matched_peptide_entries)).tolist(),
+            matched_clusters,
+        )
+
+    def get_kmer_filter(self) -> Union[KmerBloomFilter, None]:
+        return self._kmer_filter
+
+    def get_matches_for_translations(
+        self, translations: Iterable[str]
+    ) -> Tuple[Iterable[int], Set[int]]:
+        if (
+            isinstance(self._kmer_index, ArrayPeptideKmerIndex)
+            and self._kmer_index.has_cluster_postings()
+        ):
+            return self._get_matches_using_cluster_postings(
+                self._kmer_index, translations
+            )
+
+        matched_peptides = set()
+        for kmer in self._split_translations_into_kmers(translations):
+            entry = self._kmer_index.getEntryForKmer(kmer)
+            if len(entry) == 0 and self._kmer_filter is not None:
+                self._kmer_filter.register_false_positive()
+            matched_peptides.update(entry)
+        return matched_peptides, set(
+            [self._peptide_to_cluster_mapping[match] for match in matched_peptides]
+        )
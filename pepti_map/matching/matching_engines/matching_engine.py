@@ -0,0 +1,19 @@
+from abc import ABC, abstractmethod
+from typing import Iterable, Set, Tuple
+
+
+class IMatchingEngine(ABC):
+    @abstractmethod
+    def get_matches_for_translations(
+        self, translations: Iterable[str]
+    ) -> Tuple[Iterable[int], Set[int]]:
+        """
+        Determines the peptides matching any of the given translations
+        of an RNA-seq read.
+        :param Iterable[str] translations: The amino acid sequences
+        of the translated frames of the read.
+        :returns A Tuple (peptide_ids, cluster_ids) containing the distinct ids
+        of all matched peptides and of the clusters they belong to.
+        :rtype Tuple[Iterable[int], Set[int]]
+        """
+        raise NotImplementedError
@@ -0,0 +1,165 @@
+from collections import defaultdict
+import random
+from typing import List, Set, Union
+import pytest
+from pepti_map.importing.peptide_import.testdata_peptide_importer import (
+    EXPECTED_PEPTIDE_MAPPING,
+    EXPECTED_RESULT_INDEX_ISOLEUCINE_REPLACED,
+    EXPECTED_RESULT_LIST,
+)
+from pepti_map.matching.matching_engines.aho_corasick_matching_engine import (
+    AhoCorasickMatchingEngine,
+)
+from pepti_map.matching.matching_engines.kmer_matching_engine import (
+    KmerMatchingEngine,
+)
+from pepti_map.matching.matching_engines.verifying_kmer_matching_engine import (
+    VerifyingKmerMatchingEngine,
+)
+from pepti_map.matching.rna_to_peptide_matcher import RNAToPeptideMatcher
+from pepti_map.peptide_data.array_peptide_kmer_index import ArrayPeptideKmerIndex
+from pepti_map.peptide_data.kmer_bloom_filter import KmerBloomFilter
+from pepti_map.peptide_data.peptide_kmer_index import PeptideKmerIndex
+from pepti_map.util.k_mer import get_minimizers
+
+
+class TestKmerMatchingEngine:
+    def test_matches_peptides_sharing_kmers(self):
+        kmer_index = PeptideKmerIndex()
+        kmer_index.kmer_index = defaultdict(
+            list, EXPECTED_RESULT_INDEX_ISOLEUCINE_REPLACED.copy()
+        )
+        engine = KmerMatchingEngine(kmer_index, EXPECTED_PEPTIDE_MAPPING)
+        matched_peptides, matched_clusters = engine.get_matches_for_translations(
+            ["AAYCYRSEDAA", "FNQGVRD*Q"]
+        )
+        assert set(matched_peptides) == set([4, 5, 8])
+        assert matched_clusters == set([2, 3, 5])
+
+    @pytest.mark.parametrize("index_type", ["dict", "array", "array_cluster_postings"])
+    def test_bloom_filter_gives_same_matches(self, index_type):
+        if index_type == "dict":
+            kmer_index = PeptideKmerIndex()
+        else:
+            kmer_index = ArrayPeptideKmerIndex()
+        for kmer, entry in EXPECTED_RESULT_INDEX_ISOLEUCINE_REPLACED.items():
+            kmer_index.extendEntryForKmer(kmer, entry)
+        if index_type == "array_cluster_postings":
+            kmer_index.build_cluster_postings(EXPECTED_PEPTIDE_MAPPING)
+        kmer_filter = KmerBloomFilter.from_index(kmer_index)
+        engine = KmerMatchingEngine(kmer_index, EXPECTED_PEPTIDE_MAPPING)
+        filtered_engine = KmerMatchingEngine(
+            kmer_index, EXPECTED_PEPTIDE_MAPPING, kmer_filter
+        )
+        translations = ["AAYCYRSEDAA", "FNQGVRD*Q", "KKKKKKKKKKKKKKK"]
+        matched_peptides, matched_clusters = engine.get_matches_for_translations(
+            translations
+        )
+        filtered_matched_peptides, filtered_matched_clusters = (
+            filtered_engine.get_matches_for_translations(translations)
+        )
+        assert set(filtered_matched_peptides) == set(matched_peptides)
+        assert filtered_matched_clusters == matched_clusters
+        assert kmer_filter.number_of_hits + kmer_filter.number_of_misses == 5 + 1 + 9
+        assert kmer_filter.number_of_hits >= 2
+        assert kmer_filter.number_of_false_positives == kmer_filter.number_of_hits - 2
+
+    def test_verification_of_candidates(self):
+        kmer_index = PeptideKmerIndex()
+        kmer_index.kmer_index = defaultdict(
+            list, EXPECTED_RESULT_INDEX_ISOLEUCINE_REPLACED.copy()
+        )
+        engine = VerifyingKmerMatchingEngine(
+            kmer_index, EXPECTED_PEPTIDE_MAPPING, EXPECTED_RESULT_LIST, 2
+        )
+        # Shares two k-mers with peptides 4 and 8, but only one with peptide 5
+        matched_peptides, matched_clusters = engine.get_matches_for_translations(
+            ["AYCYRSEDLA", "FNQGVRD*Q"]
+        )
+        assert matched_peptides == set([4, 8])
+        assert matched_clusters == set([2, 5])
+
+    def test_verification_of_peptides_with_fewer_kmers(self):
+        kmer_index = PeptideKmerIndex(4)
+        kmer_index.appendToEntryForKmer("ACDE", 0)
+        engine = VerifyingKmerMatchingEngine(kmer_index, [0], ["ACDE"], 2)
+        # The peptide has a length of k and therefore only a single k-mer
+        matched_peptides, matched_clusters = engine.get_matches_for_translations(
+            ["XXACDEXX"]
+        )
+        assert matched_peptides == set([0])
+        assert matched_clusters == set([0])
+
+    def test_minimizer_index_finds_contained_peptides(self):
+        kmer_index = PeptideKmerIndex()
+        kmer_index.minimizer_window = 4
+        for peptide_index, peptide in enumerate(EXPECTED_RESULT_LIST):
+            if EXPECTED_PEPTIDE_MAPPING[peptide_index] < 0:
+                continue
+            for kmer in get_minimizers(peptide.replace("I", "L"), 7, 4):
+                kmer_index.appendToEntryForKmer(kmer, peptide_index)
+        engine = KmerMatchingEngine(kmer_index, EXPECTED_PEPTIDE_MAPPING)
+        matched_peptides, _ = engine.get_matches_for_translations(
+            ["AA" + EXPECTED_RESULT_LIST[3][5:20] + "AA", "FNQGVRDQR"]
+        )
+        assert set(matched_peptides) == set([3, 5])
+
+
+class TestAhoCorasickMatchingEngine:
+    def test_overlapping_peptides(self):
+        engine = AhoCorasickMatchingEngine(
+            ["ABCD", "BC", "D", "BCE", "ABCD", "XYZ"], [0, 1, 2, 3, 0, 4]
+        )
+        matched_peptides, matched_clusters = engine.get_matches_for_translations(
+            ["XABCDX", "BCF*XY"]
+        )
+        assert matched_peptides == set([0, 1, 2, 4])
+        assert matched_clusters == set([0, 1, 2])
+
+    def test_isoleucine_and_unmapped_peptides(self):
+        engine = AhoCorasickMatchingEngine(["PEPTIDE", "IDE", "PEP"], [0, 1, -1])
+        matched_peptides, _ = engine.get_matches_for_translations(["AAPEPTLDEAA"])
+        assert matched_peptides == set([0, 1])
+
+    def test_rejects_differing_lengths(self):
+        with pytest.raises(ValueError):
+            AhoCorasickMatchingEngine(["PEPTIDE"], [0, 1])
+
+    def test_matches_same_peptides_as_substring_search(self):
+        random_generator = random.Random(42)
+        peptides = [
+            "".join(random_generator.choices("ACDL", k=random_generator.randint(1, 6)))
+            for _ in range(0, 200)
+        ]
+        peptide_to_cluster_mapping = list(range(0, len(peptides)))
+        engine = AhoCorasickMatchingEngine(peptides, peptide_to_cluster_mapping)
+        for _ in range(0, 50):
+            translations = [
+                "".join(random_generator.choices("ACDL*", k=30)) for _ in range(0, 3)
+            ]
+            matched_peptides, _ = engine.get_matches_for_translations(translations)
+            assert matched_peptides == set(
+                [
+                    peptide_index
+                    for peptide_index, peptide in enumerate(peptides)
+                    if any([peptide in translation for translation in translations])
+                ]
+            )
+
+    def test_matcher_with_automaton(self):
+        EXPECTED_MATCHING_RESULT: List[Union[Set[int], None]] = [
+            None for _ in range(0, 7)
+        ]
+        EXPECTED_MATCHING_RESULT[3] = set([3])
+
+        engine = AhoCorasickMatchingEngine(
+            EXPECTED_RESULT_LIST, EXPECTED_PEPTIDE_MAPPING
+        )
+        matcher = RNAToPeptideMatcher(None, 7, EXPECTED_PEPTIDE_MAPPING, engine)
+        matcher.add_peptide_matches_for_rna_read(
+            1,
+            "AGCTTTCACGCCGCATACGATGATGCACGAATTTAATCAGGGGGTCCGAGATCCAG",
+        )
+        # Contains "FNQGVRDQR" (peptide 5) in its second frame
+        matcher.add_peptide_matches_for_rna_read(3, "ATTTAATCAGGGGGTCCGAGATCAGAGG")
+        assert matcher.get_matches() == EXPECTED_MATCHING_RESULT
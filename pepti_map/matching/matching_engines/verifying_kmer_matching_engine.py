@@ -0,0 +1,77 @@
+from typing import Iterable, List, Set, Tuple, Union
+
+from pepti_map.matching.matching_engines.kmer_matching_engine import (
+    KmerMatchingEngine,
+)
+from pepti_map.peptide_data.kmer_bloom_filter import KmerBloomFilter
+from pepti_map.peptide_data.kmer_index import IKmerIndex
+from pepti_map.util.k_mer import split_into_kmer
+
+
+class VerifyingKmerMatchingEngine(KmerMatchingEngine):
+    """
+    K-mer matching engine that verifies the candidate peptides found
+    in the index against their full sequence: A candidate is only kept if it
+    shares at least `min_shared_kmers` distinct k-mers with the translated
+    frames, or all of its k-mers if it has fewer. This is mainly intended for indexes of minimizers, in which
+    a single shared minimizer is the only evidence found in the index.
+    """
+
+    def __init__(
+        self,
+        kmer_index: IKmerIndex,
+        peptide_to_cluster_mapping: List[int],
+        peptide_sequences: List[str],
+        min_shared_kmers: int = 2,
+        kmer_filter: Union[KmerBloomFilter, None] = None,
+        replace_isoleucine=True,
+    ):
+        super(VerifyingKmerMatchingEngine, self).__init__(
+            kmer_index, peptide_to_cluster_mapping, kmer_filter
+        )
+        self._peptide_sequences: List[str] = (
+            [peptide.replace("I", "L") for peptide in peptide_sequences]
+            if replace_isoleucine
+            else peptide_sequences
+        )
+        self._min_shared_kmers: int = min_shared_kmers
+
+    def _is_verified(self, peptide_index: int, translation_kmers: Set[str]) -> bool:
+        peptide_kmers = set(
+            [
+                kmer[0]
+                for kmer in split_into_kmer(
+                    self._peptide_sequences[peptide_index],
+                    self._kmer_index.kmer_length,
+                )
+            ]
+        )
+        # Short peptides cannot share more k-mers than they contain
+        return len(peptide_kmers.intersection(translation_kmers)) >= min(
+            self._min_shared_kmers, len(peptide_kmers)
+        )
+
+    def get_matches_for_translations(
+        self, translations: Iterable[str]
+    ) -> Tuple[Iterable[int], Set[int]]:
+        translations = list(translations)
+        candidate_peptides, _ = super(
+            VerifyingKmerMatchingEngine, self
+        ).get_matches_for_translations(translations)
+        translation_kmers = set(
+            [
+                kmer[0]
+                for translation in translations
+                for kmer in split_into_kmer(translation, self._kmer_index.kmer_length)
+            ]
+        )
+        matched_peptides = set(
+            [
+                peptide_index
+                for peptide_index in candidate_peptides
+                if self._is_verified(peptide_index, translation_kmers)
+            ]
+        )
+        return matched_peptides, set(
+            [self._peptide_to_cluster_mapping[match] for match in matched_peptides]
+        )
@@ -1,48 +1,52 @@
 from pathlib import Path
-from typing import List
+from typing import Iterable, List, Set, Union
 from itertools import combinations
 import numpy as np
 import numpy.typing as npt
 from pepti_map.constants import PATH_TO_PRECOMPUTED_INTERSECTIONS
 
+from pepti_map.importing.rna_import.read_store import IReadStore
+from pepti_map.matching.matching_engines.matching_engine import IMatchingEngine
 from pepti_map.matching.rna_to_peptide_matcher import RNAToPeptideMatcher
-from pepti_map.peptide_data.peptide_kmer_index import PeptideKmerIndex
+from pepti_map.peptide_data.duplicate_peptide_mapping import DuplicatePeptideMapping
+from pepti_map.peptide_data.kmer_index import IKmerIndex
+
+_STATE_PRECOMPUTED_INTERSECTIONS_FILENAME = "precomputed_intersections.npz"
 
 
 class PrecomputingRNAToPeptideMatcher(RNAToPeptideMatcher):
     def __init__(
         self,
-        kmer_index: PeptideKmerIndex,
+        kmer_index: Union[IKmerIndex, None],
         number_of_clusters: int,
         peptide_to_cluster_mapping: List[int],
+        matching_engine: Union[IMatchingEngine, None] = None,
+        duplicate_peptide_mapping: Union[DuplicatePeptideMapping, None] = None,
+        read_cache_size: int = 0,
+        read_store: Union[IReadStore, None] = None,
     ):
         super(PrecomputingRNAToPeptideMatcher, self).__init__(
-            kmer_index, number_of_clusters, peptide_to_cluster_mapping
+            kmer_index,
+            number_of_clusters,
+            peptide_to_cluster_mapping,
+            matching_engine,
+            duplicate_peptide_mapping,
+            read_cache_size,
+            read_store,
         )
         self._precomputed_intersections = np.zeros(
             shape=(number_of_clusters, number_of_clusters), dtype=np.uint32
         )
 
-    def add_peptide_matches_for_rna_read(
-        self, rna_read_id: int, rna_read_sequence: str
+    def _add_matches(
+        self,
+        rna_read_id: int,
+        matched_peptides: Iterable[int],
+        matched_clusters: Set[int],
     ) -> None:
-        matched_peptides = set()
-        matched_clusters = set()
-        for kmer in self._process_rna_read_to_kmers(rna_read_sequence):
-            peptide_matches = self._kmer_index.getEntryForKmer(kmer)
-            for match in peptide_matches:
-                cluster_match = self._peptide_to_cluster_mapping[match]
-                if self._matches[cluster_match] is None:
-                    self._matches[cluster_match] = set()
-                self._matches[
-                    cluster_match
-                ].add(  # pyright: ignore[reportOptionalMemberAccess]
-                    rna_read_id
-                )
-                matched_peptides.add(match)
-                matched_clusters.add(cluster_match)
-        for match in matched_peptides:
-            self._matches_per_peptide[match] += 1
+        super(PrecomputingRNAToPeptideMatcher, self)._add_matches(
+            rna_read_id, matched_peptides, matched_clusters
+        )
         for intersecting_set_pair in list(combinations(matched_clusters, 2)):
             # TODO: Can this be improved to not set both entries?
             self._precomputed_intersections[intersecting_set_pair[0]][
@@ -52,6 +56,29 @@ class PrecomputingRNAToPeptideMatcher(RNAToPeptideMatcher):
                 intersecting_set_pair[0]
             ] += 1
 
+    def save_state(self, dirpath: Path) -> None:
+        super(PrecomputingRNAToPeptideMatcher, self).save_state(dirpath)
+        self.save_precomputed_intersections(
+            dirpath / _STATE_PRECOMPUTED_INTERSECTIONS_FILENAME
+        )
+
+    def load_state(self, dirpath: Path) -> None:
+        super(PrecomputingRNAToPeptideMatcher, self).load_state(dirpath)
+        self._precomputed_intersections = (
+            PrecomputingRNAToPeptideMatcher.load_precomputed_intersections(
+                dirpath / _STATE_PRECOMPUTED_INTERSECTIONS_FILENAME
+            )
+        )
+
+    def merge_state(self, dirpath: Path) -> None:
+        super(PrecomputingRNAToPeptideMatcher, self).merge_state(dirpath)
+        # The counts on the diagonal are recomputed from the merged matches
+        self._precomputed_intersections += (
+            PrecomputingRNAToPeptideMatcher.load_precomputed_intersections(
+                dirpath / _STATE_PRECOMPUTED_INTERSECTIONS_FILENAME
+            )
+        )
+
     def get_precomputed_intersections(self) -> npt.NDArray[np.uint32]:
         for cluster_index in range(0, self._precomputed_intersections.shape[0]):
             if self._matches[cluster_index] is None:
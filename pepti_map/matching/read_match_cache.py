@@ -0,0 +1,48 @@
+from collections import OrderedDict
+from typing import Iterable, Set, Tuple, Union
+
+
+class ReadMatchCache:
+    """
+    Bounded cache of the matches of the most recently matched read sequences,
+    so that identical reads, e.g. of highly expressed genes, are only
+    translated and matched once. If the cache is full, the least recently
+    used sequence is evicted, so duplicates far apart in the file may still
+    be matched more than once.
+    """
+
+    def __init__(self, max_size: int):
+        self._max_size: int = max_size
+        self._matches: "OrderedDict[bytes, Tuple[Iterable[int], Set[int]]]" = (
+            OrderedDict()
+        )
+        self.number_of_hits: int = 0
+        self.number_of_misses: int = 0
+
+    def get(self, sequence: bytes) -> Union[Tuple[Iterable[int], Set[int]], None]:
+        matches = self._matches.get(sequence)
+        if matches is None:
+            self.number_of_misses += 1
+            return None
+        self._matches.move_to_end(sequence)
+        self.number_of_hits += 1
+        return matches
+
+    def register_hits(self, number_of_hits: int) -> None:
+        """
+        Registers duplicates that were collapsed without a lookup,
+        e.g. within a batch of reads.
+        """
+        self.number_of_hits += number_of_hits
+
+    def put(self, sequence: bytes, matches: Tuple[Iterable[int], Set[int]]) -> None:
+        self._matches[sequence] = matches
+        if len(self._matches) > self._max_size:
+            self._matches.popitem(last=False)
+
+    def get_report(self) -> str:
+        number_of_reads = self.number_of_hits + self.number_of_misses
+        return (
+            f"{self.number_of_hits} of {number_of_reads} reads were duplicates "
+            "of a cached read"
+        )
@@ -1,23 +1,71 @@
 import csv
 import logging
 from pathlib import Path
-from typing import Generator, List, Set, Union
+from typing import Dict, Iterable, List, Set, Tuple, Union
+import numpy as np
+import numpy.typing as npt
 from pepti_map.constants import PATH_TO_MATCHING_RESULT, PEPTIDE_READ_QUANT_FILENAME
+from pepti_map.importing.rna_import.read_store import IReadStore
 
-from pepti_map.peptide_data.peptide_kmer_index import PeptideKmerIndex
-from pepti_map.util.k_mer import split_into_kmer
-from pepti_map.util.three_frame_translation import get_three_frame_translations
+from pepti_map.matching.matching_engines.kmer_matching_engine import (
+    KmerMatchingEngine,
+)
+from pepti_map.matching.matching_engines.matching_engine import IMatchingEngine
+from pepti_map.matching.read_match_cache import ReadMatchCache
+from pepti_map.peptide_data.duplicate_peptide_mapping import DuplicatePeptideMapping
+from pepti_map.peptide_data.kmer_index import IKmerIndex
+from pepti_map.util.three_frame_translation import (
+    decode_translations,
+    get_three_frame_translations,
+    get_three_frame_translations_of_batch,
+)
+
+_STATE_MATCHES_FILENAME = "matches.txt"
+_STATE_MATCHES_PER_PEPTIDE_FILENAME = "matches_per_peptide.npy"
+_STATE_READ_STORE_SIZE_FILENAME = "read_store_size.npy"
 
 
 class RNAToPeptideMatcher:
     def __init__(
         self,
-        kmer_index: PeptideKmerIndex,
+        kmer_index: Union[IKmerIndex, None],
         number_of_clusters: int,
         peptide_to_cluster_mapping: List[int],
+        matching_engine: Union[IMatchingEngine, None] = None,
+        duplicate_peptide_mapping: Union[DuplicatePeptideMapping, None] = None,
+        read_cache_size: int = 0,
+        read_store: Union[IReadStore, None] = None,
     ):
-        # TODO: We probably want to delete the kmer index after the matching
-        self._kmer_index: PeptideKmerIndex = kmer_index
+        """
+        :param Union[IKmerIndex, None] kmer_index: The k-mer index to match against.
+        Only used if no matching engine is given.
+        :param Union[IMatchingEngine, None] matching_engine: The engine used to
+        determine the peptides matching a read. Defaults to a k-mer lookup
+        in the given index.
+        :param Union[DuplicatePeptideMapping, None] duplicate_peptide_mapping:
+        If given, the matching engine is expected to only return canonical
+        peptides, whose matches are then expanded to their duplicates.
+        :param int read_cache_size: If larger than 0, the matches of up to this
+        many distinct read sequences are cached, so that duplicate reads are
+        only matched once.
+        :param Union[IReadStore, None] read_store: If given, all reads
+        matching at least one cluster are appended to it.
+        """
+        if matching_engine is None:
+            if kmer_index is None:
+                error_message = "Either a k-mer index or a matching engine is needed."
+                logging.error(error_message)
+                raise ValueError(error_message)
+            # TODO: We probably want to delete the kmer index after the matching
+            matching_engine = KmerMatchingEngine(kmer_index, peptide_to_cluster_mapping)
+        self._matching_engine: IMatchingEngine = matching_engine
+        self._duplicate_peptide_mapping: Union[DuplicatePeptideMapping, None] = (
+            duplicate_peptide_mapping
+        )
+        self._read_match_cache: Union[ReadMatchCache, None] = (
+            ReadMatchCache(read_cache_size) if read_cache_size > 0 else None
+        )
+        self._read_store: Union[IReadStore, None] = read_store
         self._matches: List[Union[Set[int], None]] = [
             None for _ in range(0, number_of_clusters)
         ]
@@ -27,32 +75,168 @@ class RNAToPeptideMatcher:
             0 for _ in range(0, len(peptide_to_cluster_mapping))
         ]
 
-    def _process_rna_read_to_kmers(self, sequence: str) -> Generator[str, None, None]:
+    def _get_matches_for_translations(
+        self, translations: List[str]
+    ) -> Tuple[Iterable[int], Set[int]]:
+        matched_peptides, matched_clusters = (
+            self._matching_engine.get_matches_for_translations(translations)
+        )
+        if self._duplicate_peptide_mapping is not None:
+            matched_clusters = self._duplicate_peptide_mapping.expand_clusters(
+                matched_peptides, matched_clusters
+            )
+        return matched_peptides, matched_clusters
+
+    def _get_matches_for_rna_read(
+        self, rna_read_sequence: str
+    ) -> Tuple[Iterable[int], Set[int]]:
+        """
+        Returns the ids of all peptides and clusters
+        that the given RNA-seq read matches.
+        """
         # TODO: Exchange all T for U? (inplace?)
-        # TODO: Construct reverse complement here or during file reading?
-        for translation in get_three_frame_translations(sequence):
-            for kmer in split_into_kmer(translation[0], self._kmer_index.kmer_length):
-                yield kmer[0]
+        return self._get_matches_for_translations(
+            [
+                translation[0]
+                for translation in get_three_frame_translations(rna_read_sequence)
+            ]
+        )
 
-    def add_peptide_matches_for_rna_read(
-        self, rna_read_id: int, rna_read_sequence: str
+    def _add_matches(
+        self,
+        rna_read_id: int,
+        matched_peptides: Iterable[int],
+        matched_clusters: Set[int],
     ) -> None:
-        matched_peptides = set()
-        for kmer in self._process_rna_read_to_kmers(rna_read_sequence):
-            peptide_matches = self._kmer_index.getEntryForKmer(kmer)
-            for match in peptide_matches:
-                cluster_match = self._peptide_to_cluster_mapping[match]
-                if self._matches[cluster_match] is None:
-                    self._matches[cluster_match] = set()
-                self._matches[
-                    cluster_match
-                ].add(  # pyright: ignore[reportOptionalMemberAccess]
-                    rna_read_id
-                )
-                matched_peptides.add(match)
+        for cluster_match in matched_clusters:
+            if self._matches[cluster_match] is None:
+                self._matches[cluster_match] = set()
+            self._matches[
+                cluster_match
+            ].add(  # pyright: ignore[reportOptionalMemberAccess]
+                rna_read_id
+            )
         for match in matched_peptides:
             self._matches_per_peptide[match] += 1
 
+    def add_peptide_matches_for_rna_read(
+        self, rna_read_id: int, rna_read_sequence: str
+    ) -> None:
+        if self._read_match_cache is None:
+            matched_peptides, matched_clusters = self._get_matches_for_rna_read(
+                rna_read_sequence
+            )
+        else:
+            sequence_key = rna_read_sequence.encode("ascii")
+            cached_matches = self._read_match_cache.get(sequence_key)
+            if cached_matches is None:
+                cached_matches = self._get_matches_for_rna_read(rna_read_sequence)
+                self._read_match_cache.put(sequence_key, cached_matches)
+            matched_peptides, matched_clusters = cached_matches
+        self._add_matches(rna_read_id, matched_peptides, matched_clusters)
+        if self._read_store is not None and len(matched_clusters) > 0:
+            sequence = np.frombuffer(rna_read_sequence.encode("ascii"), np.uint8)
+            self._read_store.append_batch(
+                np.array([rna_read_id], dtype=np.uint64),
+                sequence.reshape(1, -1),
+                np.array([len(sequence)], dtype=np.int32),
+            )
+
+    def add_peptide_matches_for_rna_read_batch(
+        self,
+        rna_read_ids: npt.NDArray[np.uint64],
+        sequence_matrix: npt.NDArray[np.uint8],
+        lengths: npt.NDArray[np.int32],
+        record_offsets: Union[npt.NDArray[np.uint64], None] = None,
+    ) -> None:
+        """
+        Adds the matches of a batch of reads, as yielded by
+        `LazyRNAReader.iter_matrix_batches`, with the offsets of their records
+        for the read store, if needed. All reads of the batch are
+        translated at once. If the read cache is used, only the reads whose
+        sequence is neither cached nor contained earlier in the batch are
+        translated and matched.
+        """
+        if self._read_match_cache is None:
+            batch_matches = self._get_matches_for_read_batch(sequence_matrix, lengths)
+        else:
+            batch_matches = self._get_cached_matches_for_read_batch(
+                self._read_match_cache, sequence_matrix, lengths
+            )
+        is_matched = np.zeros(len(rna_read_ids), dtype=np.bool_)
+        for row_index, (rna_read_id, matches) in enumerate(
+            zip(rna_read_ids.tolist(), batch_matches)
+        ):
+            self._add_matches(rna_read_id, *matches)
+            is_matched[row_index] = len(matches[1]) > 0
+        if self._read_store is not None:
+            self._read_store.append_batch(
+                rna_read_ids[is_matched],
+                sequence_matrix[is_matched],
+                lengths[is_matched],
+                None if record_offsets is None else record_offsets[is_matched],
+            )
+
+    def _get_cached_matches_for_read_batch(
+        self,
+        read_match_cache: ReadMatchCache,
+        sequence_matrix: npt.NDArray[np.uint8],
+        lengths: npt.NDArray[np.int32],
+    ) -> List[Tuple[Iterable[int], Set[int]]]:
+        row_length = sequence_matrix.shape[1]
+        all_sequences = np.ascontiguousarray(sequence_matrix).tobytes()
+        sequence_keys = [
+            all_sequences[
+                row_index * row_length : row_index * row_length + length  # noqa: E203
+            ]
+            for row_index, length in enumerate(lengths.tolist())
+        ]
+        # The first row of each distinct sequence of the batch
+        first_rows: Dict[bytes, int] = {}
+        for row_index, sequence_key in enumerate(sequence_keys):
+            first_rows.setdefault(sequence_key, row_index)
+        read_match_cache.register_hits(len(sequence_keys) - len(first_rows))
+        batch_matches: Dict[bytes, Tuple[Iterable[int], Set[int]]] = {}
+        uncached_rows: List[int] = []
+        for sequence_key, row_index in first_rows.items():
+            cached_matches = read_match_cache.get(sequence_key)
+            if cached_matches is None:
+                uncached_rows.append(row_index)
+            else:
+                batch_matches[sequence_key] = cached_matches
+        if len(uncached_rows) > 0:
+            for row_index, matches in zip(
+                uncached_rows,
+                self._get_matches_for_read_batch(
+                    sequence_matrix[uncached_rows], lengths[uncached_rows]
+                ),
+            ):
+                batch_matches[sequence_keys[row_index]] = matches
+                read_match_cache.put(sequence_keys[row_index], matches)
+        return [batch_matches[sequence_key] for sequence_key in sequence_keys]
+
+    def _get_matches_for_read_batch(
+        self,
+        sequence_matrix: npt.NDArray[np.uint8],
+        lengths: npt.NDArray[np.int32],
+    ) -> Iterable[Tuple[Iterable[int], Set[int]]]:
+        translations_per_frame = [
+            decode_translations(translation_matrix, translation_lengths)
+            for translation_matrix, translation_lengths in (
+                get_three_frame_translations_of_batch(sequence_matrix, lengths)
+            )
+        ]
+        return [
+            self._get_matches_for_translations(list(translations))
+            for translations in zip(*translations_per_frame)
+        ]
+
+    def get_read_store(self) -> Union[IReadStore, None]:
+        return self._read_store
+
+    def get_read_match_cache(self) -> Union[ReadMatchCache, None]:
+        return self._read_match_cache
+
     def get_matches(self) -> List[Union[Set[int], None]]:
         return self._matches
 
@@ -85,6 +269,73 @@ class RNAToPeptideMatcher:
                 matches.append(set([int(match_elem) for match_elem in line.split(",")]))
         return matches
 
+    def save_state(self, dirpath: Path) -> None:
+        """
+        Saves the matches found so far, so that the matching can be continued
+        by another matcher via `load_state`.
+        """
+        self.save_matches(dirpath / _STATE_MATCHES_FILENAME)
+        np.save(
+            dirpath / _STATE_MATCHES_PER_PEPTIDE_FILENAME,
+            np.array(self._matches_per_peptide, dtype=np.int64),
+        )
+        if self._read_store is not None:
+            np.save(
+                dirpath / _STATE_READ_STORE_SIZE_FILENAME,
+                np.array(self._read_store.get_size(), dtype=np.int64),
+            )
+
+    def _load_matches_of_state(
+        self, dirpath: Path
+    ) -> Tuple[List[Union[Set[int], None]], List[int]]:
+        matches = RNAToPeptideMatcher.load_matches(dirpath / _STATE_MATCHES_FILENAME)
+        matches_per_peptide = np.load(
+            dirpath / _STATE_MATCHES_PER_PEPTIDE_FILENAME
+        ).tolist()
+        if len(matches) != len(self._matches) or len(matches_per_peptide) != len(
+            self._matches_per_peptide
+        ):
+            error_message = (
+                f"The matching state in {dirpath} does not fit the given peptides."
+            )
+            logging.error(error_message)
+            raise ValueError(error_message)
+        return matches, matches_per_peptide
+
+    def load_state(self, dirpath: Path) -> None:
+        matches, matches_per_peptide = self._load_matches_of_state(dirpath)
+        self._matches = matches
+        self._matches_per_peptide = matches_per_peptide
+        if self._read_store is not None:
+            # Reads stored after the state was saved are matched again
+            read_store_size = np.load(dirpath / _STATE_READ_STORE_SIZE_FILENAME)
+            self._read_store.truncate(
+                (
+                    int(read_store_size[0]),
+                    int(read_store_size[1]),
+                    int(read_store_size[2]),
+                )
+            )
+
+    def merge_state(self, dirpath: Path) -> None:
+        """
+        Adds the matches saved via `save_state` by another matcher, which matched
+        other reads (e.g. the ones of another lane), to the matches of this one.
+        """
+        matches, matches_per_peptide = self._load_matches_of_state(dirpath)
+        for cluster_index, match in enumerate(matches):
+            if match is None:
+                continue
+            own_match = self._matches[cluster_index]
+            if own_match is None:
+                self._matches[cluster_index] = match
+            else:
+                own_match.update(match)
+        self._matches_per_peptide = [
+            own_count + count
+            for own_count, count in zip(self._matches_per_peptide, matches_per_peptide)
+        ]
+
     def write_peptide_read_quant_file(
         self, dirpath: Path, peptide_sequences: List[str]
     ) -> None:
@@ -98,6 +349,11 @@ class RNAToPeptideMatcher:
                 )
             )
             raise assertion_error
+        matches_per_peptide = self._matches_per_peptide
+        if self._duplicate_peptide_mapping is not None:
+            matches_per_peptide = self._duplicate_peptide_mapping.expand_peptide_counts(
+                matches_per_peptide
+            )
         with open(
             dirpath / PEPTIDE_READ_QUANT_FILENAME, "wt", encoding="utf-8"
         ) as peptide_quant_file:
@@ -125,7 +381,7 @@ class RNAToPeptideMatcher:
                     [
                         peptide_sequence,
                         self._peptide_to_cluster_mapping[peptide_index],
-                        self._matches_per_peptide[peptide_index],
+                        matches_per_peptide[peptide_index],
                         n_cluster_matches,
                     ]
                 )
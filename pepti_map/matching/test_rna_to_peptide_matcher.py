@@ -2,6 +2,7 @@ from collections import defaultdict
 import csv
 from pathlib import Path
 from typing import List, Set, Union
+from unittest.mock import patch
 import numpy as np
 import pytest
 from pepti_map.importing.peptide_import.testdata_peptide_importer import (
@@ -10,6 +11,13 @@ from pepti_map.importing.peptide_import.testdata_peptide_importer import (
     EXPECTED_RESULT_INDEX_ISOLEUCINE_REPLACED,
     EXPECTED_RESULT_LIST,
 )
+from pepti_map.importing.rna_import.packed_read_store import PackedReadStore
+from pepti_map.matching.lane_matcher import (
+    LaneMatcher,
+    get_lane_sample_size,
+    match_lanes_in_parallel,
+)
+from pepti_map.matching.matching_checkpoint import MatchingCheckpoint
 from pepti_map.matching.precomputing_rna_to_peptide_matcher import (
     PrecomputingRNAToPeptideMatcher,
 )
@@ -18,7 +26,10 @@ from pepti_map.matching.rna_to_peptide_matcher import (
     PEPTIDE_READ_QUANT_FILENAME,
     RNAToPeptideMatcher,
 )
+from pepti_map.peptide_data.array_peptide_kmer_index import ArrayPeptideKmerIndex
+from pepti_map.peptide_data.duplicate_peptide_mapping import DuplicatePeptideMapping
 from pepti_map.peptide_data.peptide_kmer_index import PeptideKmerIndex
+from pepti_map.util.read_id import encode_read_id
 
 
 class TestRNAToPeptideMatcher:
@@ -64,6 +75,109 @@ class TestRNAToPeptideMatcher:
         )
         assert self.matcher.get_matches() == EXPECTED_MATCHING_RESULT
 
+    def test_add_matches_of_read_batch(self):
+        EXPECTED_MATCHING_RESULT: List[Union[Set[int], None]] = [
+            None for _ in range(0, 7)
+        ]
+        EXPECTED_MATCHING_RESULT[0] = set([2])
+        EXPECTED_MATCHING_RESULT[2] = set([1, 2])
+        EXPECTED_MATCHING_RESULT[3] = set([1])
+        EXPECTED_MATCHING_RESULT[5] = set([1, 2])
+
+        sequences = [
+            "AGCTTTCACGCCGCATACGATGATGCACGAATTTAATCAGGGGGTCCGAGATCCAG",
+            "GATGTAAGTTGATATCGTAGACCGGCATCGCAAGGCACAACCCTGGCGTGAACCGA",
+            "GATGTAAGTTGA",
+        ]
+        sequence_matrix = np.zeros((3, 56), dtype=np.uint8)
+        for row_index, sequence in enumerate(sequences):
+            sequence_matrix[row_index, 0 : len(sequence)] = np.frombuffer(  # noqa: E203
+                sequence.encode("ascii"), dtype=np.uint8
+            )
+        self.matcher.add_peptide_matches_for_rna_read_batch(
+            np.array([1, 2, 3]), sequence_matrix, np.array([56, 56, 12])
+        )
+        assert self.matcher.get_matches() == EXPECTED_MATCHING_RESULT
+
+    @pytest.mark.parametrize("read_cache_size", [0, 10])
+    def test_store_matched_reads(self, tmp_path, read_cache_size):
+        sequences = [
+            "AGCTTTCACGCCGCATACGATGATGCACGAATTTAATCAGGGGGTCCGAGATCCAG",
+            "GATGTAAGTTGA",
+            "GATGTAAGTTGATATCGTAGACCGGCATCGCAAGGCACAACCCTGGCGTGAACCGA",
+        ]
+        sequence_matrix = np.zeros((3, 56), dtype=np.uint8)
+        for row_index, sequence in enumerate(sequences):
+            sequence_matrix[row_index, 0 : len(sequence)] = np.frombuffer(  # noqa: E203
+                sequence.encode("ascii"), dtype=np.uint8
+            )
+        read_store = PackedReadStore(tmp_path / "read_store")
+        matcher = RNAToPeptideMatcher(
+            self.kmer_index,
+            7,
+            EXPECTED_PEPTIDE_MAPPING,
+            read_cache_size=read_cache_size,
+            read_store=read_store,
+        )
+        matcher.add_peptide_matches_for_rna_read_batch(
+            np.array([1, 3, 2], dtype=np.uint64),
+            sequence_matrix,
+            np.array([56, 12, 56], dtype=np.int32),
+        )
+        matcher.add_peptide_matches_for_rna_read(4, sequences[1])
+        matcher.add_peptide_matches_for_rna_read(5, sequences[0])
+        read_store.close()
+
+        # Only the reads matching a cluster are stored
+        assert len(read_store) == 3
+        assert read_store.get_read_sequences_for_ids([5, 2, 1]) == (
+            [5, 2, 1],
+            [sequences[0], sequences[2], sequences[0]],
+        )
+        with pytest.raises(ValueError):
+            read_store.get_read_sequences_for_ids([3])
+
+    @pytest.mark.parametrize(
+        "matcher_class", [RNAToPeptideMatcher, PrecomputingRNAToPeptideMatcher]
+    )
+    @pytest.mark.parametrize("read_cache_size", [1, 10])
+    def test_collapse_duplicate_reads(self, matcher_class, read_cache_size):
+        sequences = [
+            "AGCTTTCACGCCGCATACGATGATGCACGAATTTAATCAGGGGGTCCGAGATCCAG",
+            "GATGTAAGTTGATATCGTAGACCGGCATCGCAAGGCACAACCCTGGCGTGAACCGA",
+        ]
+        sequence_matrix = np.array(
+            [list(sequences[row_index].encode("ascii")) for row_index in [0, 1, 0, 0]],
+            dtype=np.uint8,
+        )
+        matcher = matcher_class(self.kmer_index, 7, EXPECTED_PEPTIDE_MAPPING)
+        collapsing_matcher = matcher_class(
+            self.kmer_index,
+            7,
+            EXPECTED_PEPTIDE_MAPPING,
+            read_cache_size=read_cache_size,
+        )
+        for current_matcher in [matcher, collapsing_matcher]:
+            for batch_index in range(2):
+                current_matcher.add_peptide_matches_for_rna_read_batch(
+                    np.arange(4) + 4 * batch_index,
+                    sequence_matrix,
+                    np.full(4, 56, dtype=np.int32),
+                )
+            current_matcher.add_peptide_matches_for_rna_read(8, sequences[1])
+        assert collapsing_matcher.get_matches() == matcher.get_matches()
+        assert collapsing_matcher._matches_per_peptide == matcher._matches_per_peptide
+        if isinstance(matcher, PrecomputingRNAToPeptideMatcher):
+            assert np.array_equal(
+                collapsing_matcher.get_precomputed_intersections(),
+                matcher.get_precomputed_intersections(),
+            )
+        read_match_cache = collapsing_matcher.get_read_match_cache()
+        assert read_match_cache is not None
+        assert read_match_cache.number_of_hits + read_match_cache.number_of_misses == 9
+        # With only one cached sequence, the second batch evicts the other one
+        assert read_match_cache.number_of_hits == (5 if read_cache_size == 1 else 7)
+
     def test_peptide_quant_file(self, tmp_path):
         # TODO: Move to data file?
         EXPECTED_FILE_CONTENTS = [
@@ -100,6 +214,47 @@ class TestRNAToPeptideMatcher:
                 file_entries.append(row)
         assert file_entries == EXPECTED_FILE_CONTENTS
 
+    def test_deduplicated_peptides_give_same_result(self, tmp_path):
+        # Peptide 8 is a duplicate of peptide 4 and therefore not indexed
+        deduplicated_kmer_index = PeptideKmerIndex()
+        for kmer, entry in EXPECTED_RESULT_INDEX_ISOLEUCINE_REPLACED.items():
+            deduplicated_kmer_index.extendEntryForKmer(
+                kmer, [peptide_id for peptide_id in entry if peptide_id != 8]
+            )
+        duplicate_peptide_mapping = DuplicatePeptideMapping(
+            [0, 1, 2, 3, 4, 5, 6, 7, 4, 9], EXPECTED_PEPTIDE_MAPPING
+        )
+        deduplicated_matcher = RNAToPeptideMatcher(
+            deduplicated_kmer_index,
+            7,
+            EXPECTED_PEPTIDE_MAPPING,
+            duplicate_peptide_mapping=duplicate_peptide_mapping,
+        )
+        for matcher in [self.matcher, deduplicated_matcher]:
+            matcher.add_peptide_matches_for_rna_read(
+                1,
+                "AGCTTTCACGCCGCATACGATGATGCACGAATTTAATCAGGGGGTCCGAGATCCAG",
+            )
+            matcher.add_peptide_matches_for_rna_read(
+                2,
+                "GATGTAAGTTGATATCGTAGACCGGCATCGCAAGGCACAACCCTGGCGTGAACCGA",
+            )
+        assert deduplicated_matcher.get_matches() == self.matcher.get_matches()
+
+        file_entries = []
+        for matcher_name, matcher in [
+            ("matcher", self.matcher),
+            ("deduplicated_matcher", deduplicated_matcher),
+        ]:
+            temp_directory: Path = tmp_path / matcher_name
+            temp_directory.mkdir()
+            matcher.write_peptide_read_quant_file(temp_directory, EXPECTED_RESULT_LIST)
+            with open(
+                temp_directory / PEPTIDE_READ_QUANT_FILENAME, "rt", encoding="utf-8"
+            ) as peptide_quant_file:
+                file_entries.append(peptide_quant_file.read())
+        assert file_entries[0] == file_entries[1]
+
     def test_peptide_quant_file_groups(self, tmp_path):
         group_matcher = RNAToPeptideMatcher(
             self.kmer_index, 5, EXPECTED_PEPTIDE_MAPPING_PROTEIN_GROUPS
@@ -141,6 +296,30 @@ class TestRNAToPeptideMatcher:
                 file_entries.append(row)
         assert file_entries == EXPECTED_FILE_CONTENTS
 
+    def test_add_multiple_matches_array_index(self):
+        EXPECTED_MATCHING_RESULT: List[Union[Set[int], None]] = [
+            None for _ in range(0, 7)
+        ]
+
+        EXPECTED_MATCHING_RESULT[0] = set([2])
+        EXPECTED_MATCHING_RESULT[2] = set([1, 2])
+        EXPECTED_MATCHING_RESULT[3] = set([1])
+        EXPECTED_MATCHING_RESULT[5] = set([1, 2])
+
+        array_kmer_index = ArrayPeptideKmerIndex()
+        for kmer, entry in EXPECTED_RESULT_INDEX_ISOLEUCINE_REPLACED.items():
+            array_kmer_index.extendEntryForKmer(kmer, entry)
+        matcher = RNAToPeptideMatcher(array_kmer_index, 7, EXPECTED_PEPTIDE_MAPPING)
+        matcher.add_peptide_matches_for_rna_read(
+            1,
+            "AGCTTTCACGCCGCATACGATGATGCACGAATTTAATCAGGGGGTCCGAGATCCAG",
+        )
+        matcher.add_peptide_matches_for_rna_read(
+            2,
+            "GATGTAAGTTGATATCGTAGACCGGCATCGCAAGGCACAACCCTGGCGTGAACCGA",
+        )
+        assert matcher.get_matches() == EXPECTED_MATCHING_RESULT
+
     def test_save_matches_to_file(self, tmp_path):
         EXPECTED_MATCHING_RESULT: List[Union[Set[int], None]] = [
             None for _ in range(0, 7)
@@ -245,6 +424,42 @@ class TestPrecomputingRNAToPeptideMatcher:
             expected_precomputed_intersections,
         )
 
+    @pytest.mark.parametrize(
+        "peptide_to_cluster_mapping",
+        [EXPECTED_PEPTIDE_MAPPING, EXPECTED_PEPTIDE_MAPPING_PROTEIN_GROUPS],
+        ids=["simple", "protein_groups"],
+    )
+    def test_cluster_postings_give_same_result(self, peptide_to_cluster_mapping):
+        array_kmer_index = ArrayPeptideKmerIndex()
+        for kmer, entry in EXPECTED_RESULT_INDEX_ISOLEUCINE_REPLACED.items():
+            array_kmer_index.extendEntryForKmer(kmer, entry)
+        array_kmer_index.build_cluster_postings(peptide_to_cluster_mapping)
+        number_of_clusters = max(peptide_to_cluster_mapping) + 1
+        matcher = PrecomputingRNAToPeptideMatcher(
+            self.kmer_index, number_of_clusters, peptide_to_cluster_mapping
+        )
+        cluster_postings_matcher = PrecomputingRNAToPeptideMatcher(
+            array_kmer_index, number_of_clusters, peptide_to_cluster_mapping
+        )
+        for read_id, read_sequence in [
+            (1, "AGCTTTCACGCCGCATACGATGATGCACGAATTTAATCAGGGGGTCCGAGATCCAG"),
+            (2, "GATGTAAGTTGATATCGTAGACCGGCATCGCAAGGCACAACCCTGGCGTGAACCGA"),
+        ]:
+            matcher.add_peptide_matches_for_rna_read(read_id, read_sequence)
+            cluster_postings_matcher.add_peptide_matches_for_rna_read(
+                read_id, read_sequence
+            )
+
+        assert cluster_postings_matcher.get_matches() == matcher.get_matches()
+        assert (
+            cluster_postings_matcher._matches_per_peptide
+            == matcher._matches_per_peptide
+        )
+        np.testing.assert_array_equal(
+            cluster_postings_matcher.get_precomputed_intersections(),
+            matcher.get_precomputed_intersections(),
+        )
+
     def test_save_precomputed_intersections(self, tmp_path):
         EXPECTED_MATCHING_RESULT: List[Union[Set[int], None]] = [
             None for _ in range(0, 7)
@@ -284,3 +499,226 @@ class TestPrecomputingRNAToPeptideMatcher:
             ),
             expected_precomputed_intersections,
         )
+
+
+class TestMatchingCheckpoint:
+    @pytest.mark.parametrize(
+        "matcher_class", [RNAToPeptideMatcher, PrecomputingRNAToPeptideMatcher]
+    )
+    def test_resume_from_checkpoint(self, tmp_path, matcher_class):
+        kmer_index = PeptideKmerIndex()
+        kmer_index.kmer_index = defaultdict(
+            list, EXPECTED_RESULT_INDEX_ISOLEUCINE_REPLACED.copy()
+        )
+        settings = {"rna_files": ["file1.fq", "file2.fq"], "cutoff": (-1, -1)}
+        checkpoint_dir = tmp_path / "checkpoint"
+
+        matcher = matcher_class(kmer_index, 7, EXPECTED_PEPTIDE_MAPPING)
+        matcher.add_peptide_matches_for_rna_read(
+            1,
+            "AGCTTTCACGCCGCATACGATGATGCACGAATTTAATCAGGGGGTCCGAGATCCAG",
+        )
+        checkpoint = MatchingCheckpoint(settings, 0, checkpoint_dir)
+        checkpoint.save_if_due(matcher, (0, 100, 1))
+        assert not checkpoint_dir.exists()
+        checkpoint.save(matcher, (0, 100, 1))
+
+        resumed_matcher = matcher_class(kmer_index, 7, EXPECTED_PEPTIDE_MAPPING)
+        assert MatchingCheckpoint(settings, 0, checkpoint_dir).load(
+            resumed_matcher
+        ) == (0, 100, 1)
+        for current_matcher in [matcher, resumed_matcher]:
+            current_matcher.add_peptide_matches_for_rna_read(
+                2,
+                "GATGTAAGTTGATATCGTAGACCGGCATCGCAAGGCACAACCCTGGCGTGAACCGA",
+            )
+        assert resumed_matcher.get_matches() == matcher.get_matches()
+        assert resumed_matcher._matches_per_peptide == matcher._matches_per_peptide
+        if isinstance(matcher, PrecomputingRNAToPeptideMatcher):
+            assert np.array_equal(
+                resumed_matcher.get_precomputed_intersections(),
+                matcher.get_precomputed_intersections(),
+            )
+
+        assert (
+            MatchingCheckpoint({**settings, "cutoff": 50}, 0, checkpoint_dir).load(
+                matcher_class(kmer_index, 7, EXPECTED_PEPTIDE_MAPPING)
+            )
+            is None
+        )
+        checkpoint.remove()
+        assert (
+            MatchingCheckpoint(settings, 0, checkpoint_dir).load(
+                matcher_class(kmer_index, 7, EXPECTED_PEPTIDE_MAPPING)
+            )
+            is None
+        )
+
+    @pytest.mark.parametrize(
+        "matcher_class", [RNAToPeptideMatcher, PrecomputingRNAToPeptideMatcher]
+    )
+    def test_merge_states_of_lanes(self, tmp_path, matcher_class):
+        kmer_index = PeptideKmerIndex()
+        kmer_index.kmer_index = defaultdict(
+            list, EXPECTED_RESULT_INDEX_ISOLEUCINE_REPLACED.copy()
+        )
+        reads_per_lane = [
+            [
+                (1, "AGCTTTCACGCCGCATACGATGATGCACGAATTTAATCAGGGGGTCCGAGATCCAG"),
+                (2, "GATGTAAGTTGATATCGTAGACCGGCATCGCAAGGCACAACCCTGGCGTGAACCGA"),
+            ],
+            [
+                (
+                    encode_read_id(0, 1, 1),
+                    "AGCTTTCACGCCGCATACGATGATGCACGAATTTAATCAGGGGGTCCGAGATCCAG",
+                )
+            ],
+        ]
+        matcher = matcher_class(kmer_index, 7, EXPECTED_PEPTIDE_MAPPING)
+        merged_matcher = matcher_class(kmer_index, 7, EXPECTED_PEPTIDE_MAPPING)
+        for lane, reads in enumerate(reads_per_lane):
+            lane_matcher = matcher_class(kmer_index, 7, EXPECTED_PEPTIDE_MAPPING)
+            for read_id, sequence in reads:
+                matcher.add_peptide_matches_for_rna_read(read_id, sequence)
+                lane_matcher.add_peptide_matches_for_rna_read(read_id, sequence)
+            (tmp_path / f"lane_{lane}").mkdir()
+            lane_matcher.save_state(tmp_path / f"lane_{lane}")
+            merged_matcher.merge_state(tmp_path / f"lane_{lane}")
+
+        assert merged_matcher.get_matches() == matcher.get_matches()
+        assert merged_matcher._matches_per_peptide == matcher._matches_per_peptide
+        if isinstance(matcher, PrecomputingRNAToPeptideMatcher):
+            assert np.array_equal(
+                merged_matcher.get_precomputed_intersections(),
+                matcher.get_precomputed_intersections(),
+            )
+
+    def test_resume_read_store_from_checkpoint(self, tmp_path):
+        kmer_index = PeptideKmerIndex()
+        kmer_index.kmer_index = defaultdict(
+            list, EXPECTED_RESULT_INDEX_ISOLEUCINE_REPLACED.copy()
+        )
+        checkpoint_dir = tmp_path / "checkpoint"
+        read_store_dir = tmp_path / "read_store"
+
+        matcher = RNAToPeptideMatcher(
+            kmer_index,
+            7,
+            EXPECTED_PEPTIDE_MAPPING,
+            read_store=PackedReadStore(read_store_dir),
+        )
+        matcher.add_peptide_matches_for_rna_read(
+            1,
+            "AGCTTTCACGCCGCATACGATGATGCACGAATTTAATCAGGGGGTCCGAGATCCAG",
+        )
+        checkpoint = MatchingCheckpoint({}, 0, checkpoint_dir)
+        checkpoint.save(matcher, (0, 100, 1))
+        # Matched after the checkpoint, before the run was interrupted
+        matcher.add_peptide_matches_for_rna_read(
+            2,
+            "GATGTAAGTTGATATCGTAGACCGGCATCGCAAGGCACAACCCTGGCGTGAACCGA",
+        )
+        read_store = matcher.get_read_store()
+        assert read_store is not None
+        read_store.close()
+        assert len(read_store) == 2
+
+        resumed_read_store = PackedReadStore(read_store_dir)
+        resumed_matcher = RNAToPeptideMatcher(
+            kmer_index, 7, EXPECTED_PEPTIDE_MAPPING, read_store=resumed_read_store
+        )
+        checkpoint.load(resumed_matcher)
+        assert len(resumed_read_store) == 1
+        assert resumed_read_store.get_read_sequences_for_ids([1]) == (
+            [1],
+            ["AGCTTTCACGCCGCATACGATGATGCACGAATTTAATCAGGGGGTCCGAGATCCAG"],
+        )
+
+
+class TestLaneMatcher:
+    SEQUENCES = [
+        "AGCTTTCACGCCGCATACGATGATGCACGAATTTAATCAGGGGGTCCGAGATCCAG",
+        "GATGTAAGTTGATATCGTAGACCGGCATCGCAAGGCACAACCCTGGCGTGAACCGA",
+    ]
+
+    @pytest.mark.parametrize("supports_fork", [True, False])
+    def test_match_lanes_in_parallel(self, tmp_path, supports_fork):
+        kmer_index = PeptideKmerIndex()
+        kmer_index.kmer_index = defaultdict(
+            list, EXPECTED_RESULT_INDEX_ISOLEUCINE_REPLACED.copy()
+        )
+        sequences_per_lane = [self.SEQUENCES, self.SEQUENCES[::-1] + self.SEQUENCES]
+        rna_files_per_lane = []
+        for lane, sequences in enumerate(sequences_per_lane):
+            with open(tmp_path / f"{lane}.fq", "wt", encoding="utf-8") as rna_file:
+                for record_index, sequence in enumerate(sequences):
+                    rna_file.write(
+                        f"@read{record_index}\n{sequence}\n+\n{'F' * len(sequence)}\n"
+                    )
+            rna_files_per_lane.append([tmp_path / f"{lane}.fq"])
+
+        def create_matcher(read_store):
+            return PrecomputingRNAToPeptideMatcher(
+                kmer_index, 7, EXPECTED_PEPTIDE_MAPPING, read_store=read_store
+            )
+
+        lane_matcher = LaneMatcher(
+            rna_files_per_lane,
+            (-1, -1),
+            create_matcher,
+            lambda lane: PackedReadStore(tmp_path / "read_store" / f"lane_{lane}"),
+            lambda lane: tmp_path / "checkpoint" / f"lane_{lane}",
+            {},
+        )
+        merged_matcher = create_matcher(None)
+        with patch(
+            "pepti_map.matching.lane_matcher._supports_fork",
+            return_value=supports_fork,
+        ):
+            lane_results = match_lanes_in_parallel(lane_matcher, 2)
+        for lane_state_dir, sampling_fraction in lane_results:
+            merged_matcher.merge_state(lane_state_dir)
+            assert sampling_fraction == 1.0
+
+        matcher = create_matcher(None)
+        lane_1_matcher = create_matcher(None)
+        for lane, sequences in enumerate(sequences_per_lane):
+            for record_index, sequence in enumerate(sequences):
+                read_id = encode_read_id(record_index, 0, lane)
+                matcher.add_peptide_matches_for_rna_read(read_id, sequence)
+                if lane == 1:
+                    lane_1_matcher.add_peptide_matches_for_rna_read(read_id, sequence)
+        assert any(match is not None for match in matcher.get_matches())
+        assert merged_matcher.get_matches() == matcher.get_matches()
+        assert np.array_equal(
+            merged_matcher.get_precomputed_intersections(),
+            matcher.get_precomputed_intersections(),
+        )
+        assert PackedReadStore(
+            tmp_path / "read_store" / "lane_1"
+        ).get_read_sequences_for_ids([encode_read_id(2, 0, 1)]) == (
+            [encode_read_id(2, 0, 1)],
+            [self.SEQUENCES[0]],
+        )
+
+        # A restarted run resumes from the final states of the lanes
+        resumed_matcher, _ = lane_matcher.match_lane(1)
+        assert resumed_matcher.get_matches() == lane_1_matcher.get_matches()
+        assert len(PackedReadStore(tmp_path / "read_store" / "lane_1")) == 4
+        lane_matcher.remove_checkpoints()
+        assert list((tmp_path / "checkpoint").iterdir()) == []
+
+    def test_split_sample_size(self):
+        assert [get_lane_sample_size(10, lane, 4) for lane in range(0, 4)] == [
+            3,
+            3,
+            2,
+            2,
+        ]
+        assert [get_lane_sample_size(2, lane, 4) for lane in range(0, 4)] == [
+            1,
+            1,
+            0,
+            0,
+        ]
+        assert get_lane_sample_size(None, 0, 4) is None
@@ -6,39 +6,31 @@ import gffutils
 from pathlib import Path
 from typing import List, TextIO, Tuple, Union
 
+from pepti_map.peptide_data.peptide_table import PeptideTable
 from pepti_map.util.three_frame_translation import get_three_frame_translations
 
 
 class PoGoInputHelper:
-    def __init__(
-        self, path_to_peptides: Path, path_to_peptide_to_cluster_mapping: Path
-    ):
-        self._peptides = []
-        with open(path_to_peptides, "rt", encoding="utf-8") as peptides_file:
-            for line in peptides_file:
-                self._peptides.append(
-                    line.split("\t")[0].strip()
-                )  # ignores group information if present
+    def __init__(self, peptide_table: PeptideTable):
+        self._peptide_table: PeptideTable = peptide_table
 
         # Reverse mapping to get cluster_id -> peptide_id
         self._cluster_to_peptide_mapping: "defaultdict[int, List[int]]" = defaultdict(
             list
         )
-        with open(
-            path_to_peptide_to_cluster_mapping, "rt", encoding="utf-8"
-        ) as peptide_to_cluster_mapping:
-            for peptide_id, line in enumerate(peptide_to_cluster_mapping):
-                cluster_id = int(line.strip())
-                # Exclude peptides that were too short to be included
-                if cluster_id == -1:
-                    continue
-                self._cluster_to_peptide_mapping[cluster_id].append(peptide_id)
+        for peptide_id, cluster_id in enumerate(
+            peptide_table.get_peptide_to_cluster_mapping()
+        ):
+            # Exclude peptides that were too short to be included
+            if cluster_id == -1:
+                continue
+            self._cluster_to_peptide_mapping[cluster_id].append(peptide_id)
 
     def generate_peptide_input_file(
         self, output_directory: Path, merged_indexes: List[int]
     ) -> None:
         peptide_already_written: List[bool] = [
-            False for _ in range(len(self._peptides))
+            False for _ in range(len(self._peptide_table))
         ]
         with open(
             output_directory / "pogo_peptides_in.tsv", "wt", encoding="utf-8"
@@ -50,7 +42,15 @@ class PoGoInputHelper:
                         continue
                     # Use 1 as default for Sample, PSMs and Quant
                     new_input_file.write(
-                        "\t".join(["1", self._peptides[peptide_id], "1", "1"]) + "\n"
+                        "\t".join(
+                            [
+                                "1",
+                                self._peptide_table.get_sequence(peptide_id),
+                                "1",
+                                "1",
+                            ]
+                        )
+                        + "\n"
                     )
                     peptide_already_written[peptide_id] = True
 
@@ -0,0 +1,417 @@
+from array import array
+import logging
+import struct
+from typing import Generator, Iterable, List, Tuple, Union
+import numpy as np
+import numpy.typing as npt
+
+from pepti_map.peptide_data.kmer_index import IKmerIndex
+from pepti_map.util.k_mer import MAX_ENCODABLE_KMER_LENGTH, decode_kmer, encode_kmer
+
+# Layout of the binary index file: A fixed-size header, followed by the arrays
+# `codes`, `offsets`, `postings` and the peptide to cluster mapping.
+# Each array starts at a multiple of 8 bytes, so that it can be memory-mapped.
+# The minimizer window is stored in a formerly reserved field, with 0 meaning 1.
+BINARY_INDEX_MAGIC = b"PMKIDX\x00\x00"
+BINARY_INDEX_VERSION = 1
+_BINARY_INDEX_HEADER = struct.Struct("<8sHHIqqqq")
+_BINARY_INDEX_HEADER_SIZE = 64
+_BINARY_INDEX_ALIGNMENT = 8
+
+
+def _get_aligned_offset(offset: int) -> int:
+    return -(-offset // _BINARY_INDEX_ALIGNMENT) * _BINARY_INDEX_ALIGNMENT
+
+
+class ArrayPeptideKmerIndex(IKmerIndex):
+    """
+    K-mer index that stores each k-mer as an integer code (see `encode_kmer`).
+    The codes are kept sorted in a NumPy array, with the peptide ids per k-mer
+    stored in CSR format: The entry for the k-mer `codes[i]` is
+    `postings[offsets[i] : offsets[i + 1]]`.
+    Entries added via `appendToEntryForKmer` or `extendEntryForKmer` are buffered
+    and merged into the arrays before the next lookup. K-mers containing
+    characters other than A-Z, which no translated read contains, are not
+    added, so that the index matches the same reads as `PeptideKmerIndex`.
+    """
+
+    def __init__(self, kmer_length: int = 7):
+        if kmer_length < 1 or kmer_length > MAX_ENCODABLE_KMER_LENGTH:
+            error_message = (
+                "The k-mer length for the array-based index must be between 1 and "
+                f"{MAX_ENCODABLE_KMER_LENGTH}, but was {kmer_length}."
+            )
+            logging.error(error_message)
+            raise ValueError(error_message)
+        self.kmer_length: int = kmer_length
+        self.minimizer_window: int = 1
+        # TODO: Do this in a prettier way
+        self.number_of_peptides: int = -1
+        self._codes: npt.NDArray[np.uint64] = np.empty(0, dtype=np.uint64)
+        self._offsets: npt.NDArray[np.int64] = np.zeros(1, dtype=np.int64)
+        self._postings: npt.NDArray[np.uint32] = np.empty(0, dtype=np.uint32)
+        self._pending_codes: array = array("Q")
+        self._pending_entries: array = array("I")
+        self._cluster_offsets: Union[npt.NDArray[np.int64], None] = None
+        self._cluster_postings: Union[npt.NDArray[np.uint32], None] = None
+
+    @classmethod
+    def from_csr_arrays(
+        cls,
+        kmer_length: int,
+        codes: npt.NDArray[np.uint64],
+        offsets: npt.NDArray[np.int64],
+        postings: npt.NDArray[np.uint32],
+    ) -> "ArrayPeptideKmerIndex":
+        kmer_index = cls(kmer_length)
+        kmer_index._codes = codes
+        kmer_index._offsets = offsets
+        kmer_index._postings = postings
+        return kmer_index
+
+    @property
+    def codes(self) -> npt.NDArray[np.uint64]:
+        if len(self._pending_codes) > 0:
+            self._merge_pending_entries()
+        return self._codes
+
+    @property
+    def offsets(self) -> npt.NDArray[np.int64]:
+        if len(self._pending_codes) > 0:
+            self._merge_pending_entries()
+        return self._offsets
+
+    @property
+    def postings(self) -> npt.NDArray[np.uint32]:
+        if len(self._pending_codes) > 0:
+            self._merge_pending_entries()
+        return self._postings
+
+    @staticmethod
+    def build_csr_arrays(
+        codes: npt.NDArray[np.uint64], entries: npt.NDArray[np.uint32]
+    ) -> Tuple[npt.NDArray[np.uint64], npt.NDArray[np.int64], npt.NDArray[np.uint32]]:
+        """
+        Groups the given (code, entry) pairs by code.
+        :returns A Tuple (codes, offsets, postings) with the unique sorted codes,
+        the CSR offsets and the entries per code. The entries keep the order
+        in which they were given for each code.
+        :rtype Tuple[npt.NDArray[np.uint64], npt.NDArray[np.int64],
+        npt.NDArray[np.uint32]]
+        """
+        if len(codes) == 0:
+            return (
+                np.empty(0, dtype=np.uint64),
+                np.zeros(1, dtype=np.int64),
+                np.empty(0, dtype=np.uint32),
+            )
+        order = np.argsort(codes, kind="stable")
+        sorted_codes = codes[order]
+        starts = np.concatenate(
+            ([0], np.flatnonzero(sorted_codes[1:] != sorted_codes[:-1]) + 1)
+        ).astype(np.int64)
+        return (
+            sorted_codes[starts],
+            np.append(starts, len(sorted_codes)),
+            entries[order].astype(np.uint32, copy=False),
+        )
+
+    def _merge_pending_entries(self) -> None:
+        existing_codes = np.repeat(self._codes, np.diff(self._offsets))
+        self._codes, self._offsets, self._postings = self.build_csr_arrays(
+            np.concatenate(
+                (existing_codes, np.frombuffer(self._pending_codes, dtype=np.uint64))
+            ),
+            np.concatenate(
+                (
+                    self._postings,
+                    np.array(self._pending_entries, dtype=np.uint32),
+                )
+            ),
+        )
+        self._pending_codes = array("Q")
+        self._pending_entries = array("I")
+        self._cluster_offsets = None
+        self._cluster_postings = None
+
+    def clear(self) -> None:
+        self._codes = np.empty(0, dtype=np.uint64)
+        self._offsets = np.zeros(1, dtype=np.int64)
+        self._postings = np.empty(0, dtype=np.uint32)
+        self._pending_codes = array("Q")
+        self._pending_entries = array("I")
+        self._cluster_offsets = None
+        self._cluster_postings = None
+
+    def build_cluster_postings(self, peptide_to_cluster_mapping: List[int]) -> None:
+        """
+        Precomputes the distinct cluster ids per k-mer, which are then returned
+        by `getEntriesForKmer`. Adding entries to the index afterwards
+        discards the cluster postings.
+        """
+        postings = self.postings
+        kmer_positions = np.repeat(
+            np.arange(len(self._codes), dtype=np.uint64), np.diff(self._offsets)
+        )
+        cluster_ids = np.asarray(peptide_to_cluster_mapping, dtype=np.int64)[postings]
+        # Both ids fit into 32 bits, so that each (k-mer, cluster) pair
+        # can be deduplicated as a single integer
+        unique_pairs = np.unique(
+            (kmer_positions << np.uint64(32)) | cluster_ids.astype(np.uint64)
+        )
+        self._cluster_postings = (unique_pairs & np.uint64(0xFFFFFFFF)).astype(
+            np.uint32
+        )
+        self._cluster_offsets = np.concatenate(
+            (
+                [0],
+                np.cumsum(
+                    np.bincount(
+                        (unique_pairs >> np.uint64(32)).astype(np.int64),
+                        minlength=len(self._codes),
+                    )
+                ),
+            )
+        ).astype(np.int64)
+
+    def has_cluster_postings(self) -> bool:
+        return self._cluster_postings is not None and len(self._pending_codes) == 0
+
+    def _find_position(self, kmer: str) -> int:
+        if len(self._pending_codes) > 0:
+            self._merge_pending_entries()
+        try:
+            code = np.uint64(encode_kmer(kmer))
+        except ValueError:
+            return -1
+        position = int(np.searchsorted(self._codes, code))
+        if position == len(self._codes) or self._codes[position] != code:
+            return -1
+        return position
+
+    def getEntryForKmer(self, kmer: str) -> List[int]:
+        position = self._find_position(kmer)
+        if position < 0:
+            return []
+        return self._postings[
+            self._offsets[position] : self._offsets[position + 1]  # noqa: E203
+        ].tolist()
+
+    def getEntriesForKmer(self, kmer: str) -> Tuple[npt.NDArray[np.uint32], List[int]]:
+        """
+        Returns both the peptide ids and the distinct cluster ids for the given
+        k-mer. Requires the cluster postings to be built beforehand.
+        :returns A Tuple (peptide_ids, cluster_ids), with the peptide ids
+        as a view into the postings array.
+        :rtype Tuple[npt.NDArray[np.uint32], List[int]]
+        """
+        position = self._find_position(kmer)
+        assert self._cluster_offsets is not None and self._cluster_postings is not None
+        if position < 0:
+            return self._postings[0:0], []
+        cluster_start, cluster_end = self._cluster_offsets[
+            position : position + 2  # noqa: E203
+        ]
+        return (
+            self._postings[
+                self._offsets[position] : self._offsets[position + 1]  # noqa: E203
+            ],
+            self._cluster_postings[cluster_start:cluster_end].tolist(),
+        )
+
+    def appendToEntryForKmer(self, kmer: str, entry: int) -> None:
+        try:
+            code = encode_kmer(kmer)
+        except ValueError:
+            return
+        self._pending_codes.append(code)
+        self._pending_entries.append(entry)
+
+    def extendEntryForKmer(self, kmer: str, entry: List[int]) -> None:
+        try:
+            code = encode_kmer(kmer)
+        except ValueError:
+            return
+        self._pending_codes.extend([code] * len(entry))
+        self._pending_entries.extend(entry)
+
+    def removeEntriesForKmers(self, kmers: Iterable[str]) -> None:
+        positions = [self._find_position(kmer) for kmer in kmers]
+        positions = [position for position in positions if position >= 0]
+        if len(positions) == 0:
+            return
+        is_kept_kmer = np.ones(len(self._codes), dtype=np.bool_)
+        is_kept_kmer[positions] = False
+        postings_lengths = np.diff(self._offsets)
+        self._postings = self._postings[np.repeat(is_kept_kmer, postings_lengths)]
+        self._offsets = np.concatenate(
+            ([0], np.cumsum(postings_lengths[is_kept_kmer]))
+        ).astype(np.int64)
+        self._codes = self._codes[is_kept_kmer]
+        self._cluster_offsets = None
+        self._cluster_postings = None
+
+    def merge_index(self, other: IKmerIndex) -> None:
+        if not isinstance(other, ArrayPeptideKmerIndex):
+            postings_lengths = other.get_postings_lengths()
+            for kmer in other.get_kmers_at(range(0, len(postings_lengths))):
+                self.extendEntryForKmer(kmer, list(other.getEntryForKmer(kmer)))
+            return
+        codes, offsets, postings = self.codes, self.offsets, self.postings
+        other_codes, other_offsets = other.codes, other.offsets
+        # Both code arrays are sorted, so each posting is moved to its place
+        # in the merged arrays instead of sorting all postings again
+        merged_codes = np.union1d(codes, other_codes)
+        positions = np.searchsorted(merged_codes, codes)
+        other_positions = np.searchsorted(merged_codes, other_codes)
+        postings_lengths = np.zeros(len(merged_codes), dtype=np.int64)
+        postings_lengths[positions] = np.diff(offsets)
+        merged_postings_lengths = postings_lengths.copy()
+        merged_postings_lengths[other_positions] += np.diff(other_offsets)
+        merged_offsets = np.concatenate(
+            ([0], np.cumsum(merged_postings_lengths))
+        ).astype(np.int64)
+
+        merged_postings = np.empty(merged_offsets[-1], dtype=np.uint32)
+        merged_postings[
+            np.repeat(merged_offsets[positions] - offsets[:-1], np.diff(offsets))
+            + np.arange(len(postings))
+        ] = postings
+        merged_postings[
+            np.repeat(
+                merged_offsets[other_positions]
+                + postings_lengths[other_positions]
+                - other_offsets[:-1],
+                np.diff(other_offsets),
+            )
+            + np.arange(len(other.postings))
+        ] = other.postings
+        self._codes = merged_codes.astype(np.uint64, copy=False)
+        self._offsets = merged_offsets
+        self._postings = merged_postings
+        self._cluster_offsets = None
+        self._cluster_postings = None
+
+    def get_postings_lengths(self) -> npt.NDArray[np.int64]:
+        return np.diff(self.offsets)
+
+    def get_kmers_at(self, positions: Iterable[int]) -> List[str]:
+        codes = self.codes
+        return [
+            decode_kmer(int(codes[position]), self.kmer_length)
+            for position in positions
+        ]
+
+    def get_estimated_memory_usage(self) -> int:
+        index_arrays = [self.codes, self._offsets, self._postings]
+        if self._cluster_offsets is not None and self._cluster_postings is not None:
+            index_arrays.extend([self._cluster_offsets, self._cluster_postings])
+        return sum([index_array.nbytes for index_array in index_arrays])
+
+    def items(self) -> Generator[Tuple[str, List[int]], None, None]:
+        if len(self._pending_codes) > 0:
+            self._merge_pending_entries()
+        for position, code in enumerate(self._codes.tolist()):
+            yield (
+                decode_kmer(code, self.kmer_length),
+                self._postings[
+                    self._offsets[position] : self._offsets[position + 1]  # noqa: E203
+                ].tolist(),
+            )
+
+    def dump_index_to_binary_file(
+        self, filepath: str, peptide_to_cluster_mapping: List[int]
+    ) -> None:
+        """
+        Writes the index together with the given peptide to cluster mapping
+        into a versioned binary file, which can be memory-mapped
+        using `load_index_from_binary_file`.
+        """
+        if len(self._pending_codes) > 0:
+            self._merge_pending_entries()
+        arrays = [
+            self._codes.astype("<u8", copy=False),
+            self._offsets.astype("<i8", copy=False),
+            self._postings.astype("<u4", copy=False),
+            np.asarray(peptide_to_cluster_mapping, dtype="<i4"),
+        ]
+        with open(filepath, "wb") as index_file:
+            index_file.write(
+                _BINARY_INDEX_HEADER.pack(
+                    BINARY_INDEX_MAGIC,
+                    BINARY_INDEX_VERSION,
+                    self.kmer_length,
+                    self.minimizer_window,
+                    self.number_of_peptides,
+                    len(self._codes),
+                    len(self._postings),
+                    len(arrays[3]),
+                ).ljust(_BINARY_INDEX_HEADER_SIZE, b"\x00")
+            )
+            position = _BINARY_INDEX_HEADER_SIZE
+            for index_array in arrays:
+                padding = _get_aligned_offset(position) - position
+                index_file.write(b"\x00" * padding)
+                index_file.write(index_array.tobytes())
+                position += padding + index_array.nbytes
+
+    @classmethod
+    def load_index_from_binary_file(
+        cls, filepath: str
+    ) -> Tuple["ArrayPeptideKmerIndex", npt.NDArray[np.int32]]:
+        """
+        Memory-maps an index file written by `dump_index_to_binary_file`.
+        The arrays are not read into memory, but paged in from the file on access,
+        so that multiple processes using the same file share the page cache.
+        :returns A Tuple (kmer_index, peptide_to_cluster_mapping).
+        :rtype Tuple[ArrayPeptideKmerIndex, npt.NDArray[np.int32]]
+        raises ValueError: Raised if the file is not a binary index file
+        or was written with an unsupported version.
+        """
+        with open(filepath, "rb") as index_file:
+            header = index_file.read(_BINARY_INDEX_HEADER.size)
+        if len(header) < _BINARY_INDEX_HEADER.size or header[0:8] != BINARY_INDEX_MAGIC:
+            error_message = f"{filepath} is not a binary k-mer index file."
+            logging.error(error_message)
+            raise ValueError(error_message)
+        (
+            _,
+            version,
+            kmer_length,
+            minimizer_window,
+            number_of_peptides,
+            number_of_codes,
+            number_of_postings,
+            number_of_mapped_peptides,
+        ) = _BINARY_INDEX_HEADER.unpack(header)
+        if version != BINARY_INDEX_VERSION:
+            error_message = (
+                f"Unsupported version {version} of binary k-mer index file "
+                f"{filepath}. Expected version {BINARY_INDEX_VERSION}."
+            )
+            logging.error(error_message)
+            raise ValueError(error_message)
+
+        mapped_arrays = []
+        position = _BINARY_INDEX_HEADER_SIZE
+        for dtype, length in [
+            ("<u8", number_of_codes),
+            ("<i8", number_of_codes + 1),
+            ("<u4", number_of_postings),
+            ("<i4", number_of_mapped_peptides),
+        ]:
+            position = _get_aligned_offset(position)
+            if length == 0:
+                mapped_arrays.append(np.empty(0, dtype=dtype))
+                continue
+            mapped_arrays.append(
+                np.memmap(
+                    filepath, dtype=dtype, mode="r", offset=position, shape=(length,)
+                )
+            )
+            position += length * np.dtype(dtype).itemsize
+
+        kmer_index = cls.from_csr_arrays(kmer_length, *mapped_arrays[0:3])
+        kmer_index.number_of_peptides = number_of_peptides
+        kmer_index.minimizer_window = max(minimizer_window, 1)
+        return kmer_index, mapped_arrays[3]
@@ -0,0 +1,85 @@
+from collections import Counter
+from typing import Dict, Iterable, List, Set
+
+from pepti_map.peptide_data.peptide_table import PeptideTable
+
+
+class DuplicatePeptideMapping:
+    """
+    Maps each peptide to its canonical peptide, which is the first peptide with
+    the same I/L-normalised sequence. Only canonical peptides need to be indexed
+    and matched, as their duplicates match exactly the same reads. The matches
+    of a canonical peptide are expanded back to the clusters and read counts
+    of its duplicates.
+    Peptides that are not assigned to a cluster are their own canonical peptide.
+    """
+
+    def __init__(
+        self, canonical_peptide_ids: List[int], peptide_to_cluster_mapping: List[int]
+    ):
+        self.canonical_peptide_ids: List[int] = canonical_peptide_ids
+        self._multiplicities: "Counter[int]" = Counter(canonical_peptide_ids)
+        # For each canonical peptide with duplicates, the clusters of all of them
+        self._duplicate_cluster_ids: Dict[int, List[int]] = {}
+        for peptide_id, canonical_peptide_id in enumerate(canonical_peptide_ids):
+            if peptide_id == canonical_peptide_id:
+                continue
+            duplicate_cluster_ids = self._duplicate_cluster_ids.setdefault(
+                canonical_peptide_id,
+                [peptide_to_cluster_mapping[canonical_peptide_id]],
+            )
+            if peptide_to_cluster_mapping[peptide_id] not in duplicate_cluster_ids:
+                duplicate_cluster_ids.append(peptide_to_cluster_mapping[peptide_id])
+
+    @classmethod
+    def from_peptide_table(
+        cls, peptide_table: PeptideTable
+    ) -> "DuplicatePeptideMapping":
+        peptide_to_cluster_mapping = peptide_table.get_peptide_to_cluster_mapping()
+        canonical_peptide_ids: List[int] = []
+        first_peptide_ids: Dict[str, int] = {}
+        for peptide_id, sequence in enumerate(peptide_table.get_normalized_sequences()):
+            if peptide_to_cluster_mapping[peptide_id] < 0:
+                canonical_peptide_ids.append(peptide_id)
+                continue
+            canonical_peptide_ids.append(
+                first_peptide_ids.setdefault(sequence, peptide_id)
+            )
+        return cls(canonical_peptide_ids, peptide_to_cluster_mapping)
+
+    def get_number_of_duplicates(self) -> int:
+        return len(self.canonical_peptide_ids) - len(self._multiplicities)
+
+    def get_multiplicity(self, peptide_id: int) -> int:
+        """
+        Returns the number of peptides with the same sequence as the given one.
+        """
+        return self._multiplicities[self.canonical_peptide_ids[peptide_id]]
+
+    def is_canonical(self, peptide_id: int) -> bool:
+        return self.canonical_peptide_ids[peptide_id] == peptide_id
+
+    def expand_clusters(
+        self, matched_peptides: Iterable[int], matched_clusters: Set[int]
+    ) -> Set[int]:
+        """
+        Adds the clusters of the duplicates of the matched canonical peptides
+        to the matched clusters.
+        """
+        if len(self._duplicate_cluster_ids) == 0:
+            return matched_clusters
+        for matched_peptide in matched_peptides:
+            duplicate_cluster_ids = self._duplicate_cluster_ids.get(matched_peptide)
+            if duplicate_cluster_ids is not None:
+                matched_clusters.update(duplicate_cluster_ids)
+        return matched_clusters
+
+    def expand_peptide_counts(self, peptide_counts: List[int]) -> List[int]:
+        """
+        Returns the given counts per peptide with the count of each duplicate
+        replaced by the count of its canonical peptide.
+        """
+        return [
+            peptide_counts[canonical_peptide_id]
+            for canonical_peptide_id in self.canonical_peptide_ids
+        ]
@@ -0,0 +1,149 @@
+from itertools import islice
+import math
+from typing import Iterable, List, Tuple
+import numpy as np
+import numpy.typing as npt
+
+from pepti_map.peptide_data.kmer_index import IKmerIndex
+
+DEFAULT_FALSE_POSITIVE_RATE = 0.01
+_BITS_PER_BLOCK = 64
+_PATTERN_INDEX_BITS = 12
+_NUMBER_OF_PATTERNS = 1 << _PATTERN_INDEX_BITS
+_HASH_MASK = (1 << 64) - 1
+# Odd constant used to derive the pattern from the high bits of the remixed
+# k-mer hash, independently of the block index (as in Fibonacci hashing)
+_PATTERN_MULTIPLIER = 0x9E3779B97F4A7C15
+# Number of k-mers hashed at once when filling the filter
+_ADD_BATCH_SIZE = 1 << 20
+
+
+class KmerBloomFilter:
+    """
+    Blocked Bloom filter over k-mers: Each k-mer is mapped to a single 64-bit
+    block, in which it sets the bits of one of a fixed set of precomputed
+    patterns. A lookup thereby costs a single hash computation and one word
+    comparison, which is cheaper than a lookup in the k-mer index. The blocks
+    are stored in a uint64 array, so that many k-mers can be checked at once
+    via `might_contain_kmers`.
+    The filter also counts its hits (k-mers that may be contained), misses
+    (k-mers that are certainly not contained) and the false positives
+    registered via `register_false_positive`.
+    Uses Python's string hash, so the filter must not be shared across processes.
+    """
+
+    def __init__(self, number_of_blocks: int, bits_per_kmer: int):
+        self._number_of_blocks: int = max(number_of_blocks, 1)
+        self._blocks: npt.NDArray[np.uint64] = np.zeros(
+            self._number_of_blocks, dtype=np.uint64
+        )
+        self._patterns: npt.NDArray[np.uint64] = np.array(
+            KmerBloomFilter._generate_patterns(
+                min(max(bits_per_kmer, 1), _BITS_PER_BLOCK)
+            ),
+            dtype=np.uint64,
+        )
+        self.number_of_hits: int = 0
+        self.number_of_misses: int = 0
+        self.number_of_false_positives: int = 0
+
+    @staticmethod
+    def _generate_patterns(bits_per_kmer: int) -> List[int]:
+        random_generator = np.random.default_rng(0)
+        patterns = []
+        for _ in range(0, _NUMBER_OF_PATTERNS):
+            pattern = 0
+            for bit in random_generator.choice(
+                _BITS_PER_BLOCK, size=bits_per_kmer, replace=False
+            ).tolist():
+                pattern |= 1 << bit
+            patterns.append(pattern)
+        return patterns
+
+    @classmethod
+    def from_kmers(
+        cls,
+        kmers: Iterable[str],
+        number_of_kmers: int,
+        false_positive_rate: float = DEFAULT_FALSE_POSITIVE_RATE,
+    ) -> "KmerBloomFilter":
+        """
+        Creates a filter sized for the given number of k-mers and the given
+        false positive rate, and adds the k-mers to it.
+        """
+        bits_per_kmer = -math.log(false_positive_rate) / (math.log(2) ** 2)
+        kmer_filter = cls(
+            math.ceil(number_of_kmers * bits_per_kmer / _BITS_PER_BLOCK),
+            round(bits_per_kmer * math.log(2)),
+        )
+        kmer_iterator = iter(kmers)
+        while True:
+            kmer_batch = list(islice(kmer_iterator, _ADD_BATCH_SIZE))
+            if len(kmer_batch) == 0:
+                break
+            kmer_filter.add_kmers(kmer_batch)
+        return kmer_filter
+
+    @classmethod
+    def from_index(
+        cls,
+        kmer_index: IKmerIndex,
+        false_positive_rate: float = DEFAULT_FALSE_POSITIVE_RATE,
+    ) -> "KmerBloomFilter":
+        number_of_kmers = len(kmer_index.get_postings_lengths())
+        return cls.from_kmers(
+            kmer_index.get_kmers_at(range(0, number_of_kmers)),
+            number_of_kmers,
+            false_positive_rate,
+        )
+
+    def _get_blocks_and_patterns(
+        self, kmers: List[str]
+    ) -> Tuple[npt.NDArray[np.uint64], npt.NDArray[np.uint64]]:
+        # Reinterpreting the signed hashes is the same as masking them to 64 bits
+        kmer_hashes = np.fromiter(
+            (hash(kmer) for kmer in kmers), dtype=np.int64, count=len(kmers)
+        ).view(np.uint64)
+        # Multiplying uint64 arrays wraps around, as does the masked product
+        pattern_indexes = (kmer_hashes * np.uint64(_PATTERN_MULTIPLIER)) >> np.uint64(
+            64 - _PATTERN_INDEX_BITS
+        )
+        return (
+            kmer_hashes % np.uint64(self._number_of_blocks),
+            self._patterns[pattern_indexes],
+        )
+
+    def add_kmers(self, kmers: List[str]) -> None:
+        block_indexes, patterns = self._get_blocks_and_patterns(kmers)
+        np.bitwise_or.at(self._blocks, block_indexes, patterns)
+
+    def add(self, kmer: str) -> None:
+        self.add_kmers([kmer])
+
+    def might_contain_kmers(self, kmers: List[str]) -> npt.NDArray[np.bool_]:
+        """
+        Checks all given k-mers against the filter at once.
+        :returns Whether each of the k-mers may be contained in the filter.
+        :rtype npt.NDArray[np.bool_]
+        """
+        block_indexes, patterns = self._get_blocks_and_patterns(kmers)
+        might_contain = self._blocks[block_indexes] & patterns == patterns
+        number_of_hits = int(np.count_nonzero(might_contain))
+        self.number_of_hits += number_of_hits
+        self.number_of_misses += len(kmers) - number_of_hits
+        return might_contain
+
+    def might_contain(self, kmer: str) -> bool:
+        return bool(self.might_contain_kmers([kmer])[0])
+
+    def register_false_positive(self) -> None:
+        self.number_of_false_positives += 1
+
+    def get_size_in_bytes(self) -> int:
+        return self._blocks.nbytes
+
+    def get_report(self) -> str:
+        return (
+            f"{self.number_of_hits} hits, {self.number_of_misses} misses, "
+            f"{self.number_of_false_positives} false positives"
+        )
@@ -0,0 +1,81 @@
+from abc import ABC, abstractmethod
+from typing import Iterable, List, Sequence
+import numpy as np
+import numpy.typing as npt
+
+
+class IKmerIndex(ABC):
+    kmer_length: int
+    # The index only contains the (w,k)-minimizers of each peptide
+    # for a window size w > 1, see `get_minimizers`
+    minimizer_window: int
+    # TODO: Do this in a prettier way
+    number_of_peptides: int
+
+    @abstractmethod
+    def clear(self) -> None:
+        """
+        Removes all entries from the index.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def getEntryForKmer(self, kmer: str) -> Sequence[int]:
+        """
+        Returns the ids of all peptides containing the given k-mer.
+        If the k-mer is not contained in the index, an empty sequence is returned.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def appendToEntryForKmer(self, kmer: str, entry: int) -> None:
+        """
+        Adds the given peptide id to the entry of the given k-mer.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def extendEntryForKmer(self, kmer: str, entry: List[int]) -> None:
+        """
+        Adds all of the given peptide ids to the entry of the given k-mer.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def removeEntriesForKmers(self, kmers: Iterable[str]) -> None:
+        """
+        Removes the given k-mers and their entries from the index.
+        K-mers that are not contained in the index are ignored.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def merge_index(self, other: "IKmerIndex") -> None:
+        """
+        Adds all entries of the other index to this index. For k-mers contained
+        in both indexes, the peptide ids of the other index are placed
+        after the existing ones.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_postings_lengths(self) -> npt.NDArray[np.int64]:
+        """
+        Returns the number of peptide ids stored for each k-mer of the index.
+        The order of the k-mers is the one used by `get_kmers_at`.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_kmers_at(self, positions: Iterable[int]) -> List[str]:
+        """
+        Returns the k-mers at the given positions of `get_postings_lengths`.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_estimated_memory_usage(self) -> int:
+        """
+        Returns the estimated memory used by the index in bytes.
+        """
+        raise NotImplementedError
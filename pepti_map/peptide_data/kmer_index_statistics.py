@@ -0,0 +1,73 @@
+from typing import List, Tuple
+import numpy as np
+import numpy.typing as npt
+
+from pepti_map.peptide_data.kmer_index import IKmerIndex
+
+
+class KmerIndexStatistics:
+    """
+    Summary of the postings lists of a k-mer index. The histogram groups
+    the postings lengths into power-of-two buckets, i.e. bucket i counts
+    the k-mers with between 2^i and 2^(i + 1) - 1 peptide ids.
+    """
+
+    def __init__(
+        self,
+        number_of_kmers: int,
+        total_postings: int,
+        postings_length_histogram: List[int],
+        top_kmers: List[Tuple[str, int]],
+        estimated_memory_usage: int,
+    ):
+        self.number_of_kmers: int = number_of_kmers
+        self.total_postings: int = total_postings
+        self.postings_length_histogram: List[int] = postings_length_histogram
+        self.top_kmers: List[Tuple[str, int]] = top_kmers
+        self.estimated_memory_usage: int = estimated_memory_usage
+
+    @staticmethod
+    def _get_postings_length_histogram(
+        postings_lengths: npt.NDArray[np.int64],
+    ) -> List[int]:
+        postings_lengths = postings_lengths[postings_lengths > 0]
+        if len(postings_lengths) == 0:
+            return []
+        buckets = np.floor(np.log2(postings_lengths)).astype(np.int64)
+        return np.bincount(buckets).tolist()
+
+    @classmethod
+    def from_index(
+        cls, kmer_index: IKmerIndex, number_of_top_kmers: int = 10
+    ) -> "KmerIndexStatistics":
+        postings_lengths = kmer_index.get_postings_lengths()
+        top_positions = np.argsort(-postings_lengths, kind="stable")[
+            0:number_of_top_kmers
+        ].tolist()
+        return cls(
+            len(postings_lengths),
+            int(postings_lengths.sum()),
+            cls._get_postings_length_histogram(postings_lengths),
+            list(
+                zip(
+                    kmer_index.get_kmers_at(top_positions),
+                    postings_lengths[top_positions].tolist(),
+                )
+            ),
+            kmer_index.get_estimated_memory_usage(),
+        )
+
+    def get_report(self) -> str:
+        report_lines = [
+            f"Number of k-mers: {self.number_of_kmers}",
+            f"Total postings: {self.total_postings}",
+            "Estimated memory usage: "
+            f"{self.estimated_memory_usage / (1 << 20):.1f} MiB",
+            "Postings length histogram:",
+        ]
+        for bucket, count in enumerate(self.postings_length_histogram):
+            report_lines.append(f"  {1 << bucket}-{(1 << (bucket + 1)) - 1}: {count}")
+        report_lines.append("K-mers with the longest postings:")
+        for kmer, postings_length in self.top_kmers:
+            report_lines.append(f"  {kmer}: {postings_length}")
+        return "\n".join(report_lines)
@@ -0,0 +1,65 @@
+import json
+from pathlib import Path
+from typing import List
+
+
+class PeptideIndexDelta:
+    """
+    Describes what changed when peptides were appended to an existing index:
+    The appended peptides and clusters, which always form a contiguous range
+    of ids after the existing ones, and all k-mers whose entries changed.
+    Later steps can use it to only recompute results for these peptides,
+    clusters and k-mers.
+    """
+
+    def __init__(
+        self,
+        first_new_peptide_id: int,
+        number_of_new_peptides: int,
+        first_new_cluster_id: int,
+        number_of_new_clusters: int,
+        changed_kmers: List[str],
+        peptide_files: List[str],
+    ):
+        self.first_new_peptide_id: int = first_new_peptide_id
+        self.number_of_new_peptides: int = number_of_new_peptides
+        self.first_new_cluster_id: int = first_new_cluster_id
+        self.number_of_new_clusters: int = number_of_new_clusters
+        self.changed_kmers: List[str] = changed_kmers
+        # The peptide files the appended peptides were imported from
+        self.peptide_files: List[str] = peptide_files
+
+    def get_new_peptide_ids(self) -> range:
+        return range(
+            self.first_new_peptide_id,
+            self.first_new_peptide_id + self.number_of_new_peptides,
+        )
+
+    def get_new_cluster_ids(self) -> range:
+        return range(
+            self.first_new_cluster_id,
+            self.first_new_cluster_id + self.number_of_new_clusters,
+        )
+
+    def combine(self, other: "PeptideIndexDelta") -> "PeptideIndexDelta":
+        """
+        Combines this delta with the delta of a later append to the same index.
+        :rtype PeptideIndexDelta
+        """
+        return PeptideIndexDelta(
+            self.first_new_peptide_id,
+            self.number_of_new_peptides + other.number_of_new_peptides,
+            self.first_new_cluster_id,
+            self.number_of_new_clusters + other.number_of_new_clusters,
+            list(dict.fromkeys(self.changed_kmers + other.changed_kmers)),
+            self.peptide_files + other.peptide_files,
+        )
+
+    def save(self, filepath: Path) -> None:
+        with open(filepath, "wt", encoding="utf-8") as delta_file:
+            json.dump(vars(self), delta_file)
+
+    @classmethod
+    def load(cls, filepath: Path) -> "PeptideIndexDelta":
+        with open(filepath, "rt", encoding="utf-8") as delta_file:
+            return cls(**json.load(delta_file))
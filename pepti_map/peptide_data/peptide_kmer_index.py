@@ -1,12 +1,18 @@
 from collections import defaultdict
 import gzip
-from typing import List
+import sys
+from typing import Iterable, List
+import numpy as np
+import numpy.typing as npt
 
+from pepti_map.peptide_data.kmer_index import IKmerIndex
 
-class PeptideKmerIndex:
+
+class PeptideKmerIndex(IKmerIndex):
     def __init__(self, kmer_length: int = 7):
         self.kmer_index: "defaultdict[str, List[int]]" = defaultdict(list)
         self.kmer_length: int = kmer_length
+        self.minimizer_window: int = 1
         # TODO: Do this in a prettier way
         self.number_of_peptides: int = -1
 
@@ -14,7 +20,8 @@ class PeptideKmerIndex:
         self.kmer_index.clear()
 
     def getEntryForKmer(self, kmer: str) -> List[int]:
-        return self.kmer_index[kmer]
+        # Indexing the defaultdict would insert an empty entry for each missing k-mer
+        return self.kmer_index.get(kmer, [])
 
     def appendToEntryForKmer(self, kmer: str, entry: int) -> None:
         self.kmer_index[kmer].append(entry)
@@ -23,6 +30,34 @@ class PeptideKmerIndex:
     def extendEntryForKmer(self, kmer: str, entry: List[int]) -> None:
         self.kmer_index[kmer].extend(entry)
 
+    def removeEntriesForKmers(self, kmers: Iterable[str]) -> None:
+        for kmer in kmers:
+            self.kmer_index.pop(kmer, None)
+
+    def merge_index(self, other: IKmerIndex) -> None:
+        postings_lengths = other.get_postings_lengths()
+        for kmer in other.get_kmers_at(range(0, len(postings_lengths))):
+            self.kmer_index[kmer].extend(other.getEntryForKmer(kmer))
+
+    def get_postings_lengths(self) -> npt.NDArray[np.int64]:
+        return np.fromiter(
+            (len(entry) for entry in self.kmer_index.values()),
+            dtype=np.int64,
+            count=len(self.kmer_index),
+        )
+
+    def get_kmers_at(self, positions: Iterable[int]) -> List[str]:
+        kmers = list(self.kmer_index.keys())
+        return [kmers[position] for position in positions]
+
+    def get_estimated_memory_usage(self) -> int:
+        # Peptide ids above 256 are separate int objects referenced by the lists
+        memory_usage = sys.getsizeof(self.kmer_index)
+        for kmer, entry in self.kmer_index.items():
+            memory_usage += sys.getsizeof(kmer) + sys.getsizeof(entry)
+            memory_usage += len(entry) * sys.getsizeof(1 << 20)
+        return memory_usage
+
     def dump_index_to_file(self, filepath: str) -> None:
         with gzip.open(filepath, "wt", encoding="utf-8") as index_file:
             index_file.write(f"# n_peptides={self.number_of_peptides}\n")
@@ -0,0 +1,144 @@
+from pathlib import Path
+from typing import List
+import numpy as np
+import numpy.typing as npt
+
+_COLUMN_NAMES = [
+    "sequence_offsets",
+    "sequences",
+    "normalized_sequences",
+    "original_ids",
+    "cluster_ids",
+    "lengths",
+]
+
+
+class PeptideTable:
+    """
+    Column-oriented table of all peptides of a peptide file, in file order.
+    The sequences are stored as one byte buffer each for the original and the
+    I/L-normalised sequences, with the sequence of peptide i stored at
+    `sequences[sequence_offsets[i] : sequence_offsets[i + 1]]`.
+    Peptides that are not assigned to a cluster have a cluster id of -1.
+    The table is persisted as one .npy file per column, so that it can be
+    memory-mapped by all later steps instead of parsing the peptide file again.
+    """
+
+    def __init__(
+        self,
+        sequence_offsets: npt.NDArray[np.int64],
+        sequences: npt.NDArray[np.uint8],
+        normalized_sequences: npt.NDArray[np.uint8],
+        original_ids: npt.NDArray[np.int64],
+        cluster_ids: npt.NDArray[np.int32],
+        lengths: npt.NDArray[np.int32],
+    ):
+        self.sequence_offsets: npt.NDArray[np.int64] = sequence_offsets
+        self.sequences: npt.NDArray[np.uint8] = sequences
+        self.normalized_sequences: npt.NDArray[np.uint8] = normalized_sequences
+        self.original_ids: npt.NDArray[np.int64] = original_ids
+        self.cluster_ids: npt.NDArray[np.int32] = cluster_ids
+        self.lengths: npt.NDArray[np.int32] = lengths
+
+    def __len__(self) -> int:
+        return len(self.lengths)
+
+    @property
+    def number_of_clusters(self) -> int:
+        if len(self.cluster_ids) == 0:
+            return 0
+        return max(int(self.cluster_ids.max()) + 1, 0)
+
+    def append(self, other: "PeptideTable") -> "PeptideTable":
+        """
+        Creates a new table with the peptides of the other table appended to
+        the ones of this table. The appended peptides get new peptide ids and
+        new clusters, i.e. their cluster ids are offset by `number_of_clusters`.
+        :rtype PeptideTable
+        """
+        other_cluster_ids = np.asarray(other.cluster_ids)
+        return PeptideTable(
+            np.concatenate(
+                (
+                    self.sequence_offsets[:-1],
+                    np.asarray(other.sequence_offsets) + self.sequence_offsets[-1],
+                )
+            ),
+            np.concatenate((self.sequences, other.sequences)),
+            np.concatenate((self.normalized_sequences, other.normalized_sequences)),
+            np.concatenate((self.original_ids, other.original_ids)),
+            np.concatenate(
+                (
+                    self.cluster_ids,
+                    np.where(
+                        other_cluster_ids >= 0,
+                        other_cluster_ids + self.number_of_clusters,
+                        -1,
+                    ).astype(np.int32),
+                )
+            ),
+            np.concatenate((self.lengths, other.lengths)),
+        )
+
+    def save(self, dirpath: Path) -> None:
+        dirpath.mkdir(parents=True, exist_ok=True)
+        for column_name in _COLUMN_NAMES:
+            np.save(dirpath / f"{column_name}.npy", getattr(self, column_name))
+
+    @classmethod
+    def load(cls, dirpath: Path) -> "PeptideTable":
+        """
+        Memory-maps a table written by `save`.
+        raises FileNotFoundError: Raised if a column of the table is missing.
+        """
+        return cls(
+            *[
+                np.load(dirpath / f"{column_name}.npy", mmap_mode="r")
+                for column_name in _COLUMN_NAMES
+            ]
+        )
+
+    @staticmethod
+    def exists(dirpath: Path) -> bool:
+        return all(
+            [
+                (dirpath / f"{column_name}.npy").is_file()
+                for column_name in _COLUMN_NAMES
+            ]
+        )
+
+    def _decode_sequences(self, sequence_buffer: npt.NDArray[np.uint8]) -> List[str]:
+        offsets = self.sequence_offsets.tolist()
+        if np.any(sequence_buffer >= 128):
+            # Byte offsets only match string offsets for ASCII
+            return [
+                sequence_buffer[offsets[index] : offsets[index + 1]]  # noqa: E203
+                .tobytes()
+                .decode("utf-8")
+                for index in range(0, len(self))
+            ]
+        all_sequences = sequence_buffer.tobytes().decode("ascii")
+        return [
+            all_sequences[offsets[index] : offsets[index + 1]]  # noqa: E203
+            for index in range(0, len(self))
+        ]
+
+    def get_sequence(self, peptide_id: int) -> str:
+        return (
+            self.sequences[
+                self.sequence_offsets[peptide_id] : self.sequence_offsets[  # noqa: E203
+                    peptide_id + 1
+                ]
+            ]
+            .tobytes()
+            .decode("utf-8")
+        )
+
+    def get_sequences(self) -> List[str]:
+        return self._decode_sequences(self.sequences)
+
+    def get_normalized_sequences(self) -> List[str]:
+        return self._decode_sequences(self.normalized_sequences)
+
+    def get_peptide_to_cluster_mapping(self) -> List[int]:
+        return self.cluster_ids.tolist()
@@ -1,9 +1,15 @@
 from collections import defaultdict
 from pathlib import Path
+import numpy as np
+import pytest
 from pepti_map.importing.peptide_import.testdata_peptide_importer import (
+    EXPECTED_PEPTIDE_MAPPING,
     EXPECTED_RESULT_INDEX,
 )
+from pepti_map.peptide_data.array_peptide_kmer_index import ArrayPeptideKmerIndex
+from pepti_map.peptide_data.kmer_bloom_filter import KmerBloomFilter
 from pepti_map.peptide_data.peptide_kmer_index import PeptideKmerIndex
+from pepti_map.util.k_mer import encode_kmers_of_sequences, split_into_kmer
 
 
 class TestPeptideKmerIndex:
@@ -21,3 +27,174 @@ class TestPeptideKmerIndex:
         new_kmer_index = PeptideKmerIndex.load_index_from_file(filepath)
         assert new_kmer_index.kmer_index == EXPECTED_RESULT_INDEX
         assert new_kmer_index.number_of_peptides == 10
+
+    def test_lookup_of_missing_kmer_does_not_grow_index(self):
+        kmer_index = PeptideKmerIndex()
+        kmer_index.kmer_index = defaultdict(list, EXPECTED_RESULT_INDEX.copy())
+        assert kmer_index.getEntryForKmer("AAAAAAA") == []
+        assert "AAAAAAA" not in kmer_index.kmer_index
+
+
+class TestArrayPeptideKmerIndex:
+    def test_entries_match_dict_index(self):
+        kmer_index = ArrayPeptideKmerIndex()
+        for kmer, entry in EXPECTED_RESULT_INDEX.items():
+            kmer_index.extendEntryForKmer(kmer, entry)
+
+        for kmer, entry in EXPECTED_RESULT_INDEX.items():
+            assert kmer_index.getEntryForKmer(kmer) == entry
+        assert dict(kmer_index.items()) == EXPECTED_RESULT_INDEX
+
+    def test_missing_kmer(self):
+        kmer_index = ArrayPeptideKmerIndex()
+        kmer_index.appendToEntryForKmer("NCYQKAQ", 1)
+        assert kmer_index.getEntryForKmer("AAAAAAA") == []
+        assert kmer_index.getEntryForKmer("NCYQ*AQ") == []
+        assert len(kmer_index.codes) == 1
+
+    def test_appending_after_lookup_keeps_insertion_order(self):
+        kmer_index = ArrayPeptideKmerIndex()
+        kmer_index.appendToEntryForKmer("NCYQKAQ", 3)
+        kmer_index.appendToEntryForKmer("CYQKAQH", 1)
+        assert kmer_index.getEntryForKmer("NCYQKAQ") == [3]
+        kmer_index.appendToEntryForKmer("NCYQKAQ", 0)
+        assert kmer_index.getEntryForKmer("NCYQKAQ") == [3, 0]
+        assert kmer_index.getEntryForKmer("CYQKAQH") == [1]
+
+    def test_cluster_postings(self):
+        kmer_index = ArrayPeptideKmerIndex()
+        kmer_index.extendEntryForKmer("NCYQKAQ", [1, 4, 2])
+        kmer_index.extendEntryForKmer("CYQKAQH", [3])
+        kmer_index.build_cluster_postings([-1, 0, 1, 1, 0])
+        assert kmer_index.has_cluster_postings()
+
+        peptide_ids, cluster_ids = kmer_index.getEntriesForKmer("NCYQKAQ")
+        assert peptide_ids.tolist() == [1, 4, 2]
+        assert cluster_ids == [0, 1]
+        peptide_ids, cluster_ids = kmer_index.getEntriesForKmer("CYQKAQH")
+        assert peptide_ids.tolist() == [3]
+        assert cluster_ids == [1]
+        peptide_ids, cluster_ids = kmer_index.getEntriesForKmer("AAAAAAA")
+        assert peptide_ids.tolist() == []
+        assert cluster_ids == []
+
+        kmer_index.appendToEntryForKmer("AAAAAAA", 1)
+        kmer_index.getEntryForKmer("AAAAAAA")
+        assert not kmer_index.has_cluster_postings()
+
+    def test_dump_and_load_binary_index_file(self, tmp_path):
+        kmer_index = ArrayPeptideKmerIndex()
+        for kmer, entry in EXPECTED_RESULT_INDEX.items():
+            kmer_index.extendEntryForKmer(kmer, entry)
+        kmer_index.number_of_peptides = 7
+        kmer_index.minimizer_window = 3
+        filepath = (tmp_path / "index.bin").as_posix()
+        kmer_index.dump_index_to_binary_file(filepath, EXPECTED_PEPTIDE_MAPPING)
+
+        (
+            new_kmer_index,
+            peptide_to_cluster_mapping,
+        ) = ArrayPeptideKmerIndex.load_index_from_binary_file(filepath)
+        assert isinstance(new_kmer_index.postings, np.memmap)
+        assert new_kmer_index.kmer_length == 7
+        assert new_kmer_index.number_of_peptides == 7
+        assert new_kmer_index.minimizer_window == 3
+        assert dict(new_kmer_index.items()) == EXPECTED_RESULT_INDEX
+        assert peptide_to_cluster_mapping.tolist() == EXPECTED_PEPTIDE_MAPPING
+
+    def test_load_binary_index_rejects_other_files(self, tmp_path):
+        filepath = tmp_path / "index.txt"
+        with open(filepath, "wt", encoding="utf-8") as index_file:
+            index_file.write("# n_peptides=10\n")
+        with pytest.raises(ValueError):
+            ArrayPeptideKmerIndex.load_index_from_binary_file(filepath.as_posix())
+
+    def test_raises_error_for_too_long_kmers(self):
+        with pytest.raises(ValueError):
+            ArrayPeptideKmerIndex(13)
+
+    def test_residues_outside_alphabet_match_dict_index(self):
+        peptides = ["PEPTXDEKR", "ACDm(ox)EFGHK", "LLVQ*RSTAWY", "GGSA-LPKVVX", "Xqrst"]
+        dict_index = PeptideKmerIndex(4)
+        array_index = ArrayPeptideKmerIndex(4)
+        for peptide_index, peptide in enumerate(peptides):
+            for kmer, _ in split_into_kmer(peptide, 4):
+                dict_index.appendToEntryForKmer(kmer, peptide_index)
+                array_index.appendToEntryForKmer(kmer, peptide_index)
+        codes, peptide_indexes = encode_kmers_of_sequences(
+            np.frombuffer("".join(peptides).encode("ascii"), dtype=np.uint8),
+            np.array([len(peptide) for peptide in peptides], dtype=np.int64),
+            4,
+        )
+        vectorized_array_index = ArrayPeptideKmerIndex.from_csr_arrays(
+            4,
+            *ArrayPeptideKmerIndex.build_csr_arrays(
+                codes, peptide_indexes.astype(np.uint32)
+            ),
+        )
+        # K-mers with other characters than A-Z are never part of a translation
+        expected_index = {
+            kmer: entry
+            for kmer, entry in dict_index.kmer_index.items()
+            if all("A" <= amino_acid <= "Z" for amino_acid in kmer)
+        }
+        assert len(expected_index) < len(dict_index.kmer_index)
+        assert dict(array_index.items()) == expected_index
+        assert dict(vectorized_array_index.items()) == expected_index
+        for kmer in dict_index.kmer_index.keys():
+            assert array_index.getEntryForKmer(kmer) == expected_index.get(kmer, [])
+
+
+class TestMergeIndex:
+    @pytest.mark.parametrize("index_type", ["dict", "array"])
+    def test_merge_index(self, index_type):
+        kmer_index = (
+            PeptideKmerIndex() if index_type == "dict" else ArrayPeptideKmerIndex()
+        )
+        other_kmer_index = ArrayPeptideKmerIndex()
+        expected_index = {}
+        for kmer_number, (kmer, entry) in enumerate(EXPECTED_RESULT_INDEX.items()):
+            # Every k-mer is either only contained in one of the indexes or in both
+            if kmer_number % 3 != 0:
+                kmer_index.extendEntryForKmer(kmer, entry)
+            if kmer_number % 3 != 1:
+                other_kmer_index.extendEntryForKmer(kmer, [10, 12])
+            expected_index[kmer] = (entry if kmer_number % 3 != 0 else []) + (
+                [10, 12] if kmer_number % 3 != 1 else []
+            )
+        kmer_index.merge_index(other_kmer_index)
+        assert len(kmer_index.get_postings_lengths()) == len(expected_index)
+        for kmer, expected_entry in expected_index.items():
+            assert list(kmer_index.getEntryForKmer(kmer)) == expected_entry
+
+
+class TestKmerBloomFilter:
+    def test_contains_all_kmers_of_index(self):
+        kmer_index = PeptideKmerIndex()
+        kmer_index.kmer_index = defaultdict(list, EXPECTED_RESULT_INDEX.copy())
+        kmer_filter = KmerBloomFilter.from_index(kmer_index)
+        for kmer in EXPECTED_RESULT_INDEX.keys():
+            assert kmer_filter.might_contain(kmer)
+        assert kmer_filter.number_of_hits == len(EXPECTED_RESULT_INDEX)
+        assert kmer_filter.number_of_misses == 0
+
+    def test_false_positive_rate(self):
+        kmers = [f"{kmer_number:07d}" for kmer_number in range(0, 10000)]
+        kmer_filter = KmerBloomFilter.from_kmers(kmers, len(kmers), 0.01)
+        for kmer_number in range(10000, 30000):
+            kmer_filter.might_contain(f"{kmer_number:07d}")
+        assert kmer_filter.number_of_hits + kmer_filter.number_of_misses == 20000
+        assert kmer_filter.number_of_hits < 20000 * 0.03
+
+    def test_batch_lookup_equals_single_lookups(self):
+        kmers = [f"{kmer_number:07d}" for kmer_number in range(0, 1000)]
+        kmer_filter = KmerBloomFilter.from_kmers(kmers, len(kmers), 0.1)
+        assert kmer_filter.get_size_in_bytes() == kmer_filter._blocks.nbytes
+        queried_kmers = [f"{kmer_number:07d}" for kmer_number in range(500, 5000)]
+        might_contain = kmer_filter.might_contain_kmers(queried_kmers)
+        assert might_contain.tolist() == [
+            kmer_filter.might_contain(kmer) for kmer in queried_kmers
+        ]
+        assert np.all(might_contain[0:500])
+        assert kmer_filter.number_of_hits == 2 * int(np.count_nonzero(might_contain))
+        assert kmer_filter.number_of_misses == 2 * 4500 - kmer_filter.number_of_hits
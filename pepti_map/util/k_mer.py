@@ -1,4 +1,14 @@
-from typing import Generator, Tuple
+from typing import Dict, Generator, List, Tuple
+import zlib
+import numpy as np
+import numpy.typing as npt
+
+# Each amino acid (one letter code, A-Z) is packed into 5 bits,
+# so that k-mers up to a length of 12 fit into a single uint64
+BITS_PER_AMINO_ACID = 5
+MAX_ENCODABLE_KMER_LENGTH = 12
+_AMINO_ACID_MASK = (1 << BITS_PER_AMINO_ACID) - 1
+_AMINO_ACID_CODES = {chr(ascii_code): ascii_code - 64 for ascii_code in range(65, 91)}
 
 
 def split_into_kmer(
@@ -9,3 +19,109 @@ def split_into_kmer(
         if "*" in kmer:
             continue
         yield (kmer, i)
+
+
+def get_minimizers(
+    sequence: str, kmer_length: int = 7, window_size: int = 1
+) -> List[str]:
+    """
+    Returns the (w,k)-minimizers of the given sequence, i.e. for each window
+    of `window_size` consecutive k-mers the smallest k-mer, ordered by the
+    CRC32 checksum of the k-mer. Stop codons are treated like sequence ends.
+    Sequences with less than `window_size` k-mers are handled as one window.
+    With a window size of 1, all k-mers are returned.
+    :returns The distinct minimizers, in the order of their first occurrence.
+    :rtype List[str]
+    """
+    minimizers: Dict[str, None] = {}
+    for segment in sequence.split("*"):
+        kmers = [
+            segment[i : i + kmer_length]  # noqa: E203
+            for i in range(0, len(segment) - kmer_length + 1)
+        ]
+        if len(kmers) == 0:
+            continue
+        if window_size == 1:
+            minimizers.update(dict.fromkeys(kmers))
+            continue
+        kmer_hashes = [zlib.crc32(kmer.encode("ascii")) for kmer in kmers]
+        for window_start in range(0, max(len(kmers) - window_size, 0) + 1):
+            window_hashes = kmer_hashes[
+                window_start : window_start + window_size  # noqa: E203
+            ]
+            minimizers[
+                kmers[window_start + window_hashes.index(min(window_hashes))]
+            ] = None
+    return list(minimizers.keys())
+
+
+def encode_kmer(kmer: str) -> int:
+    """
+    Packs the given amino acid k-mer into a single integer code,
+    using 5 bits per amino acid.
+    :param str kmer: The k-mer to encode. May only contain the letters A-Z
+    and must not be longer than MAX_ENCODABLE_KMER_LENGTH.
+    :returns The integer code of the k-mer.
+    :rtype int
+    raises ValueError: Raised if the k-mer contains a character other than A-Z.
+    """
+    code = 0
+    try:
+        for amino_acid in kmer:
+            code = (code << BITS_PER_AMINO_ACID) | _AMINO_ACID_CODES[amino_acid]
+    except KeyError:
+        raise ValueError(f"Cannot encode k-mer {kmer}: Unexpected character.")
+    return code
+
+
+def decode_kmer(code: int, kmer_length: int) -> str:
+    """
+    Reverses encode_kmer for a k-mer of the given length.
+    """
+    amino_acids = []
+    for _ in range(kmer_length):
+        amino_acids.append(chr((code & _AMINO_ACID_MASK) + 64))
+        code >>= BITS_PER_AMINO_ACID
+    return "".join(reversed(amino_acids))
+
+
+def encode_kmers_of_sequences(
+    concatenated_sequences: npt.NDArray[np.uint8],
+    sequence_lengths: npt.NDArray[np.int64],
+    kmer_length: int = 7,
+) -> Tuple[npt.NDArray[np.uint64], npt.NDArray[np.int64]]:
+    """
+    Vectorized equivalent of calling split_into_kmer and encode_kmer
+    for each of the given sequences.
+    :param npt.NDArray[np.uint8] concatenated_sequences: The ASCII codes of all
+    sequences, concatenated without separator.
+    :param npt.NDArray[np.int64] sequence_lengths: The length of each sequence.
+    :param int kmer_length: The length of the k-mers.
+    :returns A Tuple (codes, sequence_indexes), containing the codes of all
+    k-mers consisting only of the letters A-Z and the index of the sequence each
+    k-mer belongs to. The k-mers are ordered by sequence and position.
+    :rtype Tuple[npt.NDArray[np.uint64], npt.NDArray[np.int64]]
+    """
+    number_of_windows = len(concatenated_sequences) - kmer_length + 1
+    if number_of_windows <= 0:
+        return np.empty(0, dtype=np.uint64), np.empty(0, dtype=np.int64)
+
+    # Other characters, e.g. lowercase letters, are skipped like stop codons,
+    # as they cannot be part of a translated read either
+    is_stop = (concatenated_sequences < 65) | (concatenated_sequences > 90)
+    values = np.where(is_stop, 0, concatenated_sequences.astype(np.uint64) - 64)
+    codes = np.zeros(number_of_windows, dtype=np.uint64)
+    for position in range(kmer_length):
+        codes = (codes << np.uint64(BITS_PER_AMINO_ACID)) | values[
+            position : position + number_of_windows  # noqa: E203
+        ].astype(np.uint64)
+
+    sequence_ends = np.cumsum(sequence_lengths)
+    sequence_indexes = np.repeat(np.arange(len(sequence_lengths)), sequence_lengths)[
+        0:number_of_windows
+    ]
+    stop_counts = np.concatenate(([0], np.cumsum(is_stop)))
+    is_valid = (
+        np.arange(number_of_windows) + kmer_length <= sequence_ends[sequence_indexes]
+    ) & (stop_counts[kmer_length:] == stop_counts[0:number_of_windows])
+    return codes[is_valid], sequence_indexes[is_valid]
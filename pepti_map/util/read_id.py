@@ -0,0 +1,81 @@
+from typing import Dict, List, Tuple
+import numpy as np
+import numpy.typing as npt
+
+# A read id packs the lane (i.e. pair of RNA-seq files), the 0-based index of
+# the record in its file and the mate (0 for the first, 1 for the second file)
+# into a single uint64: lane << 48 | record_index << 1 | mate
+READ_ID_DTYPE = np.uint64
+LANE_SHIFT = 48
+MAX_NUMBER_OF_LANES = 1 << (64 - LANE_SHIFT)
+MAX_NUMBER_OF_RECORDS = 1 << (LANE_SHIFT - 1)
+_RECORD_INDEX_MASK = MAX_NUMBER_OF_RECORDS - 1
+
+
+def encode_read_id(record_index: int, mate: int, lane: int = 0) -> int:
+    return (lane << LANE_SHIFT) | (record_index << 1) | mate
+
+
+def decode_read_id(read_id: int) -> Tuple[int, int, int]:
+    """
+    :returns A Tuple (lane, record_index, mate).
+    :rtype Tuple[int, int, int]
+    """
+    return read_id >> LANE_SHIFT, (read_id >> 1) & _RECORD_INDEX_MASK, read_id & 1
+
+
+def encode_read_ids(
+    first_record_index: int, number_of_records: int, mate: int, lane: int = 0
+) -> npt.NDArray[np.uint64]:
+    """
+    Vectorized equivalent of encode_read_id for consecutive records of a file.
+    """
+    return encode_read_ids_of_records(
+        np.arange(
+            first_record_index,
+            first_record_index + number_of_records,
+            dtype=READ_ID_DTYPE,
+        ),
+        mate,
+        lane,
+    )
+
+
+def encode_read_ids_of_records(
+    record_indexes: npt.NDArray[np.uint64], mate: int, lane: int = 0
+) -> npt.NDArray[np.uint64]:
+    """
+    Vectorized equivalent of encode_read_id for the given records of a file.
+    """
+    return (
+        np.asarray(record_indexes, dtype=READ_ID_DTYPE) << READ_ID_DTYPE(1)
+    ) | READ_ID_DTYPE((lane << LANE_SHIFT) | mate)
+
+
+def decode_read_ids(
+    read_ids: npt.NDArray[np.uint64],
+) -> Tuple[npt.NDArray[np.uint64], npt.NDArray[np.uint64], npt.NDArray[np.uint64]]:
+    """
+    Vectorized equivalent of decode_read_id.
+    :returns A Tuple (lanes, record_indexes, mates).
+    :rtype Tuple[npt.NDArray[np.uint64], npt.NDArray[np.uint64],
+    npt.NDArray[np.uint64]]
+    """
+    read_ids = np.asarray(read_ids, dtype=READ_ID_DTYPE)
+    return (
+        read_ids >> READ_ID_DTYPE(LANE_SHIFT),
+        (read_ids >> READ_ID_DTYPE(1)) & READ_ID_DTYPE(_RECORD_INDEX_MASK),
+        read_ids & READ_ID_DTYPE(1),
+    )
+
+
+def split_read_ids_by_lane(read_ids: List[int]) -> Dict[int, List[int]]:
+    """
+    :returns The given read ids grouped by their lane, in ascending lane order
+    and with the order of the read ids of each lane kept.
+    :rtype Dict[int, List[int]]
+    """
+    read_ids_per_lane: Dict[int, List[int]] = {}
+    for read_id in read_ids:
+        read_ids_per_lane.setdefault(read_id >> LANE_SHIFT, []).append(read_id)
+    return dict(sorted(read_ids_per_lane.items()))
@@ -1,5 +1,24 @@
-from pepti_map.util.k_mer import split_into_kmer
-from pepti_map.util.three_frame_translation import get_three_frame_translations
+import numpy as np
+import pytest
+from pepti_map.util.k_mer import (
+    decode_kmer,
+    encode_kmer,
+    get_minimizers,
+    split_into_kmer,
+)
+from pepti_map.util.read_id import (
+    MAX_NUMBER_OF_RECORDS,
+    decode_read_id,
+    decode_read_ids,
+    encode_read_id,
+    encode_read_ids,
+    split_read_ids_by_lane,
+)
+from pepti_map.util.three_frame_translation import (
+    decode_translations,
+    get_three_frame_translations,
+    get_three_frame_translations_of_batch,
+)
 
 
 class TestThreeFrameTranslation:
@@ -8,6 +27,28 @@ class TestThreeFrameTranslation:
         expected_result = [("MSDGT*", 0), ("CPTGLD", 1), ("VRRDL", 2)]
         assert list(get_three_frame_translations(test_sequence)) == expected_result
 
+    def test_three_frame_translation_of_batch(self):
+        test_sequences = [
+            "ATGTCCGACGGGACTTGAC",
+            "atgtcNgacRggactTga",
+            "AUGUC",
+            "A",
+            "",
+        ]
+        sequence_matrix = np.zeros((len(test_sequences), 19), dtype=np.uint8)
+        for row_index, sequence in enumerate(test_sequences):
+            sequence_matrix[row_index, 0 : len(sequence)] = np.frombuffer(  # noqa: E203
+                sequence.encode("ascii"), dtype=np.uint8
+            )
+        translations = get_three_frame_translations_of_batch(
+            sequence_matrix, np.array([len(sequence) for sequence in test_sequences])
+        )
+        for frame, (translation_matrix, translation_lengths) in enumerate(translations):
+            assert decode_translations(translation_matrix, translation_lengths) == [
+                list(get_three_frame_translations(sequence))[frame][0]
+                for sequence in test_sequences
+            ]
+
 
 class TestKmerSplitting:
     def test_split_into_kmers(self):
@@ -38,3 +79,86 @@ class TestKmerSplitting:
             ("SARFFG", 11),
         ]
         assert list(split_into_kmer(test_sequence, 6)) == expected_result
+
+
+class TestMinimizers:
+    def test_window_size_one_returns_all_kmers(self):
+        test_sequence = "ACNVMILCLF*SARFFG*VLP"
+        assert get_minimizers(test_sequence, 6, 1) == [
+            kmer[0] for kmer in split_into_kmer(test_sequence, 6)
+        ]
+
+    def test_each_window_contains_a_minimizer(self):
+        test_sequence = "WHQVRNWCKHVEIEQCLECVSARFFGVLPACNVMILCLF"
+        minimizers = get_minimizers(test_sequence, 5, 4)
+        kmers = [kmer[0] for kmer in split_into_kmer(test_sequence, 5)]
+        assert len(minimizers) < len(kmers)
+        for window_start in range(0, len(kmers) - 3):
+            assert any(
+                [
+                    kmer in minimizers
+                    for kmer in kmers[window_start : window_start + 4]  # noqa: E203
+                ]
+            )
+
+    def test_contained_sequences_share_minimizers(self):
+        peptide = "EIEQCLECVSARF"
+        read_translation = "WHQVRNWCKHV" + peptide + "FGVLP*ACNVM"
+        assert len(get_minimizers(peptide, 5, 4)) > 0
+        assert set(get_minimizers(peptide, 5, 4)) & set(
+            get_minimizers(read_translation, 5, 4)
+        )
+
+    def test_short_sequence_has_one_minimizer(self):
+        assert len(get_minimizers("WHQVRNW", 5, 4)) == 1
+        assert get_minimizers("WHQ*RNW", 5, 4) == []
+
+
+class TestKmerEncoding:
+    def test_encode_and_decode_kmer(self):
+        assert encode_kmer("A") == 1
+        assert encode_kmer("AC") == (1 << 5) | 3
+        assert decode_kmer(encode_kmer("WHQVRNWCKHVE"), 12) == "WHQVRNWCKHVE"
+
+    def test_encoding_keeps_order(self):
+        kmers = ["AAAAAAA", "AAAAAAC", "NCYQKAQ", "YCYRSED", "ZZZZZZZ"]
+        assert sorted(kmers, key=encode_kmer) == kmers
+
+    def test_encode_invalid_kmer(self):
+        with pytest.raises(ValueError):
+            encode_kmer("ACNV*IL")
+
+
+class TestReadIds:
+    def test_encode_and_decode_read_id(self):
+        assert encode_read_id(0, 0) == 0
+        assert encode_read_id(0, 1) == 1
+        assert encode_read_id(4, 1) == 9
+        for read_id in [(0, 0, 0), (3, 12345, 1), (7, MAX_NUMBER_OF_RECORDS - 1, 1)]:
+            assert decode_read_id(
+                encode_read_id(read_id[1], read_id[2], read_id[0])
+            ) == (read_id)
+
+    def test_encode_and_decode_read_ids(self):
+        read_ids = encode_read_ids(5, 4, 1, 2)
+        assert read_ids.dtype == np.uint64
+        assert read_ids.tolist() == [
+            encode_read_id(record_index, 1, 2) for record_index in range(5, 9)
+        ]
+        lanes, record_indexes, mates = decode_read_ids(read_ids)
+        assert lanes.tolist() == [2, 2, 2, 2]
+        assert record_indexes.tolist() == [5, 6, 7, 8]
+        assert mates.tolist() == [1, 1, 1, 1]
+
+    def test_split_read_ids_by_lane(self):
+        read_ids = [
+            encode_read_id(3, 0, 2),
+            encode_read_id(1, 1, 0),
+            encode_read_id(2, 1, 2),
+            encode_read_id(0, 0, 0),
+        ]
+        assert split_read_ids_by_lane(read_ids) == {
+            0: [read_ids[1], read_ids[3]],
+            2: [read_ids[0], read_ids[2]],
+        }
+        assert list(split_read_ids_by_lane(read_ids).keys()) == [0, 2]
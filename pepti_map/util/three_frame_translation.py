@@ -1,5 +1,8 @@
-from typing import Generator, Tuple
+from functools import lru_cache
+from typing import Generator, List, Tuple
 from Bio.Seq import translate
+import numpy as np
+import numpy.typing as npt
 
 
 def translate_for_frame(sequence: str, frame: int, replace_isoleucine=True) -> str:
@@ -30,3 +33,102 @@ def get_three_frame_translations(
     """
     for i in range(3):
         yield (translate_for_frame(sequence, i, replace_isoleucine), i)
+
+
+# Nucleotide codes a codon may consist of, with all other characters treated as N
+_NUCLEOTIDE_CODES = "ACGTMRWSYKVHDBN"
+_NUCLEOTIDE_INDEXES = np.full(256, _NUCLEOTIDE_CODES.index("N"), dtype=np.uint16)
+for _index, _nucleotide in enumerate(_NUCLEOTIDE_CODES):
+    _NUCLEOTIDE_INDEXES[ord(_nucleotide)] = _index
+    _NUCLEOTIDE_INDEXES[ord(_nucleotide.lower())] = _index
+_NUCLEOTIDE_INDEXES[ord("U")] = _NUCLEOTIDE_INDEXES[ord("u")] = 3
+
+
+@lru_cache(maxsize=2)
+def _get_codon_table(replace_isoleucine: bool) -> npt.NDArray[np.uint8]:
+    """
+    Returns the ASCII code of the amino acid of each codon, indexed by
+    the indexes of its nucleotides in _NUCLEOTIDE_CODES.
+    """
+    codons = [
+        first + second + third
+        for first in _NUCLEOTIDE_CODES
+        for second in _NUCLEOTIDE_CODES
+        for third in _NUCLEOTIDE_CODES
+    ]
+    amino_acids = str(translate("".join(codons)))
+    if replace_isoleucine:
+        amino_acids = amino_acids.replace("I", "L")
+    codon_table = np.zeros(16**3, dtype=np.uint8)
+    codon_indexes = np.array(
+        [
+            (first * 16 + second) * 16 + third
+            for first in range(len(_NUCLEOTIDE_CODES))
+            for second in range(len(_NUCLEOTIDE_CODES))
+            for third in range(len(_NUCLEOTIDE_CODES))
+        ]
+    )
+    codon_table[codon_indexes] = np.frombuffer(amino_acids.encode("ascii"), np.uint8)
+    return codon_table
+
+
+def translate_batch_for_frame(
+    sequence_matrix: npt.NDArray[np.uint8],
+    lengths: npt.NDArray[np.int32],
+    frame: int,
+    replace_isoleucine=True,
+) -> Tuple[npt.NDArray[np.uint8], npt.NDArray[np.int32]]:
+    """
+    Vectorized equivalent of calling translate_for_frame for each row
+    of the given matrix of nucleic acid sequences.
+    :param npt.NDArray[np.uint8] sequence_matrix: The ASCII codes of the
+    sequences, one sequence per row, padded at the end.
+    :param npt.NDArray[np.int32] lengths: The length of each sequence.
+    :returns A Tuple (translation_matrix, translation_lengths) with the ASCII
+    codes of the amino acid sequences, one translation per row.
+    :rtype Tuple[npt.NDArray[np.uint8], npt.NDArray[np.int32]]
+    """
+    nucleotide_indexes = _NUCLEOTIDE_INDEXES[sequence_matrix[:, frame:]]
+    number_of_codons = nucleotide_indexes.shape[1] // 3
+    codon_indexes = (
+        (nucleotide_indexes[:, 0 : 3 * number_of_codons : 3] << 8)  # noqa: E203
+        | (nucleotide_indexes[:, 1 : 3 * number_of_codons : 3] << 4)  # noqa: E203
+        | nucleotide_indexes[:, 2 : 3 * number_of_codons : 3]  # noqa: E203
+    )
+    return (
+        _get_codon_table(replace_isoleucine)[codon_indexes],
+        (np.maximum(lengths - frame, 0) // 3).astype(np.int32),
+    )
+
+
+def get_three_frame_translations_of_batch(
+    sequence_matrix: npt.NDArray[np.uint8],
+    lengths: npt.NDArray[np.int32],
+    replace_isoleucine=True,
+) -> List[Tuple[npt.NDArray[np.uint8], npt.NDArray[np.int32]]]:
+    """
+    Performs a 3-frame translation of all sequences of the given matrix at once.
+    :returns A List with a Tuple (translation_matrix, translation_lengths)
+    for each frame, see translate_batch_for_frame.
+    :rtype List[Tuple[npt.NDArray[np.uint8], npt.NDArray[np.int32]]]
+    """
+    return [
+        translate_batch_for_frame(sequence_matrix, lengths, frame, replace_isoleucine)
+        for frame in range(3)
+    ]
+
+
+def decode_translations(
+    translation_matrix: npt.NDArray[np.uint8],
+    translation_lengths: npt.NDArray[np.int32],
+) -> List[str]:
+    row_length = translation_matrix.shape[1]
+    all_translations = (
+        np.ascontiguousarray(translation_matrix).tobytes().decode("ascii")
+    )
+    return [
+        all_translations[
+            row_index * row_length : row_index * row_length + length  # noqa: E203
+        ]
+        for row_index, length in enumerate(translation_lengths.tolist())
+    ]